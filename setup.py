@@ -31,12 +31,12 @@ setup(
     description="A matrix bot to do amazing things!",
     packages=find_packages(exclude=["tests", "tests.*"]),
     install_requires=[
-        "matrix-nio[e2e]>=0.10.0",
+        "matrix-nio[e2e]>=0.26.0",
         "Markdown>=3.1.1",
         "PyYAML>=5.1.2",
     ],
     extras_require={
-        "postgres": ["psycopg2>=2.8.5"],
+        "postgres": ["asyncpg>=0.18"],
         "dev": [
             "isort==5.0.4",
             "flake8==3.8.3",
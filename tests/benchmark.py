@@ -0,0 +1,316 @@
+"""Benchmarks the bots against a fake homeserver on localhost, to catch regressions
+in the bot itself without a real homeserver.
+
+Usage: python -m tests.benchmark [--clients N] [--messages N] [--send-window N]
+    [--encryption | --compare-encryption] [--output results.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import yaml
+from nio import RoomMessageText
+
+from traffic_bot.bot_commands import Command
+from traffic_bot.config import Config
+from traffic_bot.fleet import Fleet
+from traffic_bot.histogram import Histogram
+from traffic_bot.main import create_slaves
+from traffic_bot.matrix_client import MatrixClient
+from traffic_bot.storage import Storage
+from traffic_bot.warmup import KeyWarmup
+
+from tests.fake_homeserver import FakeHomeserverThread
+
+ROOM_ID = "!benchmark:example.com"
+SAMPLE_CONFIG = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sample.config.yaml"
+)
+
+
+def rss_bytes() -> int:
+    """The resident memory of the process"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # The peak instead of the current usage, in KiB on Linux and bytes on macOS
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return usage if sys.platform == "darwin" else usage * 1024
+
+
+def write_config(
+    directory: str,
+    homeserver_url: str,
+    clients: int,
+    send_window: int,
+    encryption: bool,
+) -> str:
+    """Write a config for the benchmark, based on the sample config.
+
+    Returns:
+        The path of the config file.
+    """
+    with open(SAMPLE_CONFIG) as file:
+        config = yaml.safe_load(file)
+
+    config["matrix"]["homeserver_url"] = homeserver_url
+    config["matrix"]["slave_index_start"] = 0
+    config["matrix"]["slave_index_end"] = clients
+    config["storage"]["database"] = "sqlite://" + os.path.join(directory, "bot.db")
+    config["storage"]["store_path"] = os.path.join(directory, "store")
+    config["storage"]["encryption_enabled"] = encryption
+    config["logging"]["level"] = "WARNING"
+    config["logging"]["file_logging"]["enabled"] = False
+    config["startup"] = {"ramp_rate": 0, "max_concurrent_logins": 0}
+    config["traffic"]["send_window"] = send_window
+    config["metrics"]["enabled"] = False
+    config["stats_interval"] = 3600
+
+    path = os.path.join(directory, "config.yaml")
+    with open(path, "w") as file:
+        yaml.safe_dump(config, file)
+
+    return path
+
+
+async def wait_for(condition, timeout: float) -> bool:
+    """Poll until the condition is true. Returns False on timeout"""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        await asyncio.sleep(0.01)
+
+    return True
+
+
+async def run_benchmark(
+    clients: int = 20,
+    messages: int = 200,
+    send_window: int = 8,
+    encryption: bool = False,
+    timeout: float = 60,
+) -> Dict[str, Any]:
+    """Start `clients` slaves in one room, let one of them send `messages` messages
+    with the echo command and measure the bots until all others received them.
+
+    With encryption, the room is encrypted and the group session of the sender is
+    shared before the measurement, so the results include the cost of encrypting
+    and decrypting the messages, but not of the key distribution.
+
+    The fake homeserver runs in its own thread, so the CPU time of the bots is
+    measured separately. Its memory is counted with the bots.
+
+    Returns:
+        The results.
+    """
+    homeserver = FakeHomeserverThread()
+    url = homeserver.start()
+
+    bots = []  # type: List[MatrixClient]
+    tasks = []  # type: List[asyncio.Future]
+    store = None
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            config = Config(
+                write_config(directory, url, clients, send_window, encryption)
+            )
+            homeserver.create_room(
+                ROOM_ID,
+                [config.for_bot(str(x)).slave_user_id for x in range(clients)],
+                encrypted=encryption,
+            )
+
+            # Startup time and memory of the clients
+            rss_before = rss_bytes()
+            started_at = time.monotonic()
+
+            store = Storage(config.database)
+            await store.connect()
+            fleet = Fleet(config, clients)
+            bots = create_slaves(config, 0, clients, fleet, store)
+            tasks = [asyncio.ensure_future(bot.start()) for bot in bots]
+            if not await wait_for(lambda: all(bot.online for bot in bots), timeout):
+                raise TimeoutError("Not all clients came online")
+
+            startup_seconds = time.monotonic() - started_at
+            memory_per_client = (rss_bytes() - rss_before) / clients
+
+            sender = bots[0]
+            warmup = KeyWarmup()
+            await warmup.warm_up(ROOM_ID, [sender.client])
+
+            # Throughput and CPU time of sending and receiving messages
+            room = sender.client.rooms[ROOM_ID]
+            event = RoomMessageText(
+                {"event_id": "$benchmark", "sender": "", "origin_server_ts": 0},
+                f"echo {messages}",
+                None,
+                None,
+            )
+            command = Command(
+                sender.client,
+                sender.store,
+                sender.config,
+                event.body,
+                room,
+                event,
+                False,
+                fleet,
+                sender.traffic,
+            )
+
+            expected_receipts = messages * (clients - 1)
+            cpu_before = time.thread_time()
+            started_at = time.monotonic()
+
+            await command.process()
+            send_seconds = time.monotonic() - started_at
+
+            delivered = await wait_for(
+                lambda: fleet.latency.total.count >= expected_receipts, timeout
+            )
+            deliver_seconds = time.monotonic() - started_at
+            cpu_seconds = time.thread_time() - cpu_before
+
+            receipts = fleet.latency.total.count
+            fleet.fanout.sweep()
+
+            # The crypto cost of sending and receiving the messages, in microseconds
+            encrypt = sender.client.encrypt_duration
+            decrypt = Histogram()
+            for bot in bots:
+                decrypt.merge(bot.client.decrypt_duration)
+
+            return {
+                "clients": clients,
+                "messages": messages,
+                "send_window": send_window,
+                "encryption": encryption,
+                "startup_seconds": startup_seconds,
+                "memory_per_client_bytes": memory_per_client,
+                "messages_sent": sender.client.messages_sent,
+                "send_seconds": send_seconds,
+                "send_throughput": messages / send_seconds,
+                "receipts": receipts,
+                "all_delivered": delivered,
+                "deliver_seconds": deliver_seconds,
+                "receipt_throughput": receipts / deliver_seconds,
+                "cpu_seconds": cpu_seconds,
+                "cpu_ms_per_message": cpu_seconds * 1000 / messages,
+                "cpu_ms_per_receipt": cpu_seconds * 1000 / max(receipts, 1),
+                "warmup_seconds": warmup.duration(),
+                "encrypt_us": encrypt.summary(),
+                "decrypt_us": decrypt.summary(),
+                "crypto_cpu_share": (encrypt.total + decrypt.total)
+                / 1e6
+                / max(cpu_seconds, 1e-9),
+                "decryption_failures": sum(
+                    bot.client.decryption_failures for bot in bots
+                ),
+                "latency_ms": fleet.latency.total.summary(),
+                "fanout_ms": {
+                    "first": fleet.fanout.first.summary(),
+                    "median": fleet.fanout.median.summary(),
+                    "last": fleet.fanout.last.summary(),
+                },
+                "homeserver_requests": homeserver.requests(),
+            }
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for bot in bots:
+            await bot.client.close()
+        if store:
+            await store.close()
+
+        homeserver.stop()
+
+
+async def compare_encryption(**kwargs) -> Dict[str, Any]:
+    """Run the benchmark in a plaintext and in an encrypted room, to see what
+    end-to-end encryption costs per message.
+
+    Returns:
+        The results of both runs, and the ratios of the encrypted to the plaintext
+        CPU time and latency.
+    """
+    plaintext = await run_benchmark(encryption=False, **kwargs)
+    encrypted = await run_benchmark(encryption=True, **kwargs)
+
+    def ratio(value: float, base: float) -> float:
+        return value / base if base else 0.0
+
+    return {
+        "plaintext": plaintext,
+        "encrypted": encrypted,
+        "encrypted_to_plaintext": {
+            "cpu_ms_per_message": ratio(
+                encrypted["cpu_ms_per_message"], plaintext["cpu_ms_per_message"]
+            ),
+            "cpu_ms_per_receipt": ratio(
+                encrypted["cpu_ms_per_receipt"], plaintext["cpu_ms_per_receipt"]
+            ),
+            "latency_p50": ratio(
+                encrypted["latency_ms"]["p50"], plaintext["latency_ms"]["p50"]
+            ),
+            "latency_p99": ratio(
+                encrypted["latency_ms"]["p99"], plaintext["latency_ms"]["p99"]
+            ),
+            "memory_per_client": ratio(
+                encrypted["memory_per_client_bytes"],
+                plaintext["memory_per_client_bytes"],
+            ),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--send-window", type=int, default=8)
+    encryption = parser.add_mutually_exclusive_group()
+    encryption.add_argument("--encryption", action="store_true")
+    encryption.add_argument(
+        "--compare-encryption",
+        action="store_true",
+        help="Run in a plaintext and an encrypted room and compare the results",
+    )
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    kwargs = {
+        "clients": args.clients,
+        "messages": args.messages,
+        "send_window": args.send_window,
+        "timeout": args.timeout,
+    }
+    if args.compare_encryption:
+        results = loop.run_until_complete(compare_encryption(**kwargs))
+    else:
+        results = loop.run_until_complete(
+            run_benchmark(encryption=args.encryption, **kwargs)
+        )
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
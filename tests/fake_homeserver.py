@@ -0,0 +1,474 @@
+import asyncio
+import bisect
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from aiohttp import web
+
+HOMESERVER_HOST = "example.com"
+
+
+class FakeRoom:
+    def __init__(self, room_id: str):
+        self.room_id = room_id
+        self.members = set()  # type: Set[str]
+        self.invited = set()  # type: Set[str]
+
+        # The events of the room and their stream positions, in stream order
+        self.positions = []  # type: List[int]
+        self.events = []  # type: List[Dict[str, Any]]
+
+
+class FakeHomeserver:
+    def __init__(self):
+        """A minimal stand-in for a Matrix homeserver, implementing just enough of
+        the client-server API for the bots to log in, sync, join rooms and send
+        messages. All state is kept in memory and any password is accepted.
+
+        Must be created in the event loop that serves it.
+        """
+        self.tokens = {}  # type: Dict[str, str]
+        self.token_devices = {}  # type: Dict[str, str]
+        self.rooms = {}  # type: Dict[str, FakeRoom]
+        self.registered = set()  # type: Set[str]
+
+        # The uploaded device keys per user and device, and the unclaimed one-time
+        # keys per user and device
+        self.device_keys = {}  # type: Dict[str, Dict[str, Any]]
+        self.one_time_keys = {}  # type: Dict[Tuple[str, str], Dict[str, Any]]
+
+        # The undelivered to-device events per user and device
+        self.to_device = {}  # type: Dict[Tuple[str, str], List[Dict[str, Any]]]
+
+        # Every n-th request to these endpoints is rate limited
+        self.rate_limits = {}  # type: Dict[str, int]
+
+        # The position of the latest event, used as the sync token
+        self.stream_position = 0
+        self._new_events = asyncio.Condition()
+        self._closed = False
+
+        # Requests per endpoint, and logins per user
+        self.requests = {}  # type: Dict[str, int]
+        self.logins = {}  # type: Dict[str, int]
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        for version in ("r0", "v3"):
+            prefix = "/_matrix/client/" + version
+            app.router.add_post(prefix + "/login", self._login)
+            app.router.add_post(prefix + "/register", self._register)
+            app.router.add_get(prefix + "/account/whoami", self._whoami)
+            app.router.add_get(prefix + "/sync", self._sync)
+            app.router.add_post(prefix + "/user/{user}/filter", self._filter)
+            app.router.add_put(prefix + "/rooms/{room}/send/{type}/{txn}", self._send)
+            app.router.add_post(prefix + "/join/{room}", self._join)
+            app.router.add_post(prefix + "/rooms/{room}/join", self._join)
+            app.router.add_post(prefix + "/rooms/{room}/invite", self._invite)
+            app.router.add_get(
+                prefix + "/rooms/{room}/joined_members", self._joined_members
+            )
+            app.router.add_post(prefix + "/keys/upload", self._keys_upload)
+            app.router.add_post(prefix + "/keys/query", self._keys_query)
+            app.router.add_post(prefix + "/keys/claim", self._keys_claim)
+            app.router.add_put(
+                prefix + "/sendToDevice/{type}/{txn}", self._send_to_device
+            )
+
+        return app
+
+    async def create_room(
+        self, room_id: str, members: Iterable[str], encrypted: bool = False
+    ) -> None:
+        """Create a room that the given users have already joined"""
+        room = self._room(room_id)
+        members = list(members)
+        if encrypted:
+            await self._emit(
+                room,
+                {
+                    "type": "m.room.encryption",
+                    "state_key": "",
+                    "sender": members[0],
+                    "content": {"algorithm": "m.megolm.v1.aes-sha2"},
+                },
+            )
+        for user_id in members:
+            await self._add_member(room, user_id)
+
+    async def close(self) -> None:
+        """Answer all pending long-polls right away"""
+        async with self._new_events:
+            self._closed = True
+            self._new_events.notify_all()
+
+    def _room(self, room_id: str) -> FakeRoom:
+        room = self.rooms.get(room_id)
+        if room is None:
+            room = self.rooms[room_id] = FakeRoom(room_id)
+
+        return room
+
+    async def _add_member(self, room: FakeRoom, user_id: str) -> None:
+        room.members.add(user_id)
+        room.invited.discard(user_id)
+        await self._emit(
+            room,
+            {
+                "type": "m.room.member",
+                "state_key": user_id,
+                "sender": user_id,
+                "content": {"membership": "join"},
+            },
+        )
+
+    async def _emit(self, room: FakeRoom, event: Dict[str, Any]) -> str:
+        event_id = "$" + uuid.uuid4().hex
+        event["event_id"] = event_id
+        event["origin_server_ts"] = int(time.time() * 1000)
+
+        async with self._new_events:
+            self.stream_position += 1
+            room.positions.append(self.stream_position)
+            room.events.append(event)
+            self._new_events.notify_all()
+
+        return event_id
+
+    def _count(self, endpoint: str) -> None:
+        self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+    @staticmethod
+    def _token(request: web.Request) -> str:
+        authorization = request.headers.get("Authorization", "")
+        return request.query.get("access_token") or authorization[len("Bearer ") :]
+
+    def _user(self, request: web.Request) -> Optional[str]:
+        return self.tokens.get(self._token(request))
+
+    def _device(self, request: web.Request) -> Tuple[str, str]:
+        token = self._token(request)
+        return self.tokens.get(token, ""), self.token_devices.get(token, "")
+
+    def _rate_limited(self, endpoint: str) -> bool:
+        limit = self.rate_limits.get(endpoint)
+        return bool(limit) and self.requests[endpoint] % limit == 0
+
+    @staticmethod
+    def _limit_exceeded() -> web.Response:
+        return web.json_response(
+            {
+                "errcode": "M_LIMIT_EXCEEDED",
+                "error": "Too many requests",
+                "retry_after_ms": 50,
+            },
+            status=429,
+        )
+
+    @staticmethod
+    def _unknown_token() -> web.Response:
+        return web.json_response(
+            {"errcode": "M_UNKNOWN_TOKEN", "error": "Unknown access token"}, status=401
+        )
+
+    def _session(self, user_id: str, device_id: Optional[str]) -> web.Response:
+        access_token = uuid.uuid4().hex
+        device_id = device_id or uuid.uuid4().hex[:10].upper()
+        self.tokens[access_token] = user_id
+        self.token_devices[access_token] = device_id
+
+        return web.json_response(
+            {"user_id": user_id, "access_token": access_token, "device_id": device_id}
+        )
+
+    async def _login(self, request: web.Request) -> web.Response:
+        self._count("login")
+        body = await request.json()
+
+        user = body.get("identifier", {}).get("user") or body.get("user", "")
+        if not user.startswith("@"):
+            user = f"@{user}:{HOMESERVER_HOST}"
+        self.logins[user] = self.logins.get(user, 0) + 1
+
+        return self._session(user, body.get("device_id"))
+
+    async def _register(self, request: web.Request) -> web.Response:
+        self._count("register")
+        body = await request.json()
+
+        if self._rate_limited("register"):
+            return self._limit_exceeded()
+
+        user_id = f"@{body['username']}:{HOMESERVER_HOST}"
+        if user_id in self.registered:
+            return web.json_response(
+                {"errcode": "M_USER_IN_USE", "error": "User ID already taken"},
+                status=400,
+            )
+
+        self.registered.add(user_id)
+        return self._session(user_id, body.get("device_id"))
+
+    async def _whoami(self, request: web.Request) -> web.Response:
+        user_id = self._user(request)
+        if not user_id:
+            return self._unknown_token()
+
+        return web.json_response({"user_id": user_id})
+
+    async def _filter(self, request: web.Request) -> web.Response:
+        self._count("filter")
+        return web.json_response({"filter_id": "1"})
+
+    async def _sync(self, request: web.Request) -> web.Response:
+        user_id = self._user(request)
+        if not user_id:
+            return self._unknown_token()
+
+        since = int(request.query.get("since", "0"))
+        self._count("sync" if since else "initial_sync")
+
+        # Long-poll until there are new events or the timeout expires
+        device = self._device(request)
+        timeout = int(request.query.get("timeout", "0")) / 1000
+        async with self._new_events:
+            # Initial syncs return right away, like on a real homeserver
+            incremental = "since" in request.query
+            if (
+                incremental
+                and since >= self.stream_position
+                and timeout
+                and not self._closed
+                and not self.to_device.get(device)
+            ):
+                try:
+                    await asyncio.wait_for(self._new_events.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+        join, invite = {}, {}
+        for room in self.rooms.values():
+            if user_id in room.members:
+                start = bisect.bisect_right(room.positions, since)
+                if start < len(room.events) or not since:
+                    join[room.room_id] = {
+                        "timeline": {"events": room.events[start:], "limited": False},
+                        "state": {"events": []},
+                    }
+            elif user_id in room.invited:
+                invite[room.room_id] = {
+                    "invite_state": {
+                        "events": [
+                            {
+                                "type": "m.room.member",
+                                "state_key": user_id,
+                                "sender": user_id,
+                                "content": {"membership": "invite"},
+                            }
+                        ]
+                    }
+                }
+
+        return web.json_response(
+            {
+                "next_batch": str(self.stream_position),
+                "rooms": {"join": join, "invite": invite, "leave": {}},
+                "to_device": {"events": self.to_device.pop(device, [])},
+            }
+        )
+
+    async def _send(self, request: web.Request) -> web.Response:
+        self._count("send")
+        user_id = self._user(request)
+        if not user_id:
+            return self._unknown_token()
+
+        room = self.rooms.get(request.match_info["room"])
+        if room is None or user_id not in room.members:
+            return web.json_response(
+                {"errcode": "M_FORBIDDEN", "error": "Not a member"}, status=403
+            )
+
+        event = {
+            "type": request.match_info["type"],
+            "sender": user_id,
+            "content": await request.json(),
+        }
+        event_id = await self._emit(room, event)
+
+        return web.json_response({"event_id": event_id})
+
+    async def _join(self, request: web.Request) -> web.Response:
+        self._count("join")
+        user_id = self._user(request)
+        if not user_id:
+            return self._unknown_token()
+
+        room = self._room(request.match_info["room"])
+        await self._add_member(room, user_id)
+
+        return web.json_response({"room_id": room.room_id})
+
+    async def _invite(self, request: web.Request) -> web.Response:
+        self._count("invite")
+        if self._rate_limited("invite"):
+            return self._limit_exceeded()
+
+        body = await request.json()
+        room = self._room(request.match_info["room"])
+        if body["user_id"] in room.members:
+            return web.json_response(
+                {"errcode": "M_FORBIDDEN", "error": "User is already in the room"},
+                status=403,
+            )
+
+        room.invited.add(body["user_id"])
+
+        # Wake up the syncs, so the invited user sees the invite
+        async with self._new_events:
+            self.stream_position += 1
+            self._new_events.notify_all()
+
+        return web.json_response({})
+
+    async def _joined_members(self, request: web.Request) -> web.Response:
+        room = self._room(request.match_info["room"])
+        return web.json_response(
+            {"joined": {user_id: {} for user_id in sorted(room.members)}}
+        )
+
+    async def _keys_upload(self, request: web.Request) -> web.Response:
+        self._count("keys_upload")
+        user_id = self._user(request)
+        body = await request.json()
+
+        device_keys = body.get("device_keys")
+        if device_keys:
+            devices = self.device_keys.setdefault(user_id, {})
+            devices[device_keys["device_id"]] = device_keys
+            self.one_time_keys[(user_id, device_keys["device_id"])] = body.get(
+                "one_time_keys", {}
+            )
+
+        return web.json_response({"one_time_key_counts": {"signed_curve25519": 50}})
+
+    async def _keys_query(self, request: web.Request) -> web.Response:
+        self._count("keys_query")
+        body = await request.json()
+
+        device_keys = {
+            user_id: self.device_keys.get(user_id, {})
+            for user_id in body.get("device_keys", {})
+        }
+        return web.json_response({"device_keys": device_keys, "failures": {}})
+
+    async def _keys_claim(self, request: web.Request) -> web.Response:
+        self._count("keys_claim")
+        body = await request.json()
+
+        # Hand out one unclaimed key of each requested device
+        claimed = {}  # type: Dict[str, Dict[str, Any]]
+        for user_id, devices in body.get("one_time_keys", {}).items():
+            for device_id in devices:
+                keys = self.one_time_keys.get((user_id, device_id))
+                if keys:
+                    key_id = next(iter(keys))
+                    claimed.setdefault(user_id, {})[device_id] = {
+                        key_id: keys.pop(key_id)
+                    }
+
+        return web.json_response({"one_time_keys": claimed, "failures": {}})
+
+    async def _send_to_device(self, request: web.Request) -> web.Response:
+        self._count("send_to_device")
+        sender = self._user(request)
+        body = await request.json()
+
+        for user_id, devices in body.get("messages", {}).items():
+            for device_id, content in devices.items():
+                if device_id == "*":
+                    device_ids = list(self.device_keys.get(user_id, {}))
+                else:
+                    device_ids = [device_id]
+                for device_id in device_ids:
+                    event = {
+                        "type": request.match_info["type"],
+                        "sender": sender,
+                        "content": content,
+                    }
+                    self.to_device.setdefault((user_id, device_id), []).append(event)
+
+        # Wake up the syncs, so the receivers get the events
+        async with self._new_events:
+            self.stream_position += 1
+            self._new_events.notify_all()
+
+        return web.json_response({})
+
+
+class FakeHomeserverThread:
+    def __init__(self):
+        """Runs a FakeHomeserver on localhost in its own thread and event loop, so
+        that the CPU time of the bots can be measured separately from it.
+        """
+        self.loop = asyncio.new_event_loop()
+        self.homeserver = None  # type: Optional[FakeHomeserver]
+        self.url = None  # type: Optional[str]
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._ready = threading.Event()
+        self._runner = None  # type: Optional[web.AppRunner]
+
+    def start(self) -> str:
+        """Start the homeserver on a free port.
+
+        Returns:
+            The URL of the homeserver.
+        """
+        self._thread.start()
+        self._ready.wait()
+
+        return self.url
+
+    def stop(self) -> None:
+        self.call(self._shutdown())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+    def call(self, coroutine) -> Any:
+        """Run a coroutine in the event loop of the homeserver and return its result"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def create_room(
+        self, room_id: str, members: Iterable[str], encrypted: bool = False
+    ) -> None:
+        self.call(self.homeserver.create_room(room_id, members, encrypted))
+
+    def requests(self) -> Dict[str, int]:
+        return dict(self.homeserver.requests)
+
+    def logins(self) -> Dict[str, int]:
+        return dict(self.homeserver.logins)
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self._serve())
+        self._ready.set()
+        self.loop.run_forever()
+
+    async def _shutdown(self) -> None:
+        await self.homeserver.close()
+        await self._runner.cleanup()
+
+    async def _serve(self) -> None:
+        self.homeserver = FakeHomeserver()
+        self._runner = web.AppRunner(self.homeserver.app())
+        await self._runner.setup()
+
+        await web.TCPSite(self._runner, "127.0.0.1", 0).start()
+
+        host, port = self._runner.addresses[0][:2]
+        self.url = f"http://{host}:{port}"
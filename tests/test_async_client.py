@@ -0,0 +1,76 @@
+import asyncio
+import tempfile
+import unittest
+
+from nio import AsyncClientConfig, RoomMessageText
+
+from traffic_bot.async_client import TrafficAsyncClient
+
+from tests.fake_homeserver import FakeHomeserverThread
+
+ROOM_ID = "!crypto:example.com"
+
+
+class TrafficAsyncClientTestCase(unittest.TestCase):
+    def setUp(self):
+        self.homeserver = FakeHomeserverThread()
+        self.url = self.homeserver.start()
+        self.loop = asyncio.new_event_loop()
+        self.store_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.loop.close()
+        self.homeserver.stop()
+        self.store_dir.cleanup()
+
+    def test_crypto_timing(self):
+        """Test that encrypting sent and decrypting received messages is timed"""
+        user_ids = ["@sender:example.com", "@receiver:example.com"]
+        self.homeserver.create_room(ROOM_ID, user_ids, encrypted=True)
+
+        async def send_and_receive():
+            sender, receiver = [
+                TrafficAsyncClient(
+                    self.url,
+                    user_id,
+                    store_path=self.store_dir.name,
+                    config=AsyncClientConfig(
+                        encryption_enabled=True, store_sync_tokens=False
+                    ),
+                )
+                for user_id in user_ids
+            ]
+            try:
+                for client in (sender, receiver):
+                    await client.login("password")
+                    await client.keys_upload()
+                    await client.sync(full_state=True)
+
+                await sender.room_send(
+                    ROOM_ID,
+                    "m.room.message",
+                    {"msgtype": "m.text", "body": "hello"},
+                    ignore_unverified_devices=True,
+                )
+                response = await receiver.sync(since=receiver.next_batch)
+                return sender, receiver, response.rooms.join[ROOM_ID].timeline.events
+            finally:
+                await sender.close()
+                await receiver.close()
+
+        sender, receiver, events = self.loop.run_until_complete(send_and_receive())
+
+        self.assertIsInstance(events[-1], RoomMessageText)
+        self.assertEqual(events[-1].body, "hello")
+        self.assertEqual(sender.encrypt_duration.count, 1)
+        self.assertEqual(receiver.decrypt_duration.count, 1)
+        self.assertEqual(receiver.olm_duration.count, 1)
+
+        stats = receiver.crypto_stats()
+        self.assertEqual(stats["events_decrypted"], 1)
+        self.assertEqual(stats["decryption_failures"], 0)
+        self.assertGreater(stats["decrypt_seconds"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
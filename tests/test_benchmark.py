@@ -0,0 +1,26 @@
+import asyncio
+import unittest
+
+from tests.benchmark import run_benchmark
+
+
+class BenchmarkTestCase(unittest.TestCase):
+    def test_benchmark(self):
+        """Test that a small benchmark delivers every message to every receiver"""
+        loop = asyncio.new_event_loop()
+        try:
+            results = loop.run_until_complete(
+                run_benchmark(clients=3, messages=10, timeout=20)
+            )
+        finally:
+            loop.close()
+
+        self.assertTrue(results["all_delivered"])
+        self.assertEqual(results["messages_sent"], 10)
+        self.assertEqual(results["receipts"], 20)
+        self.assertEqual(results["fanout_ms"]["last"]["count"], 10)
+        self.assertGreater(results["send_throughput"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -21,7 +21,7 @@ class CallbacksTestCase(unittest.TestCase):
         self.fake_config = Mock()
 
         self.callbacks = Callbacks(
-            self.fake_client, self.fake_storage, self.fake_config
+            self.fake_client, self.fake_storage, self.fake_config, False
         )
 
     def test_invite(self):
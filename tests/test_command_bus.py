@@ -0,0 +1,135 @@
+import asyncio
+import unittest
+from unittest.mock import Mock
+
+import nio
+
+from traffic_bot.callbacks import Callbacks
+from traffic_bot.command_bus import CommandBus
+from traffic_bot.storage import Storage
+
+ROOM_ID = "!commands:example.com"
+OTHER_ROOM_ID = "!other:example.com"
+
+
+def make_event(event_id: str, body: str) -> nio.RoomMessageText:
+    return nio.RoomMessageText.from_dict(
+        {
+            "event_id": event_id,
+            "sender": "@user:example.com",
+            "origin_server_ts": 0,
+            "type": "m.room.message",
+            "content": {"msgtype": "m.text", "body": body},
+        }
+    )
+
+
+class CommandBusTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.loop = asyncio.new_event_loop()
+        self.bus = CommandBus()
+        self.fake_fleet = Mock()
+        self.fake_fleet.commands = self.bus
+
+        # The commands each slave ran, by bot id
+        self.commands = {}
+
+        self.master = self.make_callbacks("@master:example.com", True)
+        self.bus.attach_master(self.master.client)
+
+        self.slaves = []
+        for bot_id in ("0", "1"):
+            slave = self.make_callbacks(f"@test_{bot_id}:example.com", False, bot_id)
+            self.bus.register_slave(bot_id, slave)
+            self.slaves.append(slave)
+
+    def tearDown(self) -> None:
+        self.loop.close()
+
+    def make_callbacks(self, user_id, master, bot_id=None) -> Callbacks:
+        fake_client = Mock(spec=nio.AsyncClient)
+        fake_client.user = user_id
+        fake_client.rooms = {}
+
+        # We don't spec config, as it doesn't currently have well defined attributes
+        fake_config = Mock()
+        fake_config.master_command_prefix = "!c "
+        fake_config.slave_command_prefix = "!s "
+        fake_config.botId = bot_id
+
+        callbacks = Callbacks(
+            fake_client, Mock(spec=Storage), fake_config, master, self.fake_fleet
+        )
+        if not master:
+            self.commands[bot_id] = []
+
+            async def run_command(msg, room, event, master_only):
+                self.commands[bot_id].append(msg)
+
+            callbacks.run_command = run_command
+
+        return callbacks
+
+    def join(self, callbacks: Callbacks, room_id: str) -> None:
+        callbacks.client.rooms[room_id] = nio.MatrixRoom(room_id, callbacks.client.user)
+
+    def receive(self, callbacks: Callbacks, room_id: str, event) -> None:
+        async def receive():
+            await callbacks.message(callbacks.client.rooms[room_id], event)
+            # Let the commands delivered in the background run
+            await asyncio.sleep(0)
+
+        self.loop.run_until_complete(receive())
+
+    def test_delivery(self):
+        """Test that the master delivers slave commands to the targeted slaves,
+        which ignore them in the room
+        """
+        for callbacks in [self.master] + self.slaves:
+            self.join(callbacks, ROOM_ID)
+
+        event = make_event("$all", "!s echo 1")
+        self.receive(self.slaves[0], ROOM_ID, event)
+        self.receive(self.master, ROOM_ID, event)
+        self.receive(self.slaves[1], ROOM_ID, event)
+
+        targeted = make_event("$targeted", "!s {1} echo 2")
+        self.receive(self.master, ROOM_ID, targeted)
+
+        self.assertEqual(self.commands, {"0": ["echo 1"], "1": ["echo 1", "echo 2"]})
+        self.assertEqual(self.bus.deliveries, 3)
+
+    def test_room_without_master(self):
+        """Test that slaves run commands themselves in rooms the master isn't in"""
+        self.join(self.master, ROOM_ID)
+        for slave in self.slaves:
+            self.join(slave, OTHER_ROOM_ID)
+
+        event = make_event("$other", "!s echo 1")
+        for slave in self.slaves:
+            self.receive(slave, OTHER_ROOM_ID, event)
+
+        self.assertEqual(self.commands, {"0": ["echo 1"], "1": ["echo 1"]})
+        self.assertEqual(self.bus.dispatched, 0)
+
+    def test_master_not_synced(self):
+        """Test that a slave runs a command itself before the master has synced the
+        room, and that the master doesn't deliver it to that slave again
+        """
+        for slave in self.slaves:
+            self.join(slave, ROOM_ID)
+
+        event = make_event("$early", "!s echo 1")
+        self.receive(self.slaves[0], ROOM_ID, event)
+
+        # The master syncs the room and the command, before the other slave does
+        self.join(self.master, ROOM_ID)
+        self.receive(self.master, ROOM_ID, event)
+        self.receive(self.slaves[1], ROOM_ID, event)
+
+        self.assertEqual(self.commands, {"0": ["echo 1"], "1": ["echo 1"]})
+        self.assertEqual(self.bus.deliveries, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,3 +1,5 @@
+import os
+import tempfile
 import unittest
 from unittest.mock import Mock
 
@@ -74,6 +76,46 @@ class ConfigTestCase(unittest.TestCase):
             "something",
         )
 
+    def test_for_bot(self):
+        """Test that Config.for_bot derives per-bot options without re-reading the file"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            config_path = os.path.join(tmp_dir, "config.yaml")
+            with open(config_path, "w") as f:
+                f.write(
+                    "matrix:\n"
+                    "  master_user_id: '@admin_bot'\n"
+                    "  master_password: password\n"
+                    "  slave_base_user_id: '@test_'\n"
+                    "  homeserver_host: example.com\n"
+                    "  homeserver_url: https://example.com\n"
+                    "  device_id: ABCDEFGHIJ\n"
+                    "  slave_index_start: 0\n"
+                    "  slave_index_end: 10\n"
+                    "storage:\n"
+                    "  database: sqlite://bot.db\n"
+                    f"  store_path: {os.path.join(tmp_dir, 'store')}\n"
+                    "logging:\n"
+                    "  file_logging:\n"
+                    "    enabled: false\n"
+                    "  console_logging:\n"
+                    "    enabled: false\n"
+                )
+
+            config = Config(config_path)
+
+            # Remove the config file to make sure it isn't read again
+            os.remove(config_path)
+            bot_config = config.for_bot("3")
+
+        self.assertEqual(bot_config.botId, "3")
+        self.assertEqual(bot_config.slave_user_id, "@test_3:example.com")
+        # All bots share the database
+        self.assertEqual(bot_config.database["connection_string"], "bot.db")
+
+        # The base config is left untouched
+        self.assertEqual(config.slave_user_id, "@test_:example.com")
+        self.assertEqual(config.database["connection_string"], "bot.db")
+
     # TODO: Test creating a test yaml file, passing the path to Config and _parse_config_values is called correctly
 
 
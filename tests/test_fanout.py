@@ -0,0 +1,53 @@
+import time
+import unittest
+from unittest.mock import Mock
+
+import nio
+
+from traffic_bot.fanout import FanoutTracker
+
+SENDER = "@test_0:example.com"
+
+
+class FanoutTrackerTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        # The sender is in both rooms, with two receivers in each
+        self.clients = []
+        for user, rooms in (
+            (SENDER, ["!a:example.com", "!b:example.com"]),
+            ("@test_1:example.com", ["!a:example.com"]),
+            ("@test_2:example.com", ["!b:example.com"]),
+            ("@test_3:example.com", ["!a:example.com", "!b:example.com"]),
+        ):
+            fake_client = Mock(spec=nio.AsyncClient)
+            fake_client.user = user
+            fake_client.rooms = {
+                room_id: Mock(spec=nio.MatrixRoom) for room_id in rooms
+            }
+            self.clients.append(fake_client)
+
+        self.tracker = FanoutTracker(self.clients)
+
+    def test_one_sender_in_two_rooms(self):
+        """Test that messages of one sender with the same sequence number in two
+        rooms are tracked separately
+        """
+        sent_ts = int(time.time() * 1000)
+        self.tracker.record("!a:example.com", SENDER, 0, sent_ts, 10)
+        self.tracker.record("!b:example.com", SENDER, 0, sent_ts, 30)
+
+        self.assertEqual(self.tracker.messages, 0)
+        self.assertEqual(len(self.tracker.pending), 2)
+
+        self.tracker.record("!a:example.com", SENDER, 0, sent_ts, 20)
+        self.tracker.record("!b:example.com", SENDER, 0, sent_ts, 40)
+
+        self.assertEqual(self.tracker.messages, 2)
+        self.assertEqual(self.tracker.pending, {})
+        self.assertEqual(self.tracker.first.summary()["max"], 30)
+        self.assertEqual(self.tracker.last.summary()["max"], 40)
+        self.assertEqual(self.tracker.incomplete, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+
+from traffic_bot.histogram import Histogram
+
+
+class HistogramTestCase(unittest.TestCase):
+    def test_percentiles(self):
+        """Test that percentiles are exact for small values and within the bucket
+        precision for large ones"""
+        histogram = Histogram()
+        for value in range(1, 101):
+            histogram.record(value)
+
+        summary = histogram.summary()
+        self.assertEqual(summary["count"], 100)
+        self.assertEqual(summary["max"], 100)
+        self.assertAlmostEqual(summary["mean"], 50.5)
+        self.assertEqual(histogram.percentile(10), 10)
+
+        # Buckets above 64 are 4 wide
+        self.assertTrue(90 <= summary["p90"] < 94)
+        self.assertTrue(99 <= summary["p99"] <= 100)
+
+    def test_large_and_negative_values(self):
+        """Test that values outside the bucket range are clamped"""
+        histogram = Histogram(max_value=1000)
+        histogram.record(-5)
+        histogram.record(50000)
+
+        self.assertEqual(histogram.percentile(50), 0)
+        self.assertEqual(histogram.percentile(100), 50000)
+        self.assertEqual(histogram.max, 50000)
+
+    def test_merge(self):
+        """Test that merged histograms count the values of both"""
+        first = Histogram()
+        second = Histogram()
+        first.record(5)
+        second.record(500)
+        second.record(7)
+
+        first.merge(second)
+
+        self.assertEqual(first.count, 3)
+        self.assertEqual(first.max, 500)
+        self.assertEqual(first.percentile(50), 7)
+
+
+if __name__ == "__main__":
+    unittest.main()
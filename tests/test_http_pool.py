@@ -0,0 +1,60 @@
+import asyncio
+import unittest
+
+from traffic_bot.async_client import TrafficAsyncClient
+from traffic_bot.http_pool import SharedHttpPool
+
+from tests.fake_homeserver import FakeHomeserverThread
+
+
+class SharedHttpPoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.homeserver = FakeHomeserverThread()
+        self.url = self.homeserver.start()
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        self.homeserver.stop()
+
+    def test_shared_session(self):
+        """Test that clients share one session, which outlives a closed client"""
+        pool = SharedHttpPool()
+
+        async def run():
+            first, second = [
+                TrafficAsyncClient(self.url, f"@test_{x}:example.com", http_pool=pool)
+                for x in range(2)
+            ]
+            try:
+                for client in (first, second):
+                    await client.login("password")
+                    await client.sync(full_state=True)
+
+                sessions = (first.client_session, second.client_session)
+                stats = pool.stats()
+
+                # Closing a client leaves the session open for the other one
+                await first.close()
+                closed_after_first = sessions[0].closed
+                await second.sync(since=second.next_batch)
+                return sessions, stats, closed_after_first
+            finally:
+                await second.close()
+                await pool.close()
+
+        sessions, stats, closed_after_first = self.loop.run_until_complete(run())
+
+        self.assertIs(sessions[0], sessions[1])
+        self.assertFalse(closed_after_first)
+        self.assertTrue(sessions[0].closed)
+
+        # Logins and syncs of both clients, mostly over one kept-alive connection
+        self.assertEqual(stats["requests"], 4)
+        self.assertEqual(stats["connections_created"], 1)
+        self.assertEqual(stats["connections_reused"], 3)
+        self.assertEqual(pool.stats()["requests"], 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import asyncio
+import unittest
+
+from nio import AsyncClient, AsyncClientConfig
+
+from traffic_bot.invites import InviteFanout
+
+from tests.fake_homeserver import FakeHomeserverThread
+
+ROOM_ID = "!invites:example.com"
+
+
+class InviteFanoutTestCase(unittest.TestCase):
+    def setUp(self):
+        self.homeserver = FakeHomeserverThread()
+        self.url = self.homeserver.start()
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        self.homeserver.stop()
+
+    def test_invite(self):
+        """Test that rate limited invites are retried and other errors reported"""
+        self.homeserver.homeserver.rate_limits["invite"] = 4
+        self.homeserver.create_room(
+            ROOM_ID, ["@master:example.com", "@member:example.com"]
+        )
+        user_ids = ["@member:example.com"] + [
+            "@user_%d:example.com" % x for x in range(20)
+        ]
+
+        async def invite():
+            client = AsyncClient(
+                self.url,
+                "@master:example.com",
+                config=AsyncClientConfig(max_limit_exceeded=0, max_timeouts=0),
+            )
+            try:
+                await client.login("password")
+                fanout = InviteFanout(client, concurrency=5)
+                return fanout, await fanout.invite(ROOM_ID, user_ids)
+            finally:
+                await client.close()
+
+        fanout, invited = self.loop.run_until_complete(invite())
+
+        self.assertEqual(invited, user_ids[1:])
+        self.assertEqual(fanout.succeeded, 20)
+        self.assertEqual(fanout.errors, {"M_FORBIDDEN": 1})
+        self.assertGreater(fanout.rate_limited, 0)
+        self.assertEqual(fanout.retries, fanout.rate_limited)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import asyncio
+import tempfile
+import unittest
+from unittest import mock
+
+from traffic_bot.config import Config
+from traffic_bot.matrix_client import MatrixClient
+from traffic_bot.storage import Storage
+
+from tests.benchmark import write_config
+from tests.fake_homeserver import FakeHomeserverThread
+
+
+class MatrixClientTestCase(unittest.TestCase):
+    def setUp(self):
+        self.homeserver = FakeHomeserverThread()
+        self.url = self.homeserver.start()
+        self.directory = tempfile.TemporaryDirectory()
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+        self.directory.cleanup()
+        self.homeserver.stop()
+
+    def config(self, encryption: bool = False) -> Config:
+        path = write_config(self.directory.name, self.url, 1, 1, encryption)
+        return Config(path).for_bot("0")
+
+    def test_rejected_session(self):
+        """Test that a stored session whose access token is rejected is replaced by
+        a password login
+        """
+        config = self.config()
+
+        async def connect():
+            store = Storage(config.database)
+            await store.connect()
+            try:
+                await store.store_session(config.slave_user_id, "OLDDEVICE", "bad")
+                client = MatrixClient(store, config, master=False)
+                try:
+                    connected = await client._connect()
+                finally:
+                    await client.client.close()
+                return client, connected, await store.get_session(client.user_id)
+            finally:
+                await store.close()
+
+        client, connected, session = self.loop.run_until_complete(connect())
+
+        self.assertTrue(connected)
+        self.assertEqual(client.restored_logins, 1)
+        self.assertEqual(client.logins, 1)
+        self.assertEqual(self.homeserver.logins(), {config.slave_user_id: 1})
+        self.assertTrue(client.client.logged_in)
+        self.assertEqual(session, (client.client.device_id, client.client.access_token))
+        self.assertNotEqual(session[1], "bad")
+
+    def test_resume_sync(self):
+        """Test that a bot resumes syncing from its persisted sync token on its
+        next start, instead of doing another full sync
+        """
+        config = self.config(encryption=True)
+        # A room with an event, so the sync token isn't the start of the stream
+        self.homeserver.create_room("!resume:example.com", [config.slave_user_id])
+
+        async def start():
+            client = MatrixClient(store, config, master=False)
+            try:
+                with mock.patch.object(
+                    client.client, "sync", wraps=client.client.sync
+                ) as sync:
+                    await client._connect()
+            finally:
+                await client.client.close()
+            return client, sync.call_args[1]["full_state"]
+
+        async def restart():
+            await store.connect()
+            try:
+                return [await start() for _ in range(2)]
+            finally:
+                await store.close()
+
+        store = Storage(config.database)
+        starts = self.loop.run_until_complete(restart())
+        first, first_full_state = starts[0]
+        second, second_full_state = starts[1]
+
+        self.assertTrue(first_full_state)
+        self.assertEqual(first.stats()["full_syncs"], 1)
+        self.assertEqual(first.stats()["incremental_syncs"], 0)
+
+        self.assertEqual(second.restored_logins, 1)
+        self.assertFalse(second_full_state)
+        self.assertEqual(second.stats()["full_syncs"], 0)
+        self.assertEqual(second.stats()["incremental_syncs"], 1)
+        self.assertEqual(self.homeserver.requests()["initial_sync"], 1)
+        self.assertEqual(self.homeserver.requests()["sync"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import asyncio
+import re
+import tempfile
+import unittest
+from typing import Dict, List, Tuple
+
+from traffic_bot.config import Config
+from traffic_bot.fleet import Fleet
+from traffic_bot.histogram import Histogram
+from traffic_bot.metrics import MetricsExporter, MetricsWriter, _labels
+
+from tests.benchmark import write_config
+
+SAMPLE = re.compile(r"^(\w+?)_(bucket|sum|count)(\{.*\})? (\S+)$")
+LE = re.compile(r'le="([^"]*)",?')
+
+
+def parse_histograms(text: str, name: str) -> Dict[str, Dict[str, List]]:
+    """Parse the series of a histogram metric, by their labels other than `le`.
+
+    Returns:
+        The buckets as (le, count) pairs in order, and the sum and count of each
+        series.
+    """
+    series = {}  # type: Dict[str, Dict[str, List]]
+    for line in text.splitlines():
+        match = SAMPLE.match(line)
+        if not match or match.group(1) != name:
+            continue
+
+        suffix, labels, value = match.group(2, 3, 4)
+        labels = labels or ""
+        le = LE.search(labels)
+        labels = LE.sub("", labels)
+        buckets = series.setdefault(labels, {"bucket": [], "sum": [], "count": []})
+
+        entry = (le.group(1), float(value)) if le else float(value)
+        buckets[suffix].append(entry)
+
+    return series
+
+
+class MetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+        self.directory.cleanup()
+
+    def assertBuckets(self, buckets: List[Tuple[str, float]], count: int) -> None:
+        """Assert that the bucket counts never decrease and end with the +Inf
+        bucket holding all samples
+        """
+        counts = [bucket_count for _, bucket_count in buckets]
+        self.assertEqual(counts, sorted(counts), "Bucket counts decrease")
+        self.assertEqual(buckets[-1], ("+Inf", count))
+
+    def test_histogram(self):
+        """Test that histograms are rendered with cumulative buckets, and that the
+        sum is scaled to seconds
+        """
+        histogram = Histogram()
+        for value in (1, 3, 3, 40, 700, 50000):
+            histogram.record(value)
+
+        writer = MetricsWriter()
+        writer.histogram("latency_seconds", histogram, bot="@bot:example.com")
+        series = parse_histograms(writer.render(), "latency_seconds")
+
+        self.assertEqual(list(series), ['{bot="@bot:example.com"}'])
+        buckets = series['{bot="@bot:example.com"}']["bucket"]
+        self.assertEqual(buckets[0], ("0.001", 1))
+        self.assertIn(("0.05", 4), buckets)
+        self.assertIn(("30", 5), buckets)
+        self.assertBuckets(buckets, 6)
+        self.assertEqual(series['{bot="@bot:example.com"}']["count"], [6])
+        self.assertAlmostEqual(
+            series['{bot="@bot:example.com"}']["sum"][0], 50.747, places=6
+        )
+
+    def test_labels(self):
+        """Test that label values are escaped"""
+        self.assertEqual(_labels({}), "")
+        self.assertEqual(
+            _labels({"room": '!a"b\\c\nd:example.com', "bot": "x"}),
+            '{room="!a\\"b\\\\c\\nd:example.com",bot="x"}',
+        )
+
+    def test_render(self):
+        """Test that the latency histograms of a fleet are exported per room, with
+        the +Inf bucket matching the count and the sum in seconds
+        """
+        config = Config(
+            write_config(self.directory.name, "http://localhost", 1, 1, False)
+        )
+        fleet = Fleet(config, 0)
+        latencies = {"!one:example.com": [5, 20, 20], '!"two":example.com': [3000]}
+        for room_id, values in latencies.items():
+            for value in values:
+                fleet.latency.record(room_id, "@sender:example.com", value)
+
+        text = MetricsExporter(fleet, []).render()
+        series = parse_histograms(text, "traffic_bot_delivery_latency_seconds")
+
+        expected = {
+            '{room="all"}': (3045, 4),
+            '{room="!one:example.com"}': (45, 3),
+            '{room="!\\"two\\":example.com"}': (3000, 1),
+        }  # type: Dict[str, Tuple[int, int]]
+        self.assertEqual(set(series), set(expected))
+        for labels, (total, count) in expected.items():
+            self.assertBuckets(series[labels]["bucket"], count)
+            self.assertEqual(series[labels]["count"], [count])
+            self.assertAlmostEqual(series[labels]["sum"][0], total / 1000)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+
+from traffic_bot.latency import SENT_TS_KEY, SEQ_KEY
+from traffic_bot.payloads import PayloadPool
+
+
+class PayloadPoolTestCase(unittest.TestCase):
+    def test_sizes(self):
+        """Test that the body sizes follow the configured distribution"""
+        fixed = PayloadPool("fixed", size=100, pool_size=10)
+        self.assertEqual(set(fixed.sizes), {100})
+
+        uniform = PayloadPool("uniform", min_size=10, max_size=50, seed=1)
+        self.assertGreaterEqual(min(uniform.sizes), 10)
+        self.assertLessEqual(max(uniform.sizes), 50)
+        self.assertGreater(len(set(uniform.sizes)), 10)
+
+        lognormal = PayloadPool(
+            "lognormal", size=200, min_size=16, max_size=4096, pool_size=400, seed=1
+        )
+        sizes = sorted(lognormal.sizes)
+        self.assertGreaterEqual(sizes[0], 16)
+        self.assertLessEqual(sizes[-1], 4096)
+        # The median is around the configured size, with a long tail
+        self.assertLess(abs(sizes[200] - 200), 40)
+        self.assertGreater(sizes[396], 1000)
+
+        self.assertEqual(
+            PayloadPool("uniform", seed=1, pool_size=20).sizes,
+            PayloadPool("uniform", seed=1, pool_size=20).sizes,
+        )
+        with self.assertRaises(ValueError):
+            PayloadPool("normal")
+
+    def test_content(self):
+        """Test that pooled contents are pre-rendered and stamped when sent"""
+        pool = PayloadPool(pool_size=2)
+        first = pool.content(0)
+        third = pool.content(2)
+
+        self.assertEqual(first[SEQ_KEY], 0)
+        self.assertEqual(third[SEQ_KEY], 2)
+        self.assertIsInstance(first[SENT_TS_KEY], int)
+        self.assertEqual(first["body"], third["body"])
+        self.assertTrue(first["formatted_body"].startswith("<p>"))
+        self.assertEqual(pool.body_size(2), len(third["body"]))
+
+        # The pool itself isn't stamped
+        self.assertNotIn(SEQ_KEY, pool.contents[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
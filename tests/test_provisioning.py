@@ -0,0 +1,86 @@
+import asyncio
+import tempfile
+import unittest
+
+from traffic_bot.config import Config
+from traffic_bot.provisioning import EXISTS, REGISTERED, Provisioner
+from traffic_bot.storage import Storage
+
+from tests.benchmark import write_config
+from tests.fake_homeserver import FakeHomeserverThread
+
+
+class ProvisionerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.homeserver = FakeHomeserverThread()
+        self.url = self.homeserver.start()
+        self.directory = tempfile.TemporaryDirectory()
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+        self.directory.cleanup()
+        self.homeserver.stop()
+
+    def provision(self, localparts, encryption=False, **kwargs):
+        config = Config(write_config(self.directory.name, self.url, 1, 1, encryption))
+
+        async def provision():
+            provisioner = Provisioner(config, Storage(config.database), **kwargs)
+            return provisioner, await provisioner.provision(localparts, "password")
+
+        return self.loop.run_until_complete(provision())
+
+    def test_rate_limited(self):
+        """Test that rate limited registrations are retried and existing users are
+        skipped
+        """
+        self.homeserver.homeserver.rate_limits["register"] = 3
+        localparts = ["user_%d" % x for x in range(20)]
+
+        provisioner, results = self.provision(localparts[:1], skip_crypto=True)
+        self.assertEqual(results[0].status, REGISTERED)
+
+        provisioner, results = self.provision(
+            localparts, concurrency=4, skip_crypto=True
+        )
+        self.assertEqual(
+            [result.status for result in results[:2]], [EXISTS, REGISTERED]
+        )
+        self.assertEqual(provisioner.registered, 19)
+        self.assertEqual(provisioner.existing, 1)
+        self.assertEqual(provisioner.failed, 0)
+        self.assertGreater(provisioner.rate_limited, 0)
+        self.assertTrue(all(result.access_token for result in results[1:]))
+
+    def test_store_sessions(self):
+        """Test that sessions are stored and users with a session are skipped"""
+        config = Config(write_config(self.directory.name, self.url, 1, 1, False))
+
+        async def provision():
+            store = Storage(config.database)
+            await store.connect()
+            try:
+                for _ in range(2):
+                    provisioner = Provisioner(config, store, store_sessions=True)
+                    await provisioner.provision(["stored_0"], "password")
+                return provisioner, await store.get_session("@stored_0:example.com")
+            finally:
+                await store.close()
+
+        provisioner, session = self.loop.run_until_complete(provision())
+        self.assertEqual(provisioner.existing, 1)
+        self.assertIsNotNone(session)
+        self.assertEqual(self.homeserver.requests()["register"], 1)
+
+    def test_crypto(self):
+        """Test that users are set up with encryption keys unless crypto is skipped"""
+        provisioner, results = self.provision(["crypto_0", "crypto_1"], True)
+
+        self.assertEqual([result.status for result in results], [REGISTERED] * 2)
+        self.assertEqual(self.homeserver.requests()["keys_upload"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import asyncio
+import time
+import unittest
+
+from traffic_bot.ramp import RampScheduler
+
+
+class RampSchedulerTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self) -> None:
+        self.loop.close()
+
+    def start_clients(self, ramp: RampScheduler, clients: int, hold: float):
+        """Let clients log in through the ramp, each taking `hold` seconds.
+
+        Returns:
+            The admission times of the clients and the largest number of clients
+            that were admitted at the same time.
+        """
+        admitted_at = []
+        active = []
+        peak = []
+
+        async def start_client():
+            async with ramp:
+                admitted_at.append(time.monotonic())
+                active.append(1)
+                peak.append(len(active))
+                await asyncio.sleep(hold)
+                active.pop()
+            ramp.client_online()
+
+        async def run():
+            await asyncio.gather(*(start_client() for _ in range(clients)))
+
+        self.loop.run_until_complete(run())
+        return admitted_at, max(peak)
+
+    def test_rate(self):
+        """Test that clients are admitted at the configured rate"""
+        ramp = RampScheduler(rate=20, max_concurrent=0, expected_clients=5)
+        admitted_at, peak = self.start_clients(ramp, 5, 0)
+
+        gaps = [b - a for a, b in zip(admitted_at, admitted_at[1:])]
+        self.assertGreaterEqual(min(gaps), 0.04)
+        self.assertLess(admitted_at[-1] - admitted_at[0], 0.3)
+
+        stats = ramp.stats()
+        self.assertEqual(stats["clients_admitted"], 5)
+        self.assertEqual(stats["clients_online"], 5)
+        self.assertGreaterEqual(stats["startup_seconds"], 0.2)
+        # The clients waited 0, 50, 100, 150 and 200ms for their slots
+        self.assertGreaterEqual(stats["admission_wait_seconds"], 0.45)
+
+    def test_concurrency(self):
+        """Test that no more than max_concurrent clients are admitted at once"""
+        ramp = RampScheduler(rate=0, max_concurrent=2, expected_clients=6)
+        admitted_at, peak = self.start_clients(ramp, 6, 0.05)
+
+        self.assertEqual(peak, 2)
+        # Three rounds of two clients
+        self.assertGreaterEqual(admitted_at[-1] - admitted_at[0], 0.09)
+        self.assertEqual(ramp.stats()["clients_online"], 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
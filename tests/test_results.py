@@ -0,0 +1,127 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from traffic_bot.results import ResultsWriter
+from traffic_bot.storage import Storage
+
+from tests.benchmark import wait_for
+
+RUN_ID = "run"
+ROOM_ID = "!results:example.com"
+SENDER = "@sender:example.com"
+RECEIVER = "@receiver:example.com"
+
+
+class ResultsWriterTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "bot.db")
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self) -> None:
+        self.loop.close()
+        self.directory.cleanup()
+
+    def write(self, record, **kwargs) -> ResultsWriter:
+        """Connect a storage, let `record` record samples with a writer and close
+        both
+        """
+
+        async def run():
+            store = Storage({"type": "sqlite", "connection_string": self.path})
+            await store.connect()
+            try:
+                results = ResultsWriter(store, RUN_ID, **kwargs)
+                await record(results)
+                await results.close()
+                return results
+            finally:
+                await store.close()
+
+        return self.loop.run_until_complete(run())
+
+    def rows(self, table: str):
+        conn = sqlite3.connect(self.path)
+        try:
+            return conn.execute(f"SELECT * FROM {table}").fetchall()
+        finally:
+            conn.close()
+
+    def test_batches(self):
+        """Test that samples are written in batches when the writer is closed"""
+        calls = {}
+
+        async def record(results):
+            for method in ("insert_message_samples", "insert_sync_samples"):
+                patched = mock.patch.object(
+                    results.store, method, wraps=getattr(results.store, method)
+                )
+                calls[method] = patched.start()
+                self.addCleanup(patched.stop)
+
+            for seq in range(5):
+                results.record_message(ROOM_ID, SENDER, RECEIVER, seq, 1000 + seq, 20)
+            for x in range(3):
+                results.record_sync(RECEIVER, 2000 + x, 30, 512, x == 0)
+
+            # Nothing is written before a flush
+            self.assertEqual(results.stats()["results_pending"], 8)
+            self.assertEqual(calls["insert_message_samples"].call_count, 0)
+
+        results = self.write(record, batch_size=2)
+
+        self.assertEqual(calls["insert_message_samples"].call_count, 3)
+        self.assertEqual(calls["insert_sync_samples"].call_count, 2)
+        self.assertEqual(results.written, 8)
+        self.assertEqual(results.stats()["results_pending"], 0)
+        self.assertEqual(results.write_errors, 0)
+
+        self.assertEqual(
+            self.rows("message_sample"),
+            [(RUN_ID, ROOM_ID, SENDER, RECEIVER, x, 1000 + x, 20) for x in range(5)],
+        )
+        self.assertEqual(
+            self.rows("sync_sample"),
+            [(RUN_ID, RECEIVER, 2000 + x, 30, 512, int(x == 0)) for x in range(3)],
+        )
+
+    def test_run(self):
+        """Test that recorded samples are written periodically while running"""
+
+        async def record(results):
+            task = asyncio.ensure_future(results.run())
+            try:
+                results.record_message(ROOM_ID, SENDER, RECEIVER, None, 1000, 20)
+                results.record_sync(RECEIVER, 2000, 30, 512, True)
+                self.assertTrue(await wait_for(lambda: results.written == 2, 5))
+            finally:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+
+        self.write(record, flush_interval=0.01)
+
+        self.assertEqual(len(self.rows("message_sample")), 1)
+        self.assertEqual(len(self.rows("sync_sample")), 1)
+
+    def test_max_pending(self):
+        """Test that samples are dropped while too many wait to be written"""
+
+        async def record(results):
+            for seq in range(3):
+                results.record_message(ROOM_ID, SENDER, RECEIVER, seq, 1000, 20)
+            results.record_sync(RECEIVER, 2000, 30, 512, True)
+
+        results = self.write(record, max_pending=2)
+
+        self.assertEqual(results.dropped, 1)
+        self.assertEqual(len(self.rows("message_sample")), 2)
+        self.assertEqual(len(self.rows("sync_sample")), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
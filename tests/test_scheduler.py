@@ -0,0 +1,128 @@
+import asyncio
+import unittest
+
+from nio import AsyncClientConfig
+
+from traffic_bot.async_client import TrafficAsyncClient
+from traffic_bot.invites import InviteFanout
+from traffic_bot.scheduler import (
+    PRIORITY_BULK,
+    PRIORITY_CONTROL,
+    RequestClass,
+    RequestScheduler,
+    classify,
+)
+
+from tests.fake_homeserver import FakeHomeserverThread
+
+ROOM_ID = "!scheduler:example.com"
+
+
+class RequestSchedulerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_classify(self):
+        """Test that requests are classified by their endpoint"""
+        prefix = "/_matrix/client/r0"
+        self.assertEqual(
+            classify("GET", prefix + "/sync?since=s1&timeout=30000"), "sync"
+        )
+        self.assertEqual(
+            classify("PUT", prefix + "/rooms/%21r%3Ax/send/m.room.message/1"), "send"
+        )
+        self.assertEqual(classify("POST", prefix + "/rooms/%21r%3Ax/invite"), "invite")
+        self.assertEqual(classify("POST", prefix + "/join/%21r%3Ax"), "join")
+        self.assertEqual(classify("POST", prefix + "/register"), "register")
+        self.assertEqual(classify("POST", prefix + "/login"), "login")
+        self.assertEqual(classify("POST", prefix + "/keys/upload"), "other")
+
+    def test_priority(self):
+        """Test that waiting requests are admitted by priority, and that the rate
+        decreases when rate limited and recovers afterwards
+        """
+        request_class = RequestClass("send", rate=100, increase=100)
+        admitted = []
+
+        async def request(name, priority):
+            await request_class.acquire(priority)
+            admitted.append(name)
+
+        async def run():
+            # The first request takes the only token, the others wait
+            await request_class.acquire()
+            await asyncio.gather(
+                request("bulk", PRIORITY_BULK),
+                request("control", PRIORITY_CONTROL),
+            )
+
+        self.loop.run_until_complete(run())
+        self.assertEqual(admitted, ["control", "bulk"])
+        self.assertEqual(request_class.max_queued, 2)
+
+        request_class.limit_exceeded(10)
+        self.assertEqual(request_class.bucket.rate, 50)
+        request_class.succeeded()
+        self.assertEqual(request_class.bucket.rate, 52)
+
+    def test_paused_while_waiting(self):
+        """Test that a request waiting for a token when the class gets paused is
+        admitted right after the pause, without waiting for another token
+        """
+        request_class = RequestClass("send", rate=10)
+
+        async def run():
+            # The first request takes the only token, the next one waits 0.1s for
+            # another. Halfway through, the class is paused until 0.15s
+            await request_class.acquire()
+            waiting = asyncio.ensure_future(request_class.acquire())
+            await asyncio.sleep(0.05)
+            request_class.limit_exceeded(100)
+            await waiting
+
+        self.loop.run_until_complete(run())
+        # The wait is 0.35s if the token taken before the pause is lost
+        self.assertLess(request_class.wait.total, 250)
+
+    def test_rate_limited(self):
+        """Test that rate limited requests are retried by the scheduler"""
+        homeserver = FakeHomeserverThread()
+        url = homeserver.start()
+        homeserver.homeserver.rate_limits["invite"] = 3
+        homeserver.create_room(ROOM_ID, ["@master:example.com"])
+        user_ids = ["@user_%d:example.com" % x for x in range(10)]
+        scheduler = RequestScheduler({}, min_rate=20, max_retries=10)
+
+        async def invite():
+            client = TrafficAsyncClient(
+                url,
+                "@master:example.com",
+                config=AsyncClientConfig(max_limit_exceeded=0, max_timeouts=0),
+                scheduler=scheduler,
+            )
+            try:
+                await client.login("password")
+                fanout = InviteFanout(client, concurrency=5)
+                await fanout.invite(ROOM_ID, user_ids)
+                return fanout
+            finally:
+                await client.close()
+
+        try:
+            fanout = self.loop.run_until_complete(invite())
+        finally:
+            homeserver.stop()
+
+        invites = scheduler.classes["invite"]
+        self.assertEqual(fanout.succeeded, 10)
+        self.assertEqual(fanout.rate_limited, 0)
+        self.assertGreater(invites.rate_limited, 0)
+        self.assertEqual(invites.retries, invites.rate_limited)
+        self.assertGreater(invites.bucket.rate, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import asyncio
+import unittest
+
+from nio import AsyncClientConfig
+
+from traffic_bot.async_client import TrafficAsyncClient
+from traffic_bot.send_pipeline import SendPipeline
+
+from tests.fake_homeserver import FakeHomeserverThread
+
+ROOM_ID = "!pipeline:example.com"
+USER_ID = "@sender:example.com"
+
+
+class SendPipelineTestCase(unittest.TestCase):
+    def setUp(self):
+        self.homeserver = FakeHomeserverThread()
+        self.url = self.homeserver.start()
+        self.homeserver.create_room(ROOM_ID, [USER_ID])
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        self.homeserver.stop()
+
+    def send(self, send, login=True):
+        """Run `send` with a pipeline of a client of the room and return the
+        pipeline
+        """
+
+        async def run():
+            client = TrafficAsyncClient(
+                self.url,
+                USER_ID,
+                config=AsyncClientConfig(max_limit_exceeded=0, max_timeouts=0),
+            )
+            try:
+                if login:
+                    await client.login("password")
+                pipeline = SendPipeline(client, 4)
+                await send(pipeline)
+                await pipeline.drain()
+                return pipeline
+            finally:
+                await client.close()
+
+        return self.loop.run_until_complete(run())
+
+    def test_window(self):
+        """Test that at most `window` messages are in flight and that drain() waits
+        for all of them
+        """
+        peak = 0
+
+        async def send(pipeline):
+            nonlocal peak
+            for x in range(20):
+                seq = await pipeline.submit(ROOM_ID, {"body": str(x)})
+                self.assertEqual(seq, x)
+                peak = max(peak, len(pipeline.in_flight))
+
+        pipeline = self.send(send)
+
+        self.assertEqual(peak, 4)
+        self.assertEqual(pipeline.in_flight, {})
+        self.assertEqual(pipeline.completed, 20)
+        self.assertEqual(pipeline.failed, 0)
+        self.assertEqual(self.homeserver.requests()["send"], 20)
+
+    def test_failed(self):
+        """Test that error responses and exceptions are counted as failed sends"""
+
+        async def send(pipeline):
+            await pipeline.submit("!unknown:example.com", {"body": "forbidden"})
+
+        pipeline = self.send(send)
+        self.assertEqual(pipeline.failed, 1)
+        self.assertEqual(pipeline.completed, 0)
+
+        # Sending without being logged in raises a LocalProtocolError
+        async def send_logged_out(pipeline):
+            for x in range(3):
+                await pipeline.submit(ROOM_ID, {"body": str(x)})
+
+        pipeline = self.send(send_logged_out, login=False)
+        self.assertEqual(pipeline.failed, 3)
+        self.assertEqual(pipeline.in_flight, {})
+
+    def test_reordered(self):
+        """Test that messages completing after a later message are counted"""
+
+        async def send(pipeline):
+            room_send = pipeline.client.room_send
+
+            async def delayed_send(room_id, message_type, content, **kwargs):
+                if content["body"] == "slow":
+                    await asyncio.sleep(0.2)
+                return await room_send(room_id, message_type, content, **kwargs)
+
+            pipeline.client.room_send = delayed_send
+            await pipeline.submit(ROOM_ID, {"body": "slow"})
+            for x in range(3):
+                await pipeline.submit(ROOM_ID, {"body": str(x)})
+
+        pipeline = self.send(send)
+
+        self.assertEqual(pipeline.completed, 4)
+        self.assertEqual(pipeline.reordered, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+import yaml
+
+from traffic_bot.config import Config
+from traffic_bot.shards import ShardSupervisor, split_range
+from traffic_bot.storage import Storage
+
+from tests.benchmark import wait_for, write_config
+from tests.fake_homeserver import FakeHomeserverThread
+
+SCRIPT = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "traffic-bot"
+)
+
+
+class ShardsTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.homeserver = FakeHomeserverThread()
+        url = self.homeserver.start()
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.config_path = write_config(
+            self.directory.name, url, clients=2, send_window=1, encryption=False
+        )
+
+        # Two shards of one slave each, reporting their stats quickly
+        with open(self.config_path) as file:
+            config = yaml.safe_load(file)
+        config["sharding"]["processes"] = 2
+        config["sharding"]["stats_interval"] = 0.5
+        with open(self.config_path, "w") as file:
+            yaml.safe_dump(config, file)
+
+        self.config = Config(self.config_path)
+        self.slaves = [self.config.for_bot(str(x)).slave_user_id for x in range(2)]
+
+    def tearDown(self) -> None:
+        self.homeserver.stop()
+        self.directory.cleanup()
+
+    def test_split_range(self):
+        """Test that the slave index range is split into contiguous shards"""
+        self.assertEqual(split_range(0, 10, 3), [(0, 4), (4, 7), (7, 10)])
+        self.assertEqual(split_range(5, 7, 4), [(5, 6), (6, 7)])
+
+    def test_supervisor(self):
+        """Test that the supervisor runs each shard exactly once"""
+        supervisor = ShardSupervisor(self.config_path, self.config)
+
+        async def run():
+            # Like the main process, create the database before starting the workers
+            store = Storage(self.config.database)
+            await store.connect()
+            await store.close()
+
+            task = asyncio.ensure_future(supervisor.run())
+            try:
+                reported = await wait_for(lambda: len(supervisor.shard_stats) == 2, 30)
+                # Give duplicate workers time to show up
+                await asyncio.sleep(1)
+                return reported, supervisor.stats()
+            finally:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+
+        loop = asyncio.new_event_loop()
+        try:
+            reported, stats = loop.run_until_complete(run())
+        finally:
+            loop.close()
+
+        self.assertTrue(reported)
+        self.assertEqual(supervisor.shards, [(0, 1), (1, 2)])
+        self.assertEqual(supervisor.shard_stats[0]["clients"], 1)
+        self.assertEqual(supervisor.shard_stats[1]["clients"], 1)
+        self.assertEqual(stats["shards_alive"], 2)
+        self.assertEqual(stats["shard_restarts"], 0)
+        self.assertEqual(self.homeserver.logins(), {s: 1 for s in self.slaves})
+
+    def test_script(self):
+        """Test that the spawned workers of the traffic-bot script don't start the
+        bot again
+        """
+        process = subprocess.Popen(
+            [sys.executable, SCRIPT, self.config_path],
+            cwd=os.path.dirname(SCRIPT),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            deadline = time.monotonic() + 30
+            while time.monotonic() < deadline:
+                if all(s in self.homeserver.logins() for s in self.slaves):
+                    break
+                time.sleep(0.05)
+            time.sleep(1)
+        finally:
+            # Unlike SIGTERM, an interrupt lets the bot terminate its workers
+            process.send_signal(signal.SIGINT)
+            process.wait(10)
+
+        logins = self.homeserver.logins()
+        self.assertEqual(logins.pop(self.config.master_user_id), 1)
+        self.assertEqual(logins, {s: 1 for s in self.slaves})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from traffic_bot.storage import Storage, _postgres_query, latest_migration_version
+
+
+class StorageTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "bot.db")
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def connect_and_close(self) -> None:
+        async def run():
+            store = Storage({"type": "sqlite", "connection_string": self.path})
+            await store.connect()
+            await store.close()
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(run())
+        finally:
+            loop.close()
+
+    def versions(self):
+        conn = sqlite3.connect(self.path)
+        try:
+            return conn.execute("SELECT version FROM migration_version").fetchall()
+        finally:
+            conn.close()
+
+    def test_postgres_query(self):
+        """Test that ? placeholders are numbered for asyncpg"""
+        self.assertEqual(
+            _postgres_query("INSERT INTO session (a, b, c) VALUES (?, ?, ?)"),
+            "INSERT INTO session (a, b, c) VALUES ($1, $2, $3)",
+        )
+        self.assertEqual(
+            _postgres_query("UPDATE run SET finished_ts = ? WHERE run_id = ?"),
+            "UPDATE run SET finished_ts = $1 WHERE run_id = $2",
+        )
+        self.assertEqual(
+            _postgres_query("SELECT version FROM migration_version"),
+            "SELECT version FROM migration_version",
+        )
+
+    def test_migrations(self):
+        """Test that a new database is migrated to the latest version, once"""
+        self.connect_and_close()
+        self.assertEqual(self.versions(), [(latest_migration_version,)])
+
+        self.connect_and_close()
+        self.assertEqual(self.versions(), [(latest_migration_version,)])
+
+    def test_empty_migration_version(self):
+        """Test that a database whose setup stopped before storing the migration
+        version is migrated
+        """
+        conn = sqlite3.connect(self.path)
+        conn.execute("CREATE TABLE migration_version (version INTEGER PRIMARY KEY)")
+        conn.commit()
+        conn.close()
+
+        self.connect_and_close()
+        self.assertEqual(self.versions(), [(latest_migration_version,)])
+
+
+if __name__ == "__main__":
+    unittest.main()
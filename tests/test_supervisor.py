@@ -0,0 +1,37 @@
+import asyncio
+import unittest
+
+from traffic_bot.supervisor import ConnectionState, ConnectionSupervisor
+
+
+class ConnectionSupervisorTestCase(unittest.TestCase):
+    def test_backoff_after_many_failures(self):
+        """Test that the backoff delay stays bounded after many failures"""
+        supervisor = ConnectionSupervisor("bot", base_delay=0.5, max_delay=0.01)
+        supervisor.consecutive_failures = 5000
+
+        loop = asyncio.new_event_loop()
+        try:
+            self.assertTrue(loop.run_until_complete(supervisor.backoff()))
+        finally:
+            loop.close()
+
+        self.assertEqual(supervisor.state, ConnectionState.BACKOFF)
+        self.assertLessEqual(supervisor.backoff_seconds, 0.01)
+
+    def test_give_up(self):
+        """Test that the client gives up after max_attempts failures"""
+        supervisor = ConnectionSupervisor("bot", max_attempts=2)
+        supervisor.consecutive_failures = 2
+
+        loop = asyncio.new_event_loop()
+        try:
+            self.assertFalse(loop.run_until_complete(supervisor.backoff()))
+        finally:
+            loop.close()
+
+        self.assertEqual(supervisor.state, ConnectionState.FAILED)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+
+import yaml
+
+from traffic_bot.sync_filters import NO_EVENTS, build_sync_filter
+
+from tests.benchmark import SAMPLE_CONFIG
+
+
+class BuildSyncFilterTestCase(unittest.TestCase):
+    def test_disabled(self):
+        """Test that syncs are only filtered if the profile enables it"""
+        self.assertIsNone(build_sync_filter(None))
+        self.assertIsNone(build_sync_filter({}))
+        self.assertIsNone(build_sync_filter({"enabled": False, "timeline_limit": 5}))
+
+    def test_defaults(self):
+        """Test that by default members are lazy loaded, everything the bots don't
+        need is filtered out and the timeline is not limited
+        """
+        sync_filter = build_sync_filter({"enabled": True})
+
+        self.assertEqual(
+            sync_filter,
+            {
+                "room": {
+                    "state": {"lazy_load_members": True},
+                    "timeline": {"lazy_load_members": True},
+                    "ephemeral": NO_EVENTS,
+                    "account_data": NO_EVENTS,
+                },
+                "presence": NO_EVENTS,
+                "account_data": NO_EVENTS,
+            },
+        )
+
+    def test_options(self):
+        """Test that the options of the profile are applied"""
+        sync_filter = build_sync_filter(
+            {
+                "enabled": True,
+                "timeline_limit": 10,
+                "lazy_load_members": False,
+                "presence": True,
+                "account_data": True,
+                "ephemeral": True,
+            }
+        )
+
+        self.assertEqual(
+            sync_filter,
+            {
+                "room": {
+                    "state": {"lazy_load_members": False},
+                    "timeline": {"lazy_load_members": False, "limit": 10},
+                }
+            },
+        )
+
+    def test_sample_config(self):
+        """Test that the sample config doesn't limit the timeline of the slaves, so
+        they don't miss messages and commands in limited syncs
+        """
+        with open(SAMPLE_CONFIG) as file:
+            profile = yaml.safe_load(file)["sync_filter"]["slave"]
+
+        sync_filter = build_sync_filter(profile)
+
+        self.assertIsNotNone(sync_filter)
+        self.assertNotIn("limit", sync_filter["room"]["timeline"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+
+from traffic_bot.targeting import compile_target, parse_target
+
+
+class TargetingTestCase(unittest.TestCase):
+    def test_parse(self):
+        """Test that target expressions are split off slave commands"""
+        self.assertEqual(parse_target("echo 5"), (None, "echo 5"))
+        self.assertEqual(parse_target(" echo 5"), (None, "echo 5"))
+
+        target, command = parse_target("[0-499] echo 5")
+        self.assertEqual(target.expression, "[0-499]")
+        self.assertEqual(command, "echo 5")
+
+        target, command = parse_target("{3, 7, 42} echo 5")
+        self.assertEqual(target.expression, "{3, 7, 42}")
+        self.assertEqual(command, "echo 5")
+
+        target, command = parse_target("12echo")
+        self.assertEqual(target.expression, "12")
+        self.assertEqual(command, "echo")
+
+        with self.assertRaises(ValueError):
+            parse_target("[0-499 echo 5")
+        with self.assertRaises(ValueError):
+            parse_target("[10-5] echo 5")
+        with self.assertRaises(ValueError):
+            parse_target("%0=1 echo 5")
+
+    def test_matches(self):
+        """Test the membership of the different target expressions"""
+        ids = range(100)
+
+        def matching(expression):
+            target = compile_target(expression)
+            return [bot_id for bot_id in ids if target.matches(str(bot_id))]
+
+        self.assertEqual(matching("42"), [42])
+        self.assertEqual(matching("[10-13]"), [10, 11, 12, 13])
+        self.assertEqual(matching("{3,7,42,500}"), [3, 7, 42])
+        self.assertEqual(matching("%40=1"), [1, 41, 81])
+        self.assertFalse(compile_target("1").matches("not a number"))
+
+        # Compiled targets are cached
+        self.assertIs(compile_target("[10-13]"), compile_target("[10-13]"))
+
+    def test_select(self):
+        """Test that targets select the slaves keyed by their bot id"""
+        slaves = {str(bot_id): bot_id for bot_id in range(10)}
+        self.assertEqual(compile_target("{8,3,20}").select(slaves), [3, 8])
+        self.assertEqual(compile_target("[2-4]").select(slaves), [2, 3, 4])
+        self.assertEqual(compile_target("%5=0").select(slaves), [0, 5])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import asyncio
+import time
+import unittest
+from typing import List
+from unittest.mock import Mock
+
+import nio
+
+from traffic_bot.latency import SEQ_KEY
+from traffic_bot.payloads import PayloadPool
+from traffic_bot.send_pipeline import SendPipeline
+from traffic_bot.traffic import TrafficController, TrafficEngine
+
+ROOM_ID = "!traffic:example.com"
+
+
+class TrafficControllerTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.controller = TrafficController()
+        self.sent_at = []  # type: List[float]
+
+        async def submit_payload(room_id, payloads):
+            self.sent_at.append(time.monotonic())
+            return len(self.sent_at) - 1
+
+        for x in range(2):
+            fake_client = Mock(spec=nio.AsyncClient)
+            fake_client.user = fake_client.user_id = f"@test_{x}:example.com"
+            fake_client.rooms = {ROOM_ID: Mock(spec=nio.MatrixRoom)}
+
+            fake_pipeline = Mock(spec=SendPipeline)
+            fake_pipeline.submit_payload.side_effect = submit_payload
+
+            self.controller.register(
+                TrafficEngine(fake_client, fake_pipeline, self.controller.bucket)
+            )
+
+    def test_burst(self):
+        """Test that the fleet-wide rate limit doesn't spread out bursts"""
+
+        async def run():
+            # Each bot sends 5 messages back to back, after 0.5s
+            self.controller.start(ROOM_ID, 20, "burst", burst_size=5)
+            await asyncio.sleep(0.7)
+            self.controller.stop()
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(run())
+        finally:
+            loop.close()
+
+        self.assertEqual(len(self.sent_at), 10)
+        self.assertLess(max(self.sent_at) - min(self.sent_at), 0.05)
+
+
+class TrafficEngineTestCase(unittest.TestCase):
+    def test_sequence_numbers(self):
+        """Test that the messages of a bot are numbered across echo commands and
+        traffic runs
+        """
+        seqs = []  # type: List[int]
+
+        async def room_send(room_id, message_type, content, **kwargs):
+            seqs.append(content[SEQ_KEY])
+            return Mock(spec=nio.RoomSendResponse)
+
+        fake_client = Mock(spec=nio.AsyncClient)
+        fake_client.user_id = "@test_0:example.com"
+        fake_client.room_send.side_effect = room_send
+
+        pipeline = SendPipeline(fake_client, 4)
+        payloads = PayloadPool(pool_size=4)
+        engine = TrafficEngine(fake_client, pipeline, payloads=payloads)
+
+        async def run():
+            # Like an echo command, then two traffic runs and another echo
+            for _ in range(3):
+                await pipeline.submit_payload(ROOM_ID, payloads)
+            for _ in range(2):
+                engine.start(ROOM_ID, 100)
+                await asyncio.sleep(0.1)
+                engine.stop()
+            await pipeline.submit_payload(ROOM_ID, payloads)
+            await pipeline.drain()
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(run())
+        finally:
+            loop.close()
+
+        self.assertGreater(len(seqs), 10)
+        self.assertEqual(seqs, list(range(len(seqs))))
+        self.assertEqual(engine.sent_bytes, 64 * engine.sent)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import asyncio
+import tempfile
+import unittest
+
+from nio import AsyncClient, AsyncClientConfig
+
+from traffic_bot.warmup import KeyWarmup
+
+from tests.fake_homeserver import FakeHomeserverThread
+
+ROOM_ID = "!warmup:example.com"
+PLAIN_ROOM_ID = "!plain:example.com"
+
+
+class KeyWarmupTestCase(unittest.TestCase):
+    def setUp(self):
+        self.homeserver = FakeHomeserverThread()
+        self.url = self.homeserver.start()
+        self.loop = asyncio.new_event_loop()
+        self.store_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.loop.close()
+        self.homeserver.stop()
+        self.store_dir.cleanup()
+
+    def test_warm_up(self):
+        """Test that the group sessions of all bots are shared with an encrypted
+        room, and not again once they are
+        """
+        user_ids = ["@user_%d:example.com" % x for x in range(4)]
+        self.homeserver.create_room(ROOM_ID, user_ids, encrypted=True)
+        self.homeserver.create_room(PLAIN_ROOM_ID, user_ids)
+
+        async def warm_up():
+            clients = [
+                AsyncClient(
+                    self.url,
+                    user_id,
+                    store_path=self.store_dir.name,
+                    config=AsyncClientConfig(
+                        encryption_enabled=True, store_sync_tokens=False
+                    ),
+                )
+                for user_id in user_ids
+            ]
+            try:
+                for client in clients:
+                    await client.login("password")
+                    await client.keys_upload()
+                for client in clients:
+                    await client.sync(full_state=True)
+
+                warmup = KeyWarmup(concurrency=2)
+                shared = await warmup.warm_up(ROOM_ID, clients)
+                await warmup.warm_up(ROOM_ID, clients)
+                await warmup.warm_up(PLAIN_ROOM_ID, clients)
+                return warmup, shared
+            finally:
+                for client in clients:
+                    await client.close()
+
+        warmup, shared = self.loop.run_until_complete(warm_up())
+        requests = self.homeserver.requests()
+
+        self.assertEqual(shared, 4)
+        self.assertEqual(warmup.shared, 4)
+        self.assertEqual(warmup.skipped, 8)
+        self.assertEqual(warmup.failed, 0)
+        self.assertEqual(warmup.durations.count, 4)
+        # Each bot claimed the one-time keys of and sent its session to the others
+        self.assertEqual(requests["keys_claim"], 4)
+        self.assertGreaterEqual(requests["send_to_device"], 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,235 @@
+import logging
+import time
+from typing import Dict, Optional, Set
+
+from aiohttp import ContentTypeError
+from nio import AsyncClient, MatrixRoom, MegolmEvent, RoomSendResponse, ToDeviceEvent
+
+from traffic_bot.histogram import Histogram
+from traffic_bot.http_pool import SharedHttpPool
+from traffic_bot.results import ResultsWriter
+from traffic_bot.scheduler import PRIORITY_TRAFFIC, RequestClass, RequestScheduler
+
+logger = logging.getLogger(__name__)
+
+
+class TrafficAsyncClient(AsyncClient):
+    def __init__(
+        self,
+        *args,
+        http_pool: Optional[SharedHttpPool] = None,
+        results: Optional[ResultsWriter] = None,
+        scheduler: Optional[RequestScheduler] = None,
+        priority: int = PRIORITY_TRAFFIC,
+        **kwargs
+    ):
+        """A nio AsyncClient that can send its requests through a shared HTTP pool.
+
+        Args:
+            args: Arguments passed to nio.AsyncClient.
+
+            http_pool: The shared HTTP pool to use. If not set, the client creates
+                its own session, just like a plain nio.AsyncClient.
+
+            results: Where to record a sample of each sync, if results are stored.
+
+            scheduler: The request scheduler shared by all bots of the process. If
+                set, every request except syncs waits for its turn, and rate
+                limited requests are retried by the scheduler instead of nio.
+
+            priority: The priority of the requests of this client.
+
+            kwargs: Keyword arguments passed to nio.AsyncClient.
+        """
+        super().__init__(*args, **kwargs)
+        self.http_pool = http_pool
+        self.results = results
+        self.scheduler = scheduler
+        self.priority = priority
+
+        # Sync counters. Syncs without a `since` token are full (initial) syncs
+        self.full_syncs = 0
+        self.incremental_syncs = 0
+        self.sync_bytes = 0
+        self.full_sync_bytes = 0
+        # Sync request durations in milliseconds, including the long-poll wait
+        self.sync_duration = Histogram()
+
+        # Send counters. Errors are counted by errcode or exception name
+        self.messages_sent = 0
+        self.send_errors = {}  # type: Dict[str, int]
+
+        # Crypto durations in microseconds: Megolm encryption of sent messages,
+        # Megolm decryption of received room events (successful or not) and Olm
+        # decryption of to-device events, e.g. shared room keys. They run on the
+        # event loop, so their totals are also the CPU time spent on crypto
+        self.encrypt_duration = Histogram()
+        self.decrypt_duration = Histogram()
+        self.olm_duration = Histogram()
+        self.decryption_failures = 0
+
+    async def send(self, method: str, path: str, *args, **kwargs):
+        """Send a request to the homeserver, using the shared session if configured"""
+        if self.http_pool and not self.client_session:
+            self.client_session = self.http_pool.session
+
+        # Syncs are never scheduled, so their duration doesn't include any wait
+        request_class = None
+        if self.scheduler:
+            request_class = self.scheduler.request_class(method, path)
+
+        started_at = time.monotonic()
+        if request_class is None:
+            response = await super().send(method, path, *args, **kwargs)
+        else:
+            response = await self._scheduled_send(
+                request_class, method, path, *args, **kwargs
+            )
+
+        endpoint, _, query = path.partition("?")
+        if endpoint.endswith("/sync"):
+            # The body is cached by aiohttp, so nio can still parse it afterwards
+            body = await response.read()
+            duration = int((time.monotonic() - started_at) * 1000)
+            self.sync_duration.record(duration)
+            self.sync_bytes += len(body)
+
+            full_sync = "since=" not in query
+            if full_sync:
+                self.full_syncs += 1
+                self.full_sync_bytes += len(body)
+            else:
+                self.incremental_syncs += 1
+
+            if self.results:
+                self.results.record_sync(
+                    self.user, int(time.time() * 1000), duration, len(body), full_sync
+                )
+
+        return response
+
+    async def _scheduled_send(
+        self, request_class: RequestClass, method: str, path: str, *args, **kwargs
+    ):
+        """Send a request when the scheduler admits it, retrying it while it is
+        rate limited
+        """
+        # Only requests with a body in memory can be sent again
+        data = args[0] if args else kwargs.get("data")
+        can_retry = data is None or isinstance(data, (str, bytes))
+
+        retries = 0
+        while True:
+            await request_class.acquire(self.priority)
+            response = await super().send(method, path, *args, **kwargs)
+            if response.status != 429:
+                request_class.succeeded()
+                return response
+
+            try:
+                retry_after_ms = (await response.json()).get("retry_after_ms")
+            except (ValueError, ContentTypeError):
+                retry_after_ms = None
+            request_class.limit_exceeded(retry_after_ms)
+
+            if not can_retry or retries >= self.scheduler.max_retries:
+                return response
+
+            retries += 1
+            request_class.retries += 1
+            response.release()
+
+    async def room_send(
+        self, room_id: str, message_type: str, content: dict, *args, **kwargs
+    ):
+        """Send a message to a room, counting sent messages and errors"""
+        try:
+            response = await super().room_send(
+                room_id, message_type, content, *args, **kwargs
+            )
+        except Exception as e:
+            self._count_send_error(type(e).__name__)
+            raise
+
+        if isinstance(response, RoomSendResponse):
+            self.messages_sent += 1
+        else:
+            self._count_send_error(response.status_code or "unknown")
+
+        return response
+
+    def encrypt(self, room_id: str, message_type: str, content: dict):
+        """Encrypt a message for a room, timing the encryption"""
+        started_at = time.perf_counter()
+        try:
+            return super().encrypt(room_id, message_type, content)
+        finally:
+            self.encrypt_duration.record(_micros_since(started_at))
+
+    def decrypt_event(self, event: MegolmEvent):
+        """Decrypt a Megolm event, timing the decryption"""
+        started_at = time.perf_counter()
+        try:
+            return super().decrypt_event(event)
+        finally:
+            self.decrypt_duration.record(_micros_since(started_at))
+
+    def _handle_timeline_event(
+        self, event, room_id: str, room: MatrixRoom, encrypted_rooms: Set[str]
+    ):
+        """Time the decryption of the Megolm events of a sync. nio decrypts them
+        here, without going through decrypt_event.
+
+        This and _handle_decrypt_to_device override private methods with the
+        signatures of matrix-nio 0.26, the version required by setup.py.
+        """
+        if not isinstance(event, MegolmEvent) or not self.olm:
+            return super()._handle_timeline_event(event, room_id, room, encrypted_rooms)
+
+        started_at = time.perf_counter()
+        decrypted = super()._handle_timeline_event(
+            event, room_id, room, encrypted_rooms
+        )
+        self.decrypt_duration.record(_micros_since(started_at))
+
+        # Undecryptable events are passed on to the decryption_failure callback
+        if decrypted is None:
+            self.decryption_failures += 1
+
+        return decrypted
+
+    def _handle_decrypt_to_device(self, to_device_event: ToDeviceEvent):
+        """Time the Olm decryption of a to-device event"""
+        if not self.olm:
+            return super()._handle_decrypt_to_device(to_device_event)
+
+        started_at = time.perf_counter()
+        try:
+            return super()._handle_decrypt_to_device(to_device_event)
+        finally:
+            self.olm_duration.record(_micros_since(started_at))
+
+    def crypto_stats(self) -> Dict[str, float]:
+        return {
+            "messages_encrypted": self.encrypt_duration.count,
+            "encrypt_seconds": self.encrypt_duration.total / 1e6,
+            "events_decrypted": self.decrypt_duration.count - self.decryption_failures,
+            "decryption_failures": self.decryption_failures,
+            "decrypt_seconds": self.decrypt_duration.total / 1e6,
+            "to_device_events": self.olm_duration.count,
+            "olm_seconds": self.olm_duration.total / 1e6,
+        }
+
+    def _count_send_error(self, errcode: str) -> None:
+        self.send_errors[errcode] = self.send_errors.get(errcode, 0) + 1
+
+    async def close(self):
+        """Close the client. The shared session is left open for the other clients"""
+        if self.http_pool:
+            self.client_session = None
+
+        await super().close()
+
+
+def _micros_since(started_at: float) -> int:
+    return int((time.perf_counter() - started_at) * 1e6)
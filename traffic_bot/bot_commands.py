@@ -1,16 +1,21 @@
-import time
-import threading
 import asyncio
+import time
 import random
 import string
 import logging
+from typing import List, Optional
 
 
 from nio import AsyncClient, MatrixRoom, RoomMessageText, RoomKickError
 
-from traffic_bot.chat_functions import react_to_event, send_text_to_room, room_invite, room_kick, register, login
+from traffic_bot.chat_functions import react_to_event, send_text_to_room, room_invite, room_kick
 from traffic_bot.config import Config
+from traffic_bot.fleet import Fleet
+from traffic_bot.invites import InviteFanout
+from traffic_bot.provisioning import REGISTERED, Provisioner
 from traffic_bot.storage import Storage
+from traffic_bot.traffic import PROFILES, TrafficEngine
+from traffic_bot.warmup import KeyWarmup
 
 
 logger = logging.getLogger(__name__)
@@ -24,7 +29,9 @@ class Command:
         command: str,
         room: MatrixRoom,
         event: RoomMessageText,
-        master_only: bool
+        master_only: bool,
+        fleet: Optional[Fleet] = None,
+        traffic: Optional[TrafficEngine] = None,
     ):
         """A command made by a user.
 
@@ -40,6 +47,12 @@ class Command:
             room: The room the command was sent in.
 
             event: The event describing the command.
+
+            master_only: Whether this is a command to the master bot.
+
+            fleet: The services shared by all bots of the process.
+
+            traffic: The traffic engine of the bot running the command.
         """
         self.client = client
         self.store = store
@@ -49,12 +62,8 @@ class Command:
         self.event = event
         self.args = self.command.split()[1:]
         self.master_only = master_only
-
-
-    async def makeTraffic(self, client, roomId):
-        while True:
-            await send_text_to_room(client, roomId, "response")
-            time.sleep(5)
+        self.fleet = fleet
+        self.traffic = traffic
 
 
     async def process(self):
@@ -65,6 +74,8 @@ class Command:
             await self._react()
         elif self.command.startswith("help"):
             await self._show_help()
+        elif self.command.startswith("traffic"):
+            await self._traffic()
         elif self.command.startswith("kick_invite") and self.master_only:
             await self._kick_invite()
         elif self.command.startswith("invite") and self.master_only:
@@ -76,16 +87,35 @@ class Command:
 
 
     async def _echo(self):
-        """Echo back the command's arguments"""
+        """Send <count> messages to the current room, through the send pipeline of
+        the bot so that several messages are in flight at once
+        """
         response = " ".join(self.args)
 
-        #await self.makeTraffic(self.client, self.room.room_id)
-
         try:
-            for x in range(0, int(response)):
+            count = int(response)
+        except ValueError:
+            return
+
+        if not self.traffic:
+            for x in range(0, count):
                 await send_text_to_room(self.client, self.room.room_id, str(x))
-        except:
-            pass
+            return
+
+        pipeline = self.traffic.pipeline
+        completed = pipeline.completed
+        started_at = time.monotonic()
+
+        for x in range(0, count):
+            await pipeline.submit_payload(self.room.room_id, self.traffic.payloads)
+        await pipeline.drain()
+
+        elapsed = time.monotonic() - started_at
+        delivered = pipeline.completed - completed
+        logger.info(
+            f"{self.client.user_id} sent {delivered}/{count} messages in "
+            f"{elapsed:.2f}s ({delivered / elapsed if elapsed > 0 else 0:.1f}/s)"
+        )
 
     async def _react(self):
         """Make the bot react to the command message"""
@@ -95,25 +125,142 @@ class Command:
             self.client, self.room.room_id, self.event.event_id, reaction
         )
 
+    async def _traffic(self):
+        """Control the traffic generated in the current room.
+
+        Slaves control their own traffic engine, the master controls the engines of
+        all slaves of its process that are in the room, with a fleet-wide rate.
+
+        Usage: traffic start <rate> [profile] [burst size] | rate <rate> | stop | status
+            | warmup
+        """
+        if not self.args:
+            await self._reply(
+                "Usage: `traffic start <rate> [profile] [burst size]`, "
+                "`traffic rate <rate>`, `traffic stop`, `traffic status` or "
+                "`traffic warmup`"
+            )
+            return
+
+        action = self.args[0]
+        try:
+            rate = float(self.args[1]) if len(self.args) > 1 else None
+            burst_size = int(self.args[3]) if len(self.args) > 3 else 10
+        except ValueError:
+            await self._reply(f"Invalid traffic arguments '{' '.join(self.args[1:])}'")
+            return
+        profile = self.args[2] if len(self.args) > 2 else self.config.traffic_profile
+
+        if action in ("start", "rate") and (rate is None or rate <= 0):
+            await self._reply(
+                "The rate must be a positive number of messages per second"
+            )
+            return
+
+        if action == "start" and profile not in PROFILES:
+            await self._reply(
+                f"Unknown profile '{profile}', use one of {', '.join(PROFILES)}"
+            )
+            return
+
+        if self.master_only:
+            if not self.fleet:
+                return
+            controller = self.fleet.traffic
+
+            warm_up = self.config.traffic_warmup and action == "start"
+            if warm_up or action == "warmup":
+                # Share the keys up front, so the measured traffic doesn't include
+                # the key distribution of the first message of every slave
+                warmup = await controller.warm_up(
+                    self.room.room_id, self.config.traffic_warmup_concurrency
+                )
+                if warmup.shared or warmup.failed or action == "warmup":
+                    await self._reply(warmup.summary())
+
+            if action == "start":
+                count = controller.start(self.room.room_id, rate, profile, burst_size)
+                await self._reply(
+                    f"Started {count} slaves sending {rate} messages/s ({profile})"
+                )
+            elif action == "rate":
+                count = controller.set_rate(rate)
+                await self._reply(
+                    f"Set the rate of {count} slaves to {rate} messages/s"
+                )
+            elif action == "stop":
+                count = controller.stop()
+                await self._reply(f"Stopped {count} slaves")
+            elif action == "status":
+                stats = controller.stats()
+                await self._reply(
+                    f"{stats['traffic_bots']} slaves sending, "
+                    f"target {stats.get('traffic_target_rate', 0):.2f} messages/s, "
+                    f"achieved {stats.get('traffic_achieved_rate', 0):.2f} messages/s, "
+                    f"{stats.get('traffic_sent', 0)} sent, "
+                    f"{stats.get('sends_completed', 0)} delivered, "
+                    f"{stats.get('sends_failed', 0)} failed"
+                )
+            elif action != "warmup":
+                await self._reply(f"Unknown traffic action '{action}'")
+            return
+
+        # Slaves don't reply, to keep the control traffic out of the measured load
+        if not self.traffic:
+            return
+
+        warm_up = self.config.traffic_warmup and action == "start"
+        if warm_up or action == "warmup":
+            await KeyWarmup(1).warm_up(self.room.room_id, [self.client])
+
+        if action == "start":
+            self.traffic.start(self.room.room_id, rate, profile, burst_size)
+        elif action == "rate":
+            self.traffic.set_rate(rate)
+        elif action == "stop":
+            self.traffic.stop()
+
+    async def _reply(self, text: str):
+        """Send a message to the current room, but only as the master bot"""
+        if self.master_only:
+            await send_text_to_room(self.client, self.room.room_id, text)
 
     async def _invite(self):
         """ Invite x slaves into current room """
-        slaveCnt = " ".join(self.args)
+        try:
+            slaveCnt = int(" ".join(self.args))
+        except ValueError:
+            await self._reply("Usage: invite <count>")
+            return
 
         start = self.config.slave_index_start
-        end = start + int(slaveCnt)
+        end = start + slaveCnt
         if end > self.config.slave_index_end:
             end = self.config.slave_index_end
 
+        userIds = [
+            self.config.slave_base_user_id + str(x) + ":" + self.config.homeserver_host
+            for x in range(start, end)
+        ]
+
+        # Inviting many users takes a while, so don't block the sync loop
+        asyncio.ensure_future(self._invite_users(userIds))
+
+    async def _invite_users(self, userIds: List[str]):
+        """Invite users to the current room with bounded concurrency and report the
+        outcome
+        """
+        fanout = InviteFanout(
+            self.client,
+            concurrency=self.config.invites_concurrency,
+            max_attempts=self.config.invites_max_attempts,
+        )
         try:
-            for x in range(start, end):
-                userId = self.config.slave_base_user_id + str(x) + ":" + self.config.homeserver_host
-                try:
-                    await room_invite(self.client, self.room.room_id, userId)
-                except:
-                    pass
-        except:
-            pass
+            await fanout.invite(self.room.room_id, userIds)
+        except Exception:
+            logger.exception("Failed to invite users")
+
+        await self._reply(fanout.summary())
 
 
     async def _kick_invite(self):
@@ -135,24 +282,41 @@ class Command:
 
     async def _add_zombie(self):
         """ Add zombie user to current room. New User will be registered and invited but does not sync anymore"""
-        slaveCnt = " ".join(self.args)
+        try:
+            count = int(" ".join(self.args))
+        except ValueError:
+            await self._reply("Usage: add_zombie <count>")
+            return
+
+        # Registering many users takes a while, so don't block the sync loop
+        asyncio.ensure_future(self._provision_zombies(count))
 
+    async def _provision_zombies(self, count: int):
+        """Register <count> zombie users with bounded concurrency, then invite the
+        registered ones to the current room and report the outcome
+        """
+        random_user_id = ''.join(random.choices(string.ascii_lowercase + string.digits, k=4))
+        localparts = ["zombie_" + random_user_id + "_" + str(x) for x in range(count)]
+
+        provisioner = Provisioner(
+            self.config,
+            self.store,
+            concurrency=self.config.provisioning_concurrency,
+            max_attempts=self.config.provisioning_max_attempts,
+            skip_crypto=self.config.provisioning_skip_crypto,
+            fleet=self.fleet,
+        )
         try:
-            random_user_id = ''.join(random.choices(string.ascii_lowercase + string.digits, k=4))
-            for x in range(0, int(slaveCnt)):
-                userId = "zombie_" + random_user_id + "_" + str(x)
-                try:
-                    userIdFull = "@" + userId + ":" + self.config.homeserver_host
-
-                    inviteResponse = await room_invite(self.client, self.room.room_id, userIdFull)
-
-                    event_loop = asyncio.get_event_loop()
-                    asyncio.ensure_future(register(self.config, userId, userIdFull, "password"), loop=event_loop)
-                except:
-                    pass
-        except:
-            pass
+            results = await provisioner.provision(localparts, "password")
+        except Exception:
+            logger.exception("Failed to provision zombies")
+            await self._reply("Failed to provision zombies")
+            return
+
+        await self._reply(provisioner.summary())
 
+        userIds = [result.user_id for result in results if result.status == REGISTERED]
+        await self._invite_users(userIds)
 
 
     async def _show_help(self):
@@ -174,13 +338,24 @@ class Command:
                     "<br>`add_zombie <count>` register new user and add &lt;zombie count&gt; to current room"
                     "<br>`invite <count>` invite &lt;slaves&gt; to current room"
                     "<br>`echo <count>` send &lt;count&gt; messages to current room"
+                    "<br>`traffic start <rate> [profile] [burst size]` let all slaves in current room send &lt;rate&gt; messages/s in total"
+                    "<br>`traffic rate <rate>` change the total rate of the slaves"
+                    "<br>`traffic stop` stop the traffic of the slaves"
+                    "<br>`traffic status` show the target and achieved rate of the slaves"
+                    "<br>`traffic warmup` share the encryption keys of the slaves in current room"
                     "<br>`react` react to command with ⭐"
                 )
             else:
                 text = (
                     "Available commands:"
                     "<br>`echo <count>` send &lt;count&gt; messages to current room"
+                    "<br>`traffic start <rate> [profile] [burst size]` send &lt;rate&gt; messages/s to current room"
+                    "<br>`traffic rate <rate>` change the rate"
+                    "<br>`traffic stop` stop sending messages"
+                    "<br>`traffic warmup` share the encryption keys with current room"
                     "<br>`react` react to command with ⭐"
+                    "<br>Commands can target some slaves only, e.g. `42 echo 5`, "
+                    "`[0-499] echo 5`, `{3,7,42} echo 5` or `%4=1 echo 5` after the prefix"
                 )
         else:
             text = "Unknown help topic!"
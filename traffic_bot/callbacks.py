@@ -1,4 +1,5 @@
 import logging
+from typing import Optional, Union
 
 from nio import (
     AsyncClient,
@@ -7,6 +8,7 @@ from nio import (
     MatrixRoom,
     MegolmEvent,
     RoomGetEventError,
+    RoomMessageNotice,
     RoomMessageText,
     UnknownEvent,
 )
@@ -14,14 +16,26 @@ from nio import (
 from traffic_bot.bot_commands import Command
 from traffic_bot.chat_functions import make_pill, react_to_event, send_text_to_room
 from traffic_bot.config import Config
+from traffic_bot.fleet import Fleet
+from traffic_bot.latency import SENT_TS_KEY, SEQ_KEY, delivery_latency
 from traffic_bot.message_responses import Message
 from traffic_bot.storage import Storage
+from traffic_bot.targeting import parse_target
+from traffic_bot.traffic import TrafficEngine
 
 logger = logging.getLogger(__name__)
 
 
 class Callbacks:
-    def __init__(self, client: AsyncClient, store: Storage, config: Config, master: bool):
+    def __init__(
+        self,
+        client: AsyncClient,
+        store: Storage,
+        config: Config,
+        master: bool,
+        fleet: Optional[Fleet] = None,
+        traffic: Optional[TrafficEngine] = None,
+    ):
         """
         Args:
             client: nio client used to interact with matrix.
@@ -29,19 +43,32 @@ class Callbacks:
             store: Bot storage.
 
             config: Bot configuration parameters.
+
+            master: Whether this is the master bot.
+
+            fleet: The services shared by all bots of the process.
+
+            traffic: The traffic engine of this bot.
         """
         self.client = client
         self.store = store
         self.config = config
         self.master = master
+        self.fleet = fleet
+        self.traffic = traffic
+
+        # Counters reported by the stats
+        self.messages_received = 0
 
         if master:
             self.command_prefix = config.master_command_prefix
         else:
             self.command_prefix = config.slave_command_prefix
 
-    async def message(self, room: MatrixRoom, event: RoomMessageText) -> None:
-        """Callback for when a message event is received
+    async def message(
+        self, room: MatrixRoom, event: Union[RoomMessageText, RoomMessageNotice]
+    ) -> None:
+        """Callback for when a text or notice message event is received
 
         Args:
             room: The room the event came from.
@@ -55,6 +82,33 @@ class Callbacks:
         if event.sender == self.client.user:
             return
 
+        self.messages_received += 1
+
+        # Measure the delivery latency of messages sent by the bots
+        if self.fleet:
+            content = event.source.get("content", {})
+            latency = delivery_latency(content)
+            if latency is not None:
+                self.fleet.latency.record(room.room_id, event.sender, latency)
+                seq = content.get(SEQ_KEY)
+                sent_ts = content[SENT_TS_KEY]
+                self.fleet.fanout.record(
+                    room.room_id, event.sender, seq, sent_ts, latency
+                )
+                if self.fleet.results:
+                    self.fleet.results.record_message(
+                        room.room_id,
+                        event.sender,
+                        self.client.user,
+                        seq,
+                        sent_ts,
+                        latency,
+                    )
+
+        # Notices are only measured. Bots must never respond to them
+        if isinstance(event, RoomMessageNotice):
+            return
+
         logger.debug(
             f"Bot message received for room {room.display_name} | "
             f"{room.user_name(event.sender)}: {msg}"
@@ -64,6 +118,10 @@ class Callbacks:
         has_command_prefix = msg.startswith(self.command_prefix)
         is_slave_command = msg.startswith(self.config.slave_command_prefix)
 
+        if is_slave_command:
+            await self._slave_command(msg, room, event)
+            return
+
         # room.is_group is often a DM, but not always.
         # room.is_group does not allow room aliases
         # room.member_count > 2 ... we assume a public room
@@ -80,20 +138,70 @@ class Callbacks:
             # Remove the command prefix
             msg = msg[len(self.command_prefix) :]
 
-        slave_bot_id = ""
+        await self.run_command(msg.strip(), room, event, True)
 
-        # Filter out slave id specific commands for other slave bots
-        if is_slave_command and msg[0].isdigit():
-            slave_bot_id = msg[0]
-            if not slave_bot_id == str(self.config.botId):
-                return
-            msg = msg[1 :]
-        
+    async def _slave_command(
+        self, msg: str, room: MatrixRoom, event: RoomMessageText
+    ) -> None:
+        """Handle a message with the slave command prefix, optionally followed by a
+        target expression selecting the slaves, see `targeting.compile_target`
+        """
+        # The master delivers slave commands to the slaves of its process, which
+        # then ignore them in the rooms it is in
+        bus = self.fleet.commands if self.fleet else None
+        if not self.master and bus and bus.master_in_room(room.room_id):
+            return
+
+        msg = msg[len(self.config.slave_command_prefix) :]
 
-        msg = msg.strip()
-        
+        try:
+            target, msg = parse_target(msg)
+        except ValueError as e:
+            logger.warning("Ignoring slave command: %s", e)
+            return
+
+        if self.master:
+            if bus:
+                bus.dispatch(target, msg, room.room_id, event)
+            return
+
+        # Filter out commands targeting other slave bots
+        if target is not None and not target.matches(self.config.botId):
+            return
+
+        if bus:
+            bus.ran_in_room(self.config.botId, event.event_id)
+        await self.run_command(msg, room, event, False)
+
+    async def run_command(
+        self,
+        msg: str,
+        room: MatrixRoom,
+        event: RoomMessageText,
+        master_only: bool,
+    ) -> None:
+        """Run a command sent to this bot.
 
-        command = Command(self.client, self.store, self.config, msg, room, event, not is_slave_command)
+        Args:
+            msg: The command and arguments, without prefix and target.
+
+            room: The room the command was sent in.
+
+            event: The event of the command.
+
+            master_only: Whether this is a command to the master bot.
+        """
+        command = Command(
+            self.client,
+            self.store,
+            self.config,
+            msg,
+            room,
+            event,
+            master_only,
+            self.fleet,
+            self.traffic,
+        )
         await command.process()
 
     async def invite(self, room: MatrixRoom, event: InviteMemberEvent) -> None:
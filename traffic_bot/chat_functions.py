@@ -1,51 +1,33 @@
 import logging
-import threading
-import time
-import copy
-from typing import Optional, Union
+from typing import Any, Dict, Optional, Union
 
 from markdown import markdown
 from nio import (
     AsyncClient,
-    AsyncClientConfig,
     ErrorResponse,
     MatrixRoom,
     MegolmEvent,
     Response,
-    RoomSendResponse,
-    SendRetryError,
-    RoomInviteResponse,
     RoomInviteError,
-    RoomKickResponse,
+    RoomInviteResponse,
     RoomKickError,
-    RegisterResponse,
-    LoginError,
-    LoginResponse,
+    RoomKickResponse,
+    RoomSendResponse,
+    SendRetryError,
 )
 
-from traffic_bot.config import Config
-from traffic_bot.storage import Storage
-from traffic_bot.login_client import LoginClient
-from traffic_bot.register_client import RegisterClient
-
 logger = logging.getLogger(__name__)
 
 
-async def send_text_to_room(
-    client: AsyncClient,
-    room_id: str,
+def make_text_content(
     message: str,
     notice: bool = True,
     markdown_convert: bool = True,
     reply_to_event_id: Optional[str] = None,
-) -> Union[RoomSendResponse, ErrorResponse]:
-    """Send text to a matrix room.
+) -> Dict[str, Any]:
+    """Build the content of a text message.
 
     Args:
-        client: The client to communicate to matrix with.
-
-        room_id: The ID of the room to send the message to.
-
         message: The message content.
 
         notice: Whether the message should be sent with an "m.notice" message type
@@ -58,7 +40,7 @@ async def send_text_to_room(
             ID this is message is a reply to.
 
     Returns:
-        A RoomSendResponse if the request was successful, else an ErrorResponse.
+        The content of an "m.room.message" event.
     """
     # Determine whether to ping room members or not
     msgtype = "m.notice" if notice else "m.text"
@@ -67,7 +49,7 @@ async def send_text_to_room(
         "msgtype": msgtype,
         "format": "org.matrix.custom.html",
         "body": message,
-    }
+    }  # type: Dict[str, Any]
 
     if markdown_convert:
         content["formatted_body"] = markdown(message)
@@ -75,6 +57,40 @@ async def send_text_to_room(
     if reply_to_event_id:
         content["m.relates_to"] = {"m.in_reply_to": {"event_id": reply_to_event_id}}
 
+    return content
+
+
+async def send_text_to_room(
+    client: AsyncClient,
+    room_id: str,
+    message: str,
+    notice: bool = True,
+    markdown_convert: bool = True,
+    reply_to_event_id: Optional[str] = None,
+) -> Union[RoomSendResponse, ErrorResponse]:
+    """Send text to a matrix room.
+
+    Args:
+        client: The client to communicate to matrix with.
+
+        room_id: The ID of the room to send the message to.
+
+        message: The message content.
+
+        notice: Whether the message should be sent with an "m.notice" message type
+            (will not ping users).
+
+        markdown_convert: Whether to convert the message content to markdown.
+            Defaults to true.
+
+        reply_to_event_id: Whether this message is a reply to another event. The event
+            ID this is message is a reply to.
+
+    Returns:
+        A RoomSendResponse if the request was successful, else an ErrorResponse.
+    """
+    content = make_text_content(message, notice, markdown_convert, reply_to_event_id)
+
     try:
         return await client.room_send(
             room_id,
@@ -145,34 +161,6 @@ async def react_to_event(
     )
 
 
-
-async def register(
-    config: Config, 
-    user_id: str,
-    username: str, 
-    password: str 
-):
-
-    newConfig = Config(config.filepath, user_id)
-    store = Storage(newConfig.database)
-    client = RegisterClient(store, newConfig, user_id, username, password)
-
-    return await client.start()
-
-async def login(
-    config: Config, 
-    user_id: str,
-    username: str, 
-    password: str, 
-) -> Union[LoginError,LoginResponse]:
-
-    newConfig = Config(config.filepath, user_id)
-    store = Storage(newConfig.database)
-    client = LoginClient(store, newConfig, username, password)
-
-    return await client.start()
-
-
 async def room_invite(
     client: AsyncClient,
     room_id: str,
@@ -196,6 +184,7 @@ async def room_kick(
         user_id,
     )
 
+
 async def decryption_failure(self, room: MatrixRoom, event: MegolmEvent) -> None:
     """Callback for when an event fails to decrypt. Inform the user"""
     logger.error(
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, List, Optional, Set
+
+from nio import AsyncClient, RoomMessageText
+
+from traffic_bot.targeting import Target
+
+if TYPE_CHECKING:
+    from traffic_bot.callbacks import Callbacks
+
+logger = logging.getLogger(__name__)
+
+# How many commands the slaves ran from the room are remembered
+MAX_RAN_IN_ROOM = 1000
+
+
+class CommandBus:
+    def __init__(self):
+        """Delivers the slave commands seen by the master directly to the slaves
+        running in the same process.
+
+        In the rooms the master has joined and synced, the local slaves ignore slave
+        commands and only take them from the bus, so a command is parsed once
+        instead of once per slave and runs without waiting for every slave to sync
+        it. In other rooms, and in other processes, which have no master attached,
+        slaves keep reading their commands from the room.
+        """
+        self.slaves = {}  # type: Dict[str, Callbacks]
+        self.master = None  # type: Optional[AsyncClient]
+
+        # The slaves that ran a command from the room themselves, by event ID, so
+        # the master doesn't deliver it to them again once it has synced the room.
+        # Only the latest events are kept
+        self._ran_in_room = OrderedDict()  # type: OrderedDict[str, Set[str]]
+
+        # Counters reported by stats()
+        self.dispatched = 0
+        self.deliveries = 0
+        self.dispatch_seconds = 0.0
+
+    def attach_master(self, client: AsyncClient) -> None:
+        """Mark the master with the given client as running in this process"""
+        self.master = client
+
+    def master_in_room(self, room_id: str) -> bool:
+        """Whether the master of this process has joined and synced a room, and
+        delivers the slave commands sent there
+        """
+        return self.master is not None and room_id in self.master.rooms
+
+    def ran_in_room(self, bot_id: str, event_id: str) -> None:
+        """Record that a local slave ran a command it read from the room itself"""
+        if self.master is None:
+            return
+
+        bot_ids = self._ran_in_room.get(event_id)
+        if bot_ids is None:
+            bot_ids = self._ran_in_room[event_id] = set()
+            if len(self._ran_in_room) > MAX_RAN_IN_ROOM:
+                self._ran_in_room.popitem(last=False)
+        bot_ids.add(str(bot_id))
+
+    def register_slave(self, bot_id: str, callbacks: "Callbacks") -> None:
+        """Register a local slave, addressed by its bot id"""
+        self.slaves[str(bot_id)] = callbacks
+
+    def dispatch(
+        self,
+        target: Optional[Target],
+        command: str,
+        room_id: str,
+        event: RoomMessageText,
+    ) -> int:
+        """Run a slave command on the targeted local slaves that are in the room.
+        The commands run in the background, so the master isn't held up by them.
+
+        Args:
+            target: The compiled target expression, or None for all slaves.
+
+            command: The command and arguments, without prefix and target.
+
+            room_id: The room the command was sent in.
+
+            event: The event of the command.
+
+        Returns:
+            The number of slaves the command was delivered to.
+        """
+        started_at = time.perf_counter()
+
+        if target is None:
+            targets = list(self.slaves.values())
+        else:
+            targets = target.select(self.slaves)
+
+        ran_in_room = self._ran_in_room.pop(event.event_id, ())
+
+        coroutines = []
+        for callbacks in targets:
+            if str(callbacks.config.botId) in ran_in_room:
+                continue
+
+            # Each slave runs the command with its own view of the room, and only if
+            # it would have received the message there
+            room = callbacks.client.rooms.get(room_id)
+            if room is not None:
+                coroutines.append(callbacks.run_command(command, room, event, False))
+
+        if coroutines:
+            asyncio.ensure_future(self._run(coroutines))
+
+        self.dispatched += 1
+        self.deliveries += len(coroutines)
+        self.dispatch_seconds += time.perf_counter() - started_at
+
+        return len(coroutines)
+
+    async def _run(self, coroutines: List) -> None:
+        results = await asyncio.gather(*coroutines, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(
+                    "Slave command failed",
+                    exc_info=(type(result), result, result.__traceback__),
+                )
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "commands_dispatched": self.dispatched,
+            "command_deliveries": self.deliveries,
+            "command_dispatch_seconds": self.dispatch_seconds,
+        }
@@ -1,3 +1,4 @@
+import copy
 import logging
 import os
 import re
@@ -7,17 +8,26 @@ from typing import Any, List, Optional
 import yaml
 
 from traffic_bot.errors import ConfigError
+from traffic_bot.payloads import DISTRIBUTIONS
+from traffic_bot.scheduler import REQUEST_CLASSES
 
 logger = logging.getLogger()
 logging.getLogger("peewee").setLevel(
     logging.INFO
 )  # Prevent debug messages from peewee lib
 
+# Whether the log handlers have been set up already. They are only added once per
+# process, no matter how many Config objects are created
+_logging_configured = False
+
 
 class Config:
-    """Creates a Config object from a YAML-encoded config file from a given filepath"""
+    """Creates a Config object from a YAML-encoded config file from a given filepath
+
+    Per-bot views of an already parsed config can be created with `for_bot`.
+    """
 
-    def __init__(self, filepath: str, botId):
+    def __init__(self, filepath: str, botId=""):
         self.filepath = filepath
         self.botId = botId
         if not os.path.isfile(filepath):
@@ -29,10 +39,29 @@ class Config:
 
         # Parse and validate config options
         self._parse_config_values()
+        self._parse_bot_values()
+
+    def for_bot(self, botId) -> "Config":
+        """Create a view of this config for the bot with the given id.
+
+        The config file is not read or validated again, only the bot specific options
+        (such as the user ID and database path) are derived from the parsed values.
+
+        Args:
+            botId: The id of the bot. An empty string for the master bot.
+
+        Returns:
+            A shallow copy of this config with the bot specific options replaced.
+        """
+        bot_config = copy.copy(self)
+        bot_config.botId = botId
+        bot_config._parse_bot_values()
+        return bot_config
+
+    def _setup_logging(self):
+        """Add the configured log handlers to the root logger"""
+        global _logging_configured
 
-    def _parse_config_values(self):
-        """Read and validate each config option"""
-        # Logging setup
         formatter = logging.Formatter(
             "%(asctime)s | %(name)s [%(levelname)s] %(message)s"
         )
@@ -59,6 +88,14 @@ class Config:
             handler.setFormatter(formatter)
             logger.addHandler(handler)
 
+        _logging_configured = True
+
+    def _parse_config_values(self):
+        """Read and validate each config option"""
+        # Logging setup
+        if not _logging_configured:
+            self._setup_logging()
+
         # Storage setup
         self.store_path = self._get_cfg(["storage", "store_path"], required=True)
 
@@ -71,38 +108,40 @@ class Config:
                     f"storage.store_path '{self.store_path}' is not a directory"
                 )
 
+        # Whether the bots support end-to-end encryption
+        self.encryption_enabled = self._get_cfg(
+            ["storage", "encryption_enabled"], default=True, required=False
+        )
+
         # Database setup
-        database_path = self._get_cfg(["storage", "database"], required=True)
-        if self.botId != "":
-            database_path = database_path.replace(".db", "_" + str(self.botId) + ".db")
+        self.database_path = self._get_cfg(["storage", "database"], required=True)
 
         # Support both SQLite and Postgres backends
-        # Determine which one the user intends
+        # Determine which one the user intends. All bots share the database
         sqlite_scheme = "sqlite://"
         postgres_scheme = "postgres://"
-        if database_path.startswith(sqlite_scheme):
+        if self.database_path.startswith(sqlite_scheme):
             self.database = {
                 "type": "sqlite",
-                "connection_string": database_path[len(sqlite_scheme) :],
+                "connection_string": self.database_path[len(sqlite_scheme) :],
+            }
+        elif self.database_path.startswith(postgres_scheme):
+            self.database = {
+                "type": "postgres",
+                "connection_string": self.database_path,
             }
-        elif database_path.startswith(postgres_scheme):
-            self.database = {"type": "postgres", "connection_string": database_path}
         else:
             raise ConfigError("Invalid connection string for storage.database")
 
+        # The maximum number of Postgres connections of each process
+        self.database_pool_size = self._get_cfg(
+            ["storage", "pool_size"], default=10, required=False
+        )
+
         # Matrix bot account setup
         self.slave_base_user_id = self._get_cfg(["matrix", "slave_base_user_id"], required=True)
-        self.slave_user_id = self.slave_base_user_id
-        if self.botId != "":
-            self.slave_user_id = self.slave_user_id + str(self.botId)
-        
         self.homeserver_host = self._get_cfg(["matrix", "homeserver_host"], required=True)
 
-        self.slave_user_id = self.slave_user_id +  ":" + self.homeserver_host
-        
-        if not re.match("@.*:.*", self.slave_user_id):
-            raise ConfigError("matrix.user_id must be in the form @name:domain")
-
         self.slave_password = self._get_cfg(["matrix", "slave_password"], required=False)
 
         self.device_id = self._get_cfg(["matrix", "device_id"], required=True)
@@ -116,14 +155,202 @@ class Config:
 
         self.master_user_id = self._get_cfg(["matrix", "master_user_id"], required=True)
 
-        self.master_user_id = self.master_user_id +  ":" + self.homeserver_host
+        self.master_user_id = self.master_user_id + ":" + self.homeserver_host
 
         self.master_password = self._get_cfg(["matrix", "master_password"], required=True)
 
-
         self.slave_index_start = self._get_cfg(["matrix", "slave_index_start"], required=True)
         self.slave_index_end = self._get_cfg(["matrix", "slave_index_end"], required=True)
 
+        # Shared HTTP connection pool setup
+        self.http_pool_enabled = self._get_cfg(
+            ["http_pool", "enabled"], default=False, required=False
+        )
+        self.http_pool_limit = self._get_cfg(
+            ["http_pool", "limit"], default=0, required=False
+        )
+        self.http_pool_limit_per_host = self._get_cfg(
+            ["http_pool", "limit_per_host"], default=0, required=False
+        )
+        self.http_pool_keepalive_timeout = self._get_cfg(
+            ["http_pool", "keepalive_timeout"], default=60, required=False
+        )
+        self.http_pool_stats_interval = self._get_cfg(
+            ["http_pool", "stats_interval"], default=60, required=False
+        )
+
+        # Bulk user provisioning setup
+        self.provisioning_concurrency = self._get_cfg(
+            ["provisioning", "concurrency"], default=20, required=False
+        )
+        self.provisioning_max_attempts = self._get_cfg(
+            ["provisioning", "max_attempts"], default=5, required=False
+        )
+        self.provisioning_skip_crypto = self._get_cfg(
+            ["provisioning", "skip_crypto"], default=False, required=False
+        )
+
+        # Invite fan-out setup
+        self.invites_concurrency = self._get_cfg(
+            ["invites", "concurrency"], default=10, required=False
+        )
+        self.invites_max_attempts = self._get_cfg(
+            ["invites", "max_attempts"], default=5, required=False
+        )
+
+        # Request scheduler setup
+        self.scheduler_enabled = self._get_cfg(
+            ["scheduler", "enabled"], default=False, required=False
+        )
+        self.scheduler_rates = self._get_cfg(
+            ["scheduler", "rates"], default={}, required=False
+        )
+        self.scheduler_burst = self._get_cfg(
+            ["scheduler", "burst"], default=1, required=False
+        )
+        self.scheduler_min_rate = self._get_cfg(
+            ["scheduler", "min_rate"], default=0.1, required=False
+        )
+        self.scheduler_increase = self._get_cfg(
+            ["scheduler", "increase"], default=1, required=False
+        )
+        self.scheduler_decrease = self._get_cfg(
+            ["scheduler", "decrease"], default=0.5, required=False
+        )
+        self.scheduler_max_retries = self._get_cfg(
+            ["scheduler", "max_retries"], default=5, required=False
+        )
+        unknown = set(self.scheduler_rates) - set(REQUEST_CLASSES)
+        if unknown:
+            raise ConfigError(
+                f"Unknown request classes in scheduler.rates: {', '.join(sorted(unknown))}"
+            )
+
+        # Startup ramp-up setup
+        self.startup_ramp_rate = self._get_cfg(
+            ["startup", "ramp_rate"], default=10, required=False
+        )
+        self.startup_max_concurrent_logins = self._get_cfg(
+            ["startup", "max_concurrent_logins"], default=20, required=False
+        )
+
+        # Reconnect backoff setup
+        self.reconnect_base_delay = self._get_cfg(
+            ["reconnect", "base_delay"], default=1, required=False
+        )
+        self.reconnect_max_delay = self._get_cfg(
+            ["reconnect", "max_delay"], default=60, required=False
+        )
+        self.reconnect_max_attempts = self._get_cfg(
+            ["reconnect", "max_attempts"], default=0, required=False
+        )
+
+        # Multi-process sharding setup
+        self.shard_processes = self._get_cfg(
+            ["sharding", "processes"], default=1, required=False
+        )
+        self.shard_restart_delay = self._get_cfg(
+            ["sharding", "restart_delay"], default=5, required=False
+        )
+        self.shard_stats_interval = self._get_cfg(
+            ["sharding", "stats_interval"], default=30, required=False
+        )
+
+        # Traffic generation setup
+        self.traffic_profile = self._get_cfg(
+            ["traffic", "profile"], default="constant", required=False
+        )
+        self.send_window = self._get_cfg(
+            ["traffic", "send_window"], default=8, required=False
+        )
+        self.fanout_timeout = self._get_cfg(
+            ["traffic", "fanout_timeout"], default=10, required=False
+        )
+        self.traffic_warmup = self._get_cfg(
+            ["traffic", "warmup"], default=True, required=False
+        )
+        self.traffic_warmup_concurrency = self._get_cfg(
+            ["traffic", "warmup_concurrency"], default=20, required=False
+        )
+
+        # Message payload setup
+        self.payload_distribution = self._get_cfg(
+            ["traffic", "payload", "distribution"], default="fixed", required=False
+        )
+        if self.payload_distribution not in DISTRIBUTIONS:
+            raise ConfigError(
+                "traffic.payload.distribution must be one of "
+                + ", ".join(DISTRIBUTIONS)
+            )
+        self.payload_size = self._get_cfg(
+            ["traffic", "payload", "size"], default=64, required=False
+        )
+        self.payload_min_size = self._get_cfg(
+            ["traffic", "payload", "min_size"], default=16, required=False
+        )
+        self.payload_max_size = self._get_cfg(
+            ["traffic", "payload", "max_size"], default=4096, required=False
+        )
+        self.payload_sigma = self._get_cfg(
+            ["traffic", "payload", "sigma"], default=1.0, required=False
+        )
+        self.payload_pool_size = self._get_cfg(
+            ["traffic", "payload", "pool_size"], default=256, required=False
+        )
+        self.payload_seed = self._get_cfg(
+            ["traffic", "payload", "seed"], required=False
+        )
+
+        # Sync filter setup
+        self.sync_filters = {
+            "master": self._get_cfg(["sync_filter", "master"], required=False),
+            "slave": self._get_cfg(["sync_filter", "slave"], required=False),
+        }
+
+        # Metrics endpoint setup
+        self.metrics_enabled = self._get_cfg(
+            ["metrics", "enabled"], default=False, required=False
+        )
+        self.metrics_host = self._get_cfg(
+            ["metrics", "host"], default="127.0.0.1", required=False
+        )
+        self.metrics_port = self._get_cfg(
+            ["metrics", "port"], default=9111, required=False
+        )
+
+        # Results storage setup
+        self.results_enabled = self._get_cfg(
+            ["results", "enabled"], default=False, required=False
+        )
+        self.results_description = self._get_cfg(
+            ["results", "description"], default="", required=False
+        )
+        self.results_flush_interval = self._get_cfg(
+            ["results", "flush_interval"], default=1, required=False
+        )
+        self.results_batch_size = self._get_cfg(
+            ["results", "batch_size"], default=1000, required=False
+        )
+        self.results_max_pending = self._get_cfg(
+            ["results", "max_pending"], default=100000, required=False
+        )
+
+        # How often the bot stats are logged, in seconds
+        self.stats_interval = self._get_cfg(
+            ["stats_interval"], default=30, required=False
+        )
+
+    def _parse_bot_values(self):
+        """Derive the options that differ between bots from the parsed config values"""
+        # Matrix bot account setup
+        self.slave_user_id = self.slave_base_user_id
+        if self.botId != "":
+            self.slave_user_id = self.slave_user_id + str(self.botId)
+
+        self.slave_user_id = self.slave_user_id + ":" + self.homeserver_host
+
+        if not re.match("@.*:.*", self.slave_user_id):
+            raise ConfigError("matrix.user_id must be in the form @name:domain")
 
     def _get_cfg(
         self,
@@ -0,0 +1,147 @@
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from nio import AsyncClient
+
+from traffic_bot.histogram import Histogram
+
+logger = logging.getLogger(__name__)
+
+
+class FanoutMessage:
+    __slots__ = ("room_id", "sent_ts", "expected", "latencies")
+
+    def __init__(self, room_id: str, sent_ts: int, expected: int):
+        self.room_id = room_id
+        self.sent_ts = sent_ts
+        self.expected = expected
+        self.latencies = []  # type: List[int]
+
+
+class FanoutTracker:
+    def __init__(self, clients: List[AsyncClient], timeout: float = 10):
+        """Measures how long it takes for a message to reach all receivers in a room:
+        the latency of the first, the median and the last receiver, and how many
+        receivers didn't get the message within the timeout.
+
+        Only the clients of this process are counted as receivers.
+
+        Args:
+            clients: The clients of all bots of the process. Can be added to later.
+
+            timeout: How many seconds after sending a message receivers that haven't
+                got it are counted as missing.
+        """
+        self.clients = clients
+        self.timeout_ms = int(timeout * 1000)
+
+        # (room, sender, sequence number) -> message, in the order they were first
+        # received. A sender's messages to different rooms are counted separately
+        self.pending = {}  # type: Dict[Tuple[str, str, int], FanoutMessage]
+        self._next_sweep = 0.0
+
+        self.first = Histogram()
+        self.median = Histogram()
+        self.last = Histogram()
+
+        # Counters reported by stats()
+        self.messages = 0
+        self.incomplete = 0
+        self.missing_receivers = 0
+        self.late_receipts = 0
+
+    def _expected_receivers(self, room_id: str, sender: str) -> int:
+        return sum(
+            1
+            for client in self.clients
+            if client.user != sender and room_id in client.rooms
+        )
+
+    def record(
+        self, room_id: str, sender: str, seq: int, sent_ts: int, latency: int
+    ) -> None:
+        """Record that a receiver got a message.
+
+        Args:
+            room_id: The room of the message.
+
+            sender: The sender of the message.
+
+            seq: The sequence number of the message.
+
+            sent_ts: When the message was sent, in milliseconds since the epoch.
+
+            latency: The delivery latency to this receiver, in milliseconds.
+        """
+        now = sent_ts + latency
+
+        if now >= self._next_sweep:
+            self.sweep(now)
+
+        if latency > self.timeout_ms:
+            # The message has already been counted as missing for this receiver
+            self.late_receipts += 1
+            return
+
+        key = (room_id, sender, seq)
+        message = self.pending.get(key)
+        if message is None:
+            expected = self._expected_receivers(room_id, sender)
+            message = self.pending[key] = FanoutMessage(room_id, sent_ts, expected)
+
+        message.latencies.append(latency)
+        if len(message.latencies) >= message.expected:
+            del self.pending[key]
+            self._finish(message)
+
+    def sweep(self, now: Optional[int] = None) -> None:
+        """Finish the messages whose timeout has expired"""
+        if now is None:
+            now = int(time.time() * 1000)
+        self._next_sweep = now + 1000
+
+        # Messages are roughly ordered by their send time
+        expired = []
+        for key, message in self.pending.items():
+            if now - message.sent_ts <= self.timeout_ms:
+                break
+            expired.append(key)
+
+        for key in expired:
+            self._finish(self.pending.pop(key))
+
+    def _finish(self, message: FanoutMessage) -> None:
+        latencies = sorted(message.latencies)
+
+        self.messages += 1
+        self.first.record(latencies[0])
+        self.median.record(latencies[len(latencies) // 2])
+        self.last.record(latencies[-1])
+
+        missing = message.expected - len(latencies)
+        if missing > 0:
+            self.incomplete += 1
+            self.missing_receivers += missing
+
+    def log_summary(self) -> None:
+        """Log the latency percentiles of the first, median and last receivers"""
+        self.sweep()
+        if not self.messages:
+            return
+
+        logger.info(
+            "Fan-out latency (ms): first %s, median %s, last %s",
+            self.first.summary(),
+            self.median.summary(),
+            self.last.summary(),
+        )
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "fanout_messages": self.messages,
+            "fanout_pending": len(self.pending),
+            "fanout_incomplete": self.incomplete,
+            "fanout_missing_receivers": self.missing_receivers,
+            "fanout_late_receipts": self.late_receipts,
+        }
@@ -0,0 +1,127 @@
+import logging
+from typing import Dict, List, Optional
+
+from nio import AsyncClient
+
+from traffic_bot.command_bus import CommandBus
+from traffic_bot.config import Config
+from traffic_bot.fanout import FanoutTracker
+from traffic_bot.http_pool import SharedHttpPool
+from traffic_bot.latency import LatencyRecorder
+from traffic_bot.payloads import PayloadPool
+from traffic_bot.ramp import RampScheduler
+from traffic_bot.results import ResultsWriter
+from traffic_bot.scheduler import RequestScheduler
+from traffic_bot.storage import Storage
+from traffic_bot.traffic import TrafficController
+
+logger = logging.getLogger(__name__)
+
+
+class Fleet:
+    def __init__(
+        self,
+        config: Config,
+        expected_clients: int,
+        shares: int = 1,
+        run_id: Optional[str] = None,
+        store: Optional[Storage] = None,
+    ):
+        """The services shared by all bots of a process.
+
+        Args:
+            config: Bot configuration parameters.
+
+            expected_clients: The number of clients started by this process.
+
+            shares: The number of processes the configured startup limits are split
+                between.
+
+            run_id: The ID of the run the results are stored for, if results are
+                enabled.
+
+            store: The connected storage of the process, which the results are
+                written to.
+        """
+        self.config = config
+        self.run_id = run_id
+
+        # Optionally share one connection pool between all clients
+        self.http_pool = None  # type: Optional[SharedHttpPool]
+        if config.http_pool_enabled:
+            self.http_pool = SharedHttpPool(
+                limit=config.http_pool_limit,
+                limit_per_host=config.http_pool_limit_per_host,
+                keepalive_timeout=config.http_pool_keepalive_timeout,
+            )
+
+        # Optionally schedule the requests of all clients, adapting to rate limits
+        self.scheduler = None  # type: Optional[RequestScheduler]
+        if config.scheduler_enabled:
+            self.scheduler = RequestScheduler(
+                config.scheduler_rates,
+                burst=config.scheduler_burst,
+                min_rate=config.scheduler_min_rate,
+                increase=config.scheduler_increase,
+                decrease=config.scheduler_decrease,
+                max_retries=config.scheduler_max_retries,
+            )
+
+        # Bring the clients online at a bounded rate
+        rate = config.startup_ramp_rate / shares
+        max_concurrent = config.startup_max_concurrent_logins
+        if max_concurrent > 0:
+            max_concurrent = max(max_concurrent // shares, 1)
+        self.ramp = RampScheduler(rate, max_concurrent, expected_clients)
+
+        # Fleet-wide control of the traffic sent by the slaves
+        self.traffic = TrafficController()
+
+        # The messages sent by all bots of the process, built up front
+        self.payloads = PayloadPool(
+            config.payload_distribution,
+            size=config.payload_size,
+            min_size=config.payload_min_size,
+            max_size=config.payload_max_size,
+            sigma=config.payload_sigma,
+            pool_size=config.payload_pool_size,
+            seed=config.payload_seed,
+        )
+
+        # Slave commands go straight from the master to the slaves of the process
+        self.commands = CommandBus()
+
+        # The clients of all bots of the process
+        self.clients = []  # type: List[AsyncClient]
+
+        # Delivery latency of the messages received by all bots of the process, per
+        # message and across all receivers of each message
+        self.latency = LatencyRecorder()
+        self.fanout = FanoutTracker(self.clients, config.fanout_timeout)
+
+        # Optionally store the message and sync samples in the database
+        self.results = None  # type: Optional[ResultsWriter]
+        if config.results_enabled and run_id and store:
+            self.results = ResultsWriter(
+                store,
+                run_id,
+                flush_interval=config.results_flush_interval,
+                batch_size=config.results_batch_size,
+                max_pending=config.results_max_pending,
+            )
+
+    def stats(self) -> Dict[str, float]:
+        """Return the stats of the shared services"""
+        stats = self.ramp.stats()  # type: Dict[str, float]
+        if self.http_pool:
+            stats.update(self.http_pool.stats())
+        if self.scheduler:
+            stats.update(self.scheduler.stats())
+        stats.update(self.commands.stats())
+        stats.update(self.payloads.stats())
+        stats.update(self.latency.stats())
+        stats.update(self.fanout.stats())
+        if self.results:
+            stats.update(self.results.stats())
+
+        return stats
@@ -0,0 +1,120 @@
+from typing import Dict, List, Sequence
+
+# Values below this are counted in buckets of width 1
+LINEAR_LIMIT = 32
+# Each power of two above LINEAR_LIMIT is split into this many buckets
+SUB_BUCKETS = 16
+SUB_BUCKET_BITS = 4
+
+
+class Histogram:
+    def __init__(self, max_value: int = 1 << 20):
+        """A histogram of non-negative integer values with a fixed set of buckets, in
+        the style of an HDR histogram.
+
+        Values up to LINEAR_LIMIT are counted exactly, larger values in log-linear
+        buckets with a relative error of at most 1/SUB_BUCKETS. All buckets are
+        allocated up front, so recording a value is a few integer operations.
+
+        Args:
+            max_value: The largest value that is counted in its own bucket. Larger
+                values are counted in the last bucket, but still tracked by `max`.
+        """
+        self.max_value = max(max_value, LINEAR_LIMIT)
+        self.counts = [0] * (self._index(self.max_value) + 1)
+
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    @staticmethod
+    def _index(value: int) -> int:
+        if value < LINEAR_LIMIT:
+            return value
+
+        # The power of two of the value selects the group of buckets, the next
+        # SUB_BUCKET_BITS bits the bucket within the group
+        magnitude = value.bit_length() - 1
+        shift = magnitude - SUB_BUCKET_BITS
+        sub_bucket = (value >> shift) - SUB_BUCKETS
+        group = magnitude - LINEAR_LIMIT.bit_length() + 1
+
+        return LINEAR_LIMIT + group * SUB_BUCKETS + sub_bucket
+
+    @staticmethod
+    def _highest_value(index: int) -> int:
+        """The largest value counted in the bucket with the given index"""
+        if index < LINEAR_LIMIT:
+            return index
+
+        group, sub_bucket = divmod(index - LINEAR_LIMIT, SUB_BUCKETS)
+        shift = group + LINEAR_LIMIT.bit_length() - 1 - SUB_BUCKET_BITS
+
+        return ((SUB_BUCKETS + sub_bucket + 1) << shift) - 1
+
+    def record(self, value: int) -> None:
+        """Count a value. Negative values are counted as 0"""
+        if value < 0:
+            value = 0
+
+        self.counts[self._index(min(value, self.max_value))] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: "Histogram") -> None:
+        """Add the counts of a histogram with the same max_value to this one"""
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percentile: float) -> int:
+        """The value below or at which the given percentage of the counted values lie,
+        rounded up to the end of its bucket
+        """
+        if self.count == 0:
+            return 0
+
+        threshold = self.count * percentile / 100
+        last = len(self.counts) - 1
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= threshold:
+                if index == last:
+                    # The last bucket also counts the values above max_value
+                    return self.max
+                return min(self._highest_value(index), self.max)
+
+        return self.max
+
+    def cumulative_counts(self, bounds: Sequence[int]) -> List[int]:
+        """The number of counted values up to each of the given ascending bounds, as
+        needed for a Prometheus histogram. Buckets are counted up to a bound if all
+        their values are at or below it.
+        """
+        result = []
+        seen = 0
+        index = 0
+        for bound in bounds:
+            while index < len(self.counts) - 1 and self._highest_value(index) <= bound:
+                seen += self.counts[index]
+                index += 1
+            result.append(seen)
+
+        return result
+
+    def summary(self) -> Dict[str, float]:
+        """The count, mean, p50, p90, p99 and max of the counted values"""
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
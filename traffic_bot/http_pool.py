@@ -0,0 +1,91 @@
+import logging
+from typing import Dict, Optional
+
+from aiohttp import ClientSession, TCPConnector, TraceConfig
+
+logger = logging.getLogger(__name__)
+
+
+class SharedHttpPool:
+    def __init__(
+        self,
+        limit: int = 0,
+        limit_per_host: int = 0,
+        keepalive_timeout: float = 60,
+    ):
+        """A single aiohttp session (and connection pool) shared by every client
+        in the process.
+
+        The session is created lazily, as aiohttp requires a running event loop.
+
+        Args:
+            limit: The maximum number of open connections. 0 means unlimited.
+
+            limit_per_host: The maximum number of open connections to the same
+                host. 0 means unlimited. Long-polling syncs hold on to a connection
+                for their whole duration, so this must be at least the number of
+                clients in the process.
+
+            keepalive_timeout: How long to keep idle connections open, in seconds.
+        """
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+
+        self._session = None  # type: Optional[ClientSession]
+
+        # Connection counters
+        self.requests = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+
+    @property
+    def session(self) -> ClientSession:
+        """The shared client session, created on first use"""
+        if self._session is None or self._session.closed:
+            trace = TraceConfig()
+            trace.on_request_start.append(self._on_request_start)
+            trace.on_connection_create_end.append(self._on_connection_create_end)
+            trace.on_connection_reuseconn.append(self._on_connection_reuseconn)
+
+            connector = TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            self._session = ClientSession(
+                connector=connector,
+                trace_configs=[trace],
+            )
+
+            logger.info(
+                "Created shared HTTP pool (limit=%d, limit_per_host=%d, keepalive=%ss)",
+                self.limit,
+                self.limit_per_host,
+                self.keepalive_timeout,
+            )
+
+        return self._session
+
+    def stats(self) -> Dict[str, int]:
+        """Return the connection counters of the pool"""
+        return {
+            "requests": self.requests,
+            "connections_created": self.connections_created,
+            "connections_reused": self.connections_reused,
+        }
+
+    async def close(self) -> None:
+        """Close the shared session and all of its connections"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _on_request_start(self, session, context, params) -> None:
+        self.requests += 1
+
+    async def _on_connection_create_end(self, session, context, params) -> None:
+        self.connections_created += 1
+
+    async def _on_connection_reuseconn(self, session, context, params) -> None:
+        self.connections_reused += 1
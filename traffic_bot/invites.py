@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Dict, List, Optional
+
+from aiohttp import ClientConnectionError, ServerDisconnectedError
+from nio import AsyncClient, RoomInviteResponse
+
+logger = logging.getLogger(__name__)
+
+
+class InviteFanout:
+    def __init__(
+        self, client: AsyncClient, concurrency: int = 10, max_attempts: int = 5
+    ):
+        """Invites many users to a room, with a bounded number of invites in flight.
+
+        Rate limited invites are retried after the delay requested by the
+        homeserver, and all invites pause until then, as the limit applies to the
+        inviting user. Connection errors are retried with a backoff.
+
+        Args:
+            client: The client of the inviting bot.
+
+            concurrency: How many invites may be in flight at the same time.
+
+            max_attempts: How often an invite is attempted before it is given up.
+        """
+        self.client = client
+        self.concurrency = max(concurrency, 1)
+        self.max_attempts = max(max_attempts, 1)
+
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        # Invites wait until this time after being rate limited
+        self._resume_at = 0.0
+
+        self.started_at = None  # type: Optional[float]
+        self.finished_at = None  # type: Optional[float]
+
+        # Counters reported by stats(). Failures are counted by errcode
+        self.total = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.errors = {}  # type: Dict[str, int]
+
+    async def invite(self, room_id: str, user_ids: List[str]) -> List[str]:
+        """Invite the given users to a room.
+
+        Args:
+            room_id: The room to invite the users to.
+
+            user_ids: The users to invite.
+
+        Returns:
+            The users that were invited.
+        """
+        if self.started_at is None:
+            self.started_at = time.monotonic()
+        self.finished_at = None
+        self.total += len(user_ids)
+
+        results = await asyncio.gather(
+            *(self._invite_user(room_id, user_id) for user_id in user_ids)
+        )
+
+        self.finished_at = time.monotonic()
+        logger.info(self.summary())
+
+        return [user_id for user_id, invited in zip(user_ids, results) if invited]
+
+    async def _invite_user(self, room_id: str, user_id: str) -> bool:
+        async with self._semaphore:
+            error = await self._send_invite(room_id, user_id)
+
+        if error is None:
+            self.succeeded += 1
+            return True
+
+        logger.warning("Failed to invite %s: %s", user_id, error)
+        self.failed += 1
+        self.errors[error] = self.errors.get(error, 0) + 1
+        return False
+
+    async def _send_invite(self, room_id: str, user_id: str) -> Optional[str]:
+        """Invite a user, retrying until it succeeds or the attempts run out.
+
+        Returns:
+            None if the user was invited, otherwise the errcode or exception name of
+            the last attempt.
+        """
+        error = None  # type: Optional[str]
+        for attempt in range(1, self.max_attempts + 1):
+            if attempt > 1:
+                self.retries += 1
+            await self._wait_for_rate_limit()
+
+            try:
+                response = await self.client.room_invite(room_id, user_id)
+            except (
+                ClientConnectionError,
+                ServerDisconnectedError,
+                asyncio.TimeoutError,
+            ) as e:
+                error = type(e).__name__
+                await self._backoff(attempt)
+                continue
+
+            if isinstance(response, RoomInviteResponse):
+                return None
+
+            error = response.status_code or "unknown"
+            if response.status_code == "M_LIMIT_EXCEEDED" or response.retry_after_ms:
+                self._rate_limited(response.retry_after_ms or 5000)
+                continue
+
+            # Other errors, e.g. the user is already in the room, won't go away
+            break
+
+        return error
+
+    def _rate_limited(self, retry_after_ms: int) -> None:
+        """Pause all invites for the time requested by the homeserver"""
+        self.rate_limited += 1
+        self._resume_at = max(self._resume_at, time.monotonic() + retry_after_ms / 1000)
+
+    async def _wait_for_rate_limit(self) -> None:
+        while True:
+            delay = self._resume_at - time.monotonic()
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+    async def _backoff(self, attempt: int) -> None:
+        """Wait before retrying after a connection error"""
+        delay = min(2 ** attempt, 30)
+        await asyncio.sleep(random.uniform(delay / 2, delay))
+
+    def summary(self) -> str:
+        """A summary of the invites, once they are finished"""
+        summary = (
+            f"Invited {self.succeeded}/{self.total} users in {self.duration():.1f}s: "
+            f"{self.failed} failed, {self.retries} retries, "
+            f"{self.rate_limited} rate limited"
+        )
+        if self.errors:
+            errors = sorted(self.errors.items())
+            summary += " (" + ", ".join(f"{e}: {count}" for e, count in errors) + ")"
+
+        return summary
+
+    def duration(self) -> float:
+        if self.started_at is None:
+            return 0.0
+
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "invites_total": self.total,
+            "invites_succeeded": self.succeeded,
+            "invites_failed": self.failed,
+            "invites_retries": self.retries,
+            "invites_rate_limited": self.rate_limited,
+            "invites_seconds": self.duration(),
+        }
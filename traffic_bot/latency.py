@@ -0,0 +1,104 @@
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from traffic_bot.histogram import Histogram
+
+logger = logging.getLogger(__name__)
+
+# Content keys of the measurement data in the messages sent by the bots
+SEQ_KEY = "org.traffic_bot.seq"
+SENT_TS_KEY = "org.traffic_bot.sent_ts"
+
+
+def stamp_content(content: Dict[str, Any], seq: int) -> Dict[str, Any]:
+    """Add a sequence number and the current time to the content of a message, so
+    that its receivers can measure the delivery latency.
+
+    Args:
+        content: The content of the message. Modified in place.
+
+        seq: The sequence number of the message, counted per sender.
+
+    Returns:
+        The content.
+    """
+    content[SEQ_KEY] = seq
+    content[SENT_TS_KEY] = int(time.time() * 1000)
+
+    return content
+
+
+def delivery_latency(content: Dict[str, Any]) -> Optional[int]:
+    """The time since a stamped message was sent, in milliseconds.
+
+    The send time is taken from the clock of the sender, so the clocks of all hosts
+    running bots should be synchronised.
+
+    Args:
+        content: The content of the received message.
+
+    Returns:
+        The latency, or None if the message wasn't stamped.
+    """
+    sent_ts = content.get(SENT_TS_KEY)
+    if not isinstance(sent_ts, int):
+        return None
+
+    return int(time.time() * 1000) - sent_ts
+
+
+class LatencyRecorder:
+    def __init__(self):
+        """Collects the delivery latencies of the messages received by the bots of a
+        process, per room and per sender.
+        """
+        self.total = Histogram()
+        self.rooms = {}  # type: Dict[str, Histogram]
+        self.senders = {}  # type: Dict[str, Histogram]
+
+    def record(self, room_id: str, sender: str, latency: int) -> None:
+        """Record the delivery latency of a message, in milliseconds"""
+        self.total.record(latency)
+
+        histogram = self.rooms.get(room_id)
+        if histogram is None:
+            histogram = self.rooms[room_id] = Histogram()
+        histogram.record(latency)
+
+        histogram = self.senders.get(sender)
+        if histogram is None:
+            histogram = self.senders[sender] = Histogram()
+        histogram.record(latency)
+
+    def summary(self) -> Dict[str, Any]:
+        """The latency percentiles of all messages, and per room and sender"""
+        return {
+            "total": self.total.summary(),
+            "rooms": {
+                room_id: histogram.summary()
+                for room_id, histogram in self.rooms.items()
+            },
+            "senders": {
+                sender: histogram.summary()
+                for sender, histogram in self.senders.items()
+            },
+        }
+
+    def log_summary(self) -> None:
+        """Log the latency percentiles of all messages and per room. The percentiles
+        per sender are logged at debug level, as there can be a lot of senders
+        """
+        if not self.total.count:
+            return
+
+        logger.info("Latency (ms): %s", self.total.summary())
+        for room_id, histogram in self.rooms.items():
+            logger.info("Latency in %s (ms): %s", room_id, histogram.summary())
+
+        if logger.isEnabledFor(logging.DEBUG):
+            for sender, histogram in self.senders.items():
+                logger.debug("Latency from %s (ms): %s", sender, histogram.summary())
+
+    def stats(self) -> Dict[str, float]:
+        return {"latency_samples": self.total.count}
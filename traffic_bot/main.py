@@ -1,74 +1,192 @@
 #!/usr/bin/env python3
+import argparse
 import asyncio
 import logging
 import sys
-from time import sleep
-
-
-from aiohttp import ClientConnectionError, ServerDisconnectedError
-from nio import (
-    AsyncClient,
-    AsyncClientConfig,
-    InviteMemberEvent,
-    LocalProtocolError,
-    LoginError,
-    MegolmEvent,
-    RoomMessageText,
-    UnknownEvent,
-)
-
-from traffic_bot.callbacks import Callbacks
+import uuid
+from typing import Dict, List
+
 from traffic_bot.config import Config
-from traffic_bot.storage import Storage
+from traffic_bot.fleet import Fleet
+from traffic_bot.http_pool import SharedHttpPool
 from traffic_bot.matrix_client import MatrixClient
+from traffic_bot.metrics import MetricsExporter
+from traffic_bot.provisioning import Provisioner
+from traffic_bot.shards import ShardSupervisor, aggregate_stats
+from traffic_bot.storage import Storage
 
 logger = logging.getLogger(__name__)
 
 
-async def main():
-    """The first function that is run when starting the bot"""
+def collect_stats(clients: List[MatrixClient], fleet: Fleet) -> Dict[str, float]:
+    """Sum up the stats of the given clients and add those of the shared services"""
+    stats = aggregate_stats([client.stats() for client in clients])
+    stats["clients"] = len(clients)
+    stats.update(fleet.stats())
 
-    # Read user-configured options from a config file.
-    # A different config file path can be specified as the first command line argument
-    if len(sys.argv) > 1:
-        config_path = sys.argv[1]
-    else:
-        config_path = "config.yaml"
-
-
-    clientList = []
+    return stats
 
 
-    # create admin
+async def report_stats(clients: List[MatrixClient], fleet: Fleet, interval: float):
+    """Periodically log the stats of the clients run by this process"""
+    while True:
+        await asyncio.sleep(interval)
+        logger.info("Stats: %s", collect_stats(clients, fleet))
+        fleet.latency.log_summary()
+        fleet.fanout.log_summary()
 
-    config = Config(config_path, "")
 
-    store = Storage(config.database)
-    client = MatrixClient(store, config, True)
-    clientList.append(client)
+async def report_http_pool_stats(http_pool: SharedHttpPool, interval: float):
+    """Periodically log the connection counters of the shared HTTP pool"""
+    while True:
+        await asyncio.sleep(interval)
+        logger.info("HTTP pool stats: %s", http_pool.stats())
 
 
-    start = int(config.slave_index_start)
-    end = int(config.slave_index_end)
+def create_slaves(
+    config: Config, start: int, end: int, fleet: Fleet, store: Storage
+) -> List[MatrixClient]:
+    """Create the slave clients with the indices [start, end), sharing one storage"""
+    clientList = []
 
-    # create slaves
     for x in range(start, end):
-        # Read the parsed config file and create a Config object
-        config = Config(config_path, str(x))
+        # Derive the slave's config from the already parsed one
+        slave_config = config.for_bot(str(x))
 
-        store = Storage(config.database)
-        client = MatrixClient(store, config, False)
+        client = MatrixClient(store, slave_config, False, fleet)
         clientList.append(client)
 
-        logger.info(f"main loop " + str(x))
+        logger.info(f"Created slave {x}")
 
-    logger.info(f"main 2")
+    return clientList
 
-    await asyncio.gather(
-        *[it.start() for it in clientList])
-    
 
+async def main():
+    """The first function that is run when starting the bot"""
 
+    # Read user-configured options from a config file.
+    # A different config file path can be specified as the first command line argument
+    if len(sys.argv) > 1:
+        config_path = sys.argv[1]
+    else:
+        config_path = "config.yaml"
+
+    # create admin
+
+    config = Config(config_path, "")
 
-# Run the main function in an asyncio event loop
-asyncio.get_event_loop().run_until_complete(main())
+    start = int(config.slave_index_start)
+    end = int(config.slave_index_end)
+    sharded = config.shard_processes > 1
+
+    # One storage, with one pool of connections, for all bots of the process
+    store = Storage(config.database, config.database_pool_size)
+    await store.connect()
+
+    # Results of all processes are stored under the same run
+    run_id = None
+    if config.results_enabled:
+        run_id = uuid.uuid4().hex
+        await store.start_run(run_id, 1 + end - start, config.results_description)
+        logger.info(f"Storing the results of run {run_id}")
+
+    # Slaves started by worker processes have their own fleet
+    fleet = Fleet(config, 1 if sharded else 1 + end - start, run_id=run_id, store=store)
+
+    client = MatrixClient(store, config, True, fleet)
+    clientList = [client]
+
+    # create slaves, either in worker processes or in this event loop
+    tasks = []
+    if sharded:
+        supervisor = ShardSupervisor(config_path, config, run_id)
+        tasks.append(supervisor.run())
+    else:
+        clientList += create_slaves(config, start, end, fleet, store)
+
+    tasks.append(report_stats(clientList, fleet, config.stats_interval))
+    if fleet.http_pool:
+        tasks.append(
+            report_http_pool_stats(fleet.http_pool, config.http_pool_stats_interval)
+        )
+    if config.metrics_enabled:
+        exporter = MetricsExporter(fleet, clientList)
+        tasks.append(exporter.run(config.metrics_host, config.metrics_port))
+    if fleet.results:
+        tasks.append(fleet.results.run())
+    tasks += [it.start() for it in clientList]
+
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        if fleet.results:
+            await fleet.results.close()
+            await store.finish_run(run_id)
+        await store.close()
+
+
+async def provision():
+    """Register the slave accounts of the configured index range, so that they
+    don't need to be registered in a room with `add_zombie` or by hand
+    """
+    parser = argparse.ArgumentParser(
+        prog="traffic-bot provision",
+        description="Pre-register the slave accounts. Users that already exist "
+        "are skipped, and the sessions of new users are stored so that the bots "
+        "don't need to log in on their first start.",
+    )
+    parser.add_argument("config", nargs="?", default="config.yaml")
+    parser.add_argument("--start", type=int, help="Defaults to slave_index_start")
+    parser.add_argument("--end", type=int, help="Defaults to slave_index_end")
+    parser.add_argument(
+        "--master", action="store_true", help="Also register the master account"
+    )
+    parser.add_argument("--concurrency", type=int)
+    parser.add_argument(
+        "--skip-crypto",
+        action="store_true",
+        default=None,
+        help="Don't sync or upload encryption keys",
+    )
+    args = parser.parse_args(sys.argv[2:])
+
+    config = Config(args.config, "")
+    start = config.slave_index_start if args.start is None else args.start
+    end = config.slave_index_end if args.end is None else args.end
+
+    store = Storage(config.database, config.database_pool_size)
+    await store.connect()
+
+    # The registrations share the HTTP pool and request scheduler, if enabled
+    fleet = Fleet(config, 0)
+    provisioner = Provisioner(
+        config,
+        store,
+        concurrency=args.concurrency or config.provisioning_concurrency,
+        max_attempts=config.provisioning_max_attempts,
+        skip_crypto=args.skip_crypto or config.provisioning_skip_crypto,
+        store_sessions=True,
+        fleet=fleet,
+    )
+    try:
+        if args.master:
+            localpart = config.master_user_id[1:].split(":")[0]
+            await provisioner.provision([localpart], config.master_password)
+
+        # The base user ID includes the @ of the user IDs
+        localparts = [
+            config.slave_base_user_id[1:] + str(x) for x in range(int(start), int(end))
+        ]
+        await provisioner.provision(localparts, config.slave_password)
+    finally:
+        if fleet.http_pool:
+            await fleet.http_pool.close()
+        await store.close()
+
+    if provisioner.failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    # Run the main function in an asyncio event loop
+    asyncio.get_event_loop().run_until_complete(main())
@@ -2,44 +2,74 @@
 import asyncio
 import logging
 import sys
-from time import sleep
-from random import randrange
+from typing import Any, Dict, Optional, Union
 
 from aiohttp import ClientConnectionError, ServerDisconnectedError
 from nio import (
-    AsyncClient,
     AsyncClientConfig,
     InviteMemberEvent,
     LocalProtocolError,
     LoginError,
     MegolmEvent,
+    RoomMessageNotice,
     RoomMessageText,
+    SyncError,
     UnknownEvent,
+    UploadFilterError,
 )
 
+from traffic_bot.async_client import TrafficAsyncClient
 from traffic_bot.callbacks import Callbacks
 from traffic_bot.config import Config
+from traffic_bot.fleet import Fleet
+from traffic_bot.ramp import RampScheduler
+from traffic_bot.scheduler import PRIORITY_CONTROL, PRIORITY_TRAFFIC
+from traffic_bot.send_pipeline import SendPipeline
 from traffic_bot.storage import Storage
+from traffic_bot.supervisor import ConnectionSupervisor
+from traffic_bot.sync_filters import build_sync_filter
+from traffic_bot.traffic import TrafficEngine
 
 logger = logging.getLogger(__name__)
 
+# Error codes the homeserver responds with if an access token is not valid (anymore)
+INVALID_TOKEN_ERRCODES = ("M_UNKNOWN_TOKEN", "M_MISSING_TOKEN")
+
 
 class MatrixClient:
     def __init__(
         self,
         store: Storage,
         config: Config,
-        master: bool
+        master: bool,
+        fleet: Optional[Fleet] = None,
     ):
         self.config = config
         self.store = store
+        self.fleet = fleet
+
+        # Filter the syncs of this bot according to its role. The filter is uploaded
+        # once and its ID reused afterwards
+        self.sync_filter = build_sync_filter(
+            self.config.sync_filters["master" if master else "slave"]
+        )
+        self.sync_filter_id = None
+
+        # Without a shared scheduler, clients are admitted without any limits
+        self.ramp = fleet.ramp if fleet else RampScheduler(0, 0, 1)
+        self.online = False
+
+        # Counters reported by stats()
+        self.logins = 0
+        self.restored_logins = 0
+        self.connection_errors = 0
 
         # Configuration options for the AsyncClient
         self.client_config = AsyncClientConfig(
             max_limit_exceeded=0,
             max_timeouts=0,
             store_sync_tokens=True,
-            encryption_enabled=True,
+            encryption_enabled=self.config.encryption_enabled,
         )
 
         self.user_id = self.config.slave_user_id
@@ -49,64 +79,224 @@ class MatrixClient:
             self.user_id = self.config.master_user_id
             self.user_password = self.config.master_password
 
+        self.supervisor = ConnectionSupervisor(
+            self.user_id,
+            base_delay=self.config.reconnect_base_delay,
+            max_delay=self.config.reconnect_max_delay,
+            max_attempts=self.config.reconnect_max_attempts,
+        )
 
         # Initialize the matrix client
-        self.client = AsyncClient(
+        self.client = TrafficAsyncClient(
             self.config.homeserver_url,
             self.user_id,
             device_id=self.config.device_id + self.user_id,
             store_path=self.config.store_path,
             config=self.client_config,
-            ssl=False
+            ssl=False,
+            http_pool=fleet.http_pool if fleet else None,
+            results=fleet.results if fleet else None,
+            scheduler=fleet.scheduler if fleet else None,
+            priority=PRIORITY_CONTROL if master else PRIORITY_TRAFFIC,
         )
+        if fleet:
+            fleet.clients.append(self.client)
 
+        # Messages are sent with several requests in flight, not one per round trip
+        self.pipeline = SendPipeline(self.client, config.send_window)
+
+        # Traffic generation of this bot. Slaves can also be controlled fleet-wide
+        self.traffic = TrafficEngine(
+            self.client,
+            self.pipeline,
+            fleet.traffic.bucket if fleet else None,
+            fleet.payloads if fleet else None,
+        )
+        if fleet and not master:
+            fleet.traffic.register(self.traffic)
 
         # Set up event callbacks
-        callbacks = Callbacks(self.client, store, config, master)
-        self.client.add_event_callback(callbacks.message, (RoomMessageText,))
+        callbacks = Callbacks(self.client, store, config, master, fleet, self.traffic)
+        self.callbacks = callbacks
+        self.client.add_event_callback(
+            callbacks.message, (RoomMessageText, RoomMessageNotice)
+        )
         self.client.add_event_callback(callbacks.invite, (InviteMemberEvent,))
         self.client.add_event_callback(callbacks.decryption_failure, (MegolmEvent,))
         self.client.add_event_callback(callbacks.unknown, (UnknownEvent,))
+        if fleet:
+            if master:
+                fleet.commands.attach_master(self.client)
+            else:
+                fleet.commands.register_slave(config.botId, callbacks)
+
+    def stats(self) -> Dict[str, float]:
+        """Return the counters of this client"""
+        stats = {
+            "logins": self.logins,
+            "restored_logins": self.restored_logins,
+            "connection_errors": self.connection_errors,
+            "online": int(self.online),
+            "full_syncs": self.client.full_syncs,
+            "incremental_syncs": self.client.incremental_syncs,
+            "sync_bytes": self.client.sync_bytes,
+            "full_sync_bytes": self.client.full_sync_bytes,
+            "messages_sent": self.client.messages_sent,
+            "messages_received": self.callbacks.messages_received,
+            "send_errors": sum(self.client.send_errors.values()),
+        }  # type: Dict[str, float]
+        stats.update(self.client.crypto_stats())
+        stats.update(self.supervisor.stats())
+        stats.update(self.traffic.stats())
+        stats.update(self.pipeline.stats())
+
+        return stats
+
+    async def _login(self) -> bool:
+        """Log in, restoring the stored session if there is one. Returns whether it
+        succeeded
+        """
+        session = await self.store.get_session(self.user_id)
+        if session is None:
+            return await self._password_login()
 
+        device_id, access_token = session
+        self.client.restore_login(self.user_id, device_id, access_token)
+        self.restored_logins += 1
+
+        logger.info(f"Restored login of {self.user_id}")
+        return True
+
+    async def _password_login(self) -> bool:
+        """Log in with the configured username/password and store the new session.
+        Returns whether it succeeded
+        """
+        try:
+            login_response = await self.client.login(
+                password=self.user_password,
+                device_name=self.config.device_name,
+            )
+
+            # Check if login failed
+            if type(login_response) == LoginError:
+                logger.error("Failed to login: %s", login_response.message)
+                return False
+        except LocalProtocolError as e:
+            # There's an edge case here where the user hasn't installed the correct C
+            # dependencies. In that case, a LocalProtocolError is raised on login.
+            logger.fatal(
+                "Failed to login. Have you installed the correct dependencies? "
+                "https://github.com/poljar/matrix-nio#installation "
+                "Error: %s",
+                e,
+            )
+            return False
+
+        # Login succeeded!
+        self.logins += 1
+        await self.store.store_session(
+            self.user_id, login_response.device_id, login_response.access_token
+        )
+
+        logger.info(f"Logged in as {self.user_id}")
+        return True
+
+    async def _get_sync_filter(self) -> Union[None, str, Dict[str, Any]]:
+        """Get the filter to sync with, uploading it first if that hasn't happened
+        yet
+        """
+        if self.sync_filter is None or self.sync_filter_id is not None:
+            return self.sync_filter_id
+
+        response = await self.client.upload_filter(**self.sync_filter)
+        if isinstance(response, UploadFilterError):
+            # Send the filter definition with every sync instead
+            logger.warning("Unable to upload sync filter: %s", response.message)
+            return self.sync_filter
+
+        self.sync_filter_id = response.filter_id
+        return self.sync_filter_id
+
+    def _needs_full_state(self) -> bool:
+        """Whether the next sync has to request the full state.
+
+        That is only the case on the very first run of a bot. Otherwise the sync
+        resumes from the last sync token, which is persisted in the store.
+        """
+        return not (self.client.next_batch or self.client.loaded_sync_token)
+
+    async def _connect(self) -> bool:
+        """Log in if necessary and do the initial sync. Returns whether logging in
+        succeeded
+        """
+        # After a reconnect the client is still logged in
+        if not self.client.logged_in and not await self._login():
+            return False
+
+        sync_response = await self.client.sync(
+            timeout=0,
+            sync_filter=await self._get_sync_filter(),
+            full_state=self._needs_full_state(),
+        )
+        if (
+            isinstance(sync_response, SyncError)
+            and sync_response.status_code in INVALID_TOKEN_ERRCODES
+        ):
+            # The stored access token was rejected, log in with the password instead
+            logger.warning(f"Access token of {self.user_id} was rejected")
+            await self.store.delete_session(self.user_id)
+            if not await self._password_login():
+                return False
+
+            sync_response = await self.client.sync(
+                timeout=0,
+                sync_filter=await self._get_sync_filter(),
+                full_state=self._needs_full_state(),
+            )
+
+        if isinstance(sync_response, SyncError):
+            logger.warning(
+                "Initial sync of %s failed: %s", self.user_id, sync_response.message
+            )
+
+        return True
 
     async def start(self):
         logger.info(f"Start {self.user_id}")
-        asyncio.sleep(randrange(10))
         # Keep trying to reconnect on failure (with some time in-between)
         while True:
+            self.supervisor.connecting()
             try:
-                # Try to login with the configured username/password
-                try:
-                    login_response = await self.client.login(
-                        password=self.user_password,
-                        device_name=self.config.device_name,
-                    )
-
-                    # Check if login failed
-                    if type(login_response) == LoginError:
-                        logger.error("Failed to login: %s", login_response.message)
-                        return False
-                except LocalProtocolError as e:
-                    # There's an edge case here where the user hasn't installed the correct C
-                    # dependencies. In that case, a LocalProtocolError is raised on login.
-                    logger.fatal(
-                        "Failed to login. Have you installed the correct dependencies? "
-                        "https://github.com/poljar/matrix-nio#installation "
-                        "Error: %s",
-                        e,
-                    )
-                    return False
+                # Login and initial sync are admitted by the ramp-up scheduler, so
+                # that not every client hits the homeserver at the same time
+                async with self.ramp:
+                    connected = await self._connect()
 
-                # Login succeeded!
+                if not connected:
+                    self.supervisor.failed()
+                    return False
 
-                logger.info(f"Logged in as {self.user_id}")
-                await self.client.sync_forever(timeout=30000, full_state=True)
+                if not self.online:
+                    self.online = True
+                    self.ramp.client_online()
 
-            except (ClientConnectionError, ServerDisconnectedError) as e:
-                logger.warning("Unable to connect to homeserver, retrying in 15s...")
+                self.supervisor.syncing()
+                await self.client.sync_forever(
+                    timeout=30000, sync_filter=await self._get_sync_filter()
+                )
 
-                # Sleep so we don't bombard the server with login requests
-                sleep(1)
+            except (
+                ClientConnectionError,
+                ServerDisconnectedError,
+                asyncio.TimeoutError,
+            ):
+                self.connection_errors += 1
+                logger.warning(f"Lost connection of {self.user_id} to the homeserver")
             finally:
                 # Make sure to close the client connection on disconnect
-                await self.client.close()
\ No newline at end of file
+                await self.client.close()
+
+            # Back off without blocking the other clients, so we don't bombard the
+            # server with login requests
+            if not await self.supervisor.backoff():
+                return False
@@ -0,0 +1,320 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Sequence
+
+from aiohttp import web
+
+from traffic_bot.fleet import Fleet
+from traffic_bot.histogram import Histogram
+from traffic_bot.matrix_client import MatrixClient
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the exported histogram buckets, in milliseconds
+BUCKET_BOUNDS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+# Upper bounds of the exported crypto duration buckets, in microseconds
+CRYPTO_BUCKET_BOUNDS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 50000)
+
+
+class EventLoopMonitor:
+    def __init__(self, interval: float = 0.5):
+        """Measures how late the event loop runs a callback that is due every
+        `interval` seconds. A busy or blocked loop delays every request and sync of
+        the process.
+
+        Args:
+            interval: How often the lag is measured, in seconds.
+        """
+        self.interval = interval
+
+        # Lag in milliseconds
+        self.lag = Histogram()
+        self.last_lag = 0
+        self.max_lag = 0
+
+    async def run(self) -> None:
+        while True:
+            due = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+
+            lag = max(int((time.monotonic() - due) * 1000), 0)
+            self.lag.record(lag)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+
+    escaped = (
+        (key, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels.items()
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+class MetricsWriter:
+    def __init__(self):
+        """Renders metrics in the Prometheus text exposition format"""
+        self.lines = []  # type: List[str]
+
+    def header(self, name: str, metric_type: str, description: str) -> None:
+        self.lines.append(f"# HELP {name} {description}")
+        self.lines.append(f"# TYPE {name} {metric_type}")
+
+    def sample(self, name: str, value: float, **labels: str) -> None:
+        self.lines.append(f"{name}{_labels(labels)} {value}")
+
+    def histogram(
+        self,
+        name: str,
+        histogram: Histogram,
+        scale: float = 0.001,
+        bounds: Sequence[int] = BUCKET_BOUNDS,
+        **labels: str,
+    ) -> None:
+        """Add the samples of a histogram.
+
+        Args:
+            name: The name of the metric.
+
+            histogram: The histogram to export.
+
+            scale: The factor converting the recorded values to the exported unit.
+                Milliseconds to seconds by default.
+
+            bounds: The upper bounds of the exported buckets, in recorded units.
+
+            labels: Labels of the samples.
+        """
+        for bound, count in zip(bounds, histogram.cumulative_counts(bounds)):
+            self.sample(f"{name}_bucket", count, le=f"{bound * scale:g}", **labels)
+        self.sample(f"{name}_bucket", histogram.count, le="+Inf", **labels)
+        self.sample(f"{name}_sum", histogram.total * scale, **labels)
+        self.sample(f"{name}_count", histogram.count, **labels)
+
+    def render(self) -> str:
+        return "\n".join(self.lines) + "\n"
+
+
+class MetricsExporter:
+    def __init__(self, fleet: Fleet, clients: List[MatrixClient]):
+        """Serves the metrics of the bots of a process over HTTP, for Prometheus to
+        scrape.
+
+        The bots only update plain counters and histograms while running. They are
+        read and rendered when the endpoint is scraped.
+
+        Args:
+            fleet: The services shared by all bots of the process.
+
+            clients: The bots of the process.
+        """
+        self.fleet = fleet
+        self.clients = clients
+        self.loop_monitor = EventLoopMonitor()
+
+    async def run(self, host: str, port: int) -> None:
+        """Serve the metrics on http://<host>:<port>/metrics until cancelled"""
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+
+        try:
+            await self.loop_monitor.run()
+        finally:
+            await runner.cleanup()
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(
+            text=self.render(), content_type="text/plain", charset="utf-8"
+        )
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text format"""
+        writer = MetricsWriter()
+        self._render_bots(writer)
+        self._render_fleet(writer)
+
+        return writer.render()
+
+    def _render_bots(self, writer: MetricsWriter) -> None:
+        per_bot = (
+            (
+                "traffic_bot_messages_sent_total",
+                "counter",
+                "Messages sent by the bot",
+                lambda bot: bot.client.messages_sent,
+            ),
+            (
+                "traffic_bot_messages_received_total",
+                "counter",
+                "Messages received by the bot",
+                lambda bot: bot.callbacks.messages_received,
+            ),
+            (
+                "traffic_bot_syncs_total",
+                "counter",
+                "Sync requests of the bot",
+                lambda bot: bot.client.full_syncs + bot.client.incremental_syncs,
+            ),
+            (
+                "traffic_bot_sync_seconds_total",
+                "counter",
+                "Time spent in sync requests, including the long-poll wait",
+                lambda bot: bot.client.sync_duration.total / 1000,
+            ),
+            (
+                "traffic_bot_sync_bytes_total",
+                "counter",
+                "Size of the sync responses received by the bot",
+                lambda bot: bot.client.sync_bytes,
+            ),
+            (
+                "traffic_bot_reconnects_total",
+                "counter",
+                "Reconnects of the bot after losing its connection",
+                lambda bot: bot.supervisor.reconnects,
+            ),
+            (
+                "traffic_bot_online",
+                "gauge",
+                "Whether the bot has logged in and synced",
+                lambda bot: int(bot.online),
+            ),
+        )
+
+        for name, metric_type, description, value in per_bot:
+            writer.header(name, metric_type, description)
+            for bot in self.clients:
+                writer.sample(name, value(bot), bot=bot.user_id)
+
+        name = "traffic_bot_send_errors_total"
+        writer.header(name, "counter", "Failed sends by errcode or exception")
+        for bot in self.clients:
+            for errcode, count in bot.client.send_errors.items():
+                writer.sample(name, count, bot=bot.user_id, errcode=errcode)
+
+        # Merging the sync durations of all bots keeps the number of series low
+        sync_duration = Histogram()
+        for bot in self.clients:
+            sync_duration.merge(bot.client.sync_duration)
+
+        name = "traffic_bot_sync_duration_seconds"
+        writer.header(name, "histogram", "Duration of the sync requests of all bots")
+        writer.histogram(name, sync_duration)
+
+        crypto = {
+            "encrypt": Histogram(),
+            "decrypt": Histogram(),
+            "olm": Histogram(),
+        }  # type: Dict[str, Histogram]
+        for bot in self.clients:
+            crypto["encrypt"].merge(bot.client.encrypt_duration)
+            crypto["decrypt"].merge(bot.client.decrypt_duration)
+            crypto["olm"].merge(bot.client.olm_duration)
+
+        name = "traffic_bot_crypto_duration_seconds"
+        writer.header(
+            name,
+            "histogram",
+            "Time all bots spent encrypting and decrypting each message or event",
+        )
+        for operation, histogram in crypto.items():
+            writer.histogram(
+                name,
+                histogram,
+                scale=1e-6,
+                bounds=CRYPTO_BUCKET_BOUNDS,
+                operation=operation,
+            )
+
+        name = "traffic_bot_decryption_failures_total"
+        writer.header(name, "counter", "Received events that couldn't be decrypted")
+        writer.sample(name, sum(bot.client.decryption_failures for bot in self.clients))
+
+    def _render_fleet(self, writer: MetricsWriter) -> None:
+        latency = self.fleet.latency
+
+        name = "traffic_bot_delivery_latency_seconds"
+        writer.header(name, "histogram", "Time from sending to receiving a message")
+        writer.histogram(name, latency.total, room="all")
+        for room_id, histogram in latency.rooms.items():
+            writer.histogram(name, histogram, room=room_id)
+
+        fanout = self.fleet.fanout
+        fanout.sweep()
+
+        name = "traffic_bot_fanout_latency_seconds"
+        writer.header(
+            name,
+            "histogram",
+            "Time until the first, median and last receiver got a message",
+        )
+        writer.histogram(name, fanout.first, receiver="first")
+        writer.histogram(name, fanout.median, receiver="median")
+        writer.histogram(name, fanout.last, receiver="last")
+
+        name = "traffic_bot_fanout_missing_receivers_total"
+        writer.header(name, "counter", "Receivers that didn't get a message in time")
+        writer.sample(name, fanout.missing_receivers)
+
+        name = "traffic_bot_startup_admission_wait_seconds"
+        writer.header(
+            name, "histogram", "Time the bots waited to log in and do their first sync"
+        )
+        writer.histogram(name, self.fleet.ramp.admission_wait)
+
+        warmup = self.fleet.traffic.warmup
+        if warmup:
+            name = "traffic_bot_key_warmup_seconds"
+            writer.header(
+                name, "histogram", "Time the bots took to share their group sessions"
+            )
+            writer.histogram(name, warmup.durations)
+
+        scheduler = self.fleet.scheduler
+        if scheduler:
+            name = "traffic_bot_scheduler_queue_depth"
+            writer.header(name, "gauge", "Requests waiting for the request scheduler")
+            for request_class in scheduler.classes.values():
+                writer.sample(
+                    name, request_class.queued, request_class=request_class.name
+                )
+
+            name = "traffic_bot_scheduler_rate"
+            writer.header(name, "gauge", "Requests per second admitted (0 = unlimited)")
+            for request_class in scheduler.classes.values():
+                writer.sample(
+                    name, request_class.bucket.rate, request_class=request_class.name
+                )
+
+            name = "traffic_bot_scheduler_rate_limited_total"
+            writer.header(name, "counter", "Requests rate limited by the homeserver")
+            for request_class in scheduler.classes.values():
+                writer.sample(
+                    name, request_class.rate_limited, request_class=request_class.name
+                )
+
+            name = "traffic_bot_scheduler_wait_seconds"
+            writer.header(name, "histogram", "Time requests waited for the scheduler")
+            for request_class in scheduler.classes.values():
+                writer.histogram(
+                    name, request_class.wait, request_class=request_class.name
+                )
+
+        monitor = self.loop_monitor
+
+        name = "traffic_bot_event_loop_lag_seconds"
+        writer.header(name, "histogram", "How late the event loop runs callbacks")
+        writer.histogram(name, monitor.lag)
+
+        name = "traffic_bot_event_loop_lag_max_seconds"
+        writer.header(name, "gauge", "The largest event loop lag measured")
+        writer.sample(name, monitor.max_lag / 1000)
@@ -0,0 +1,141 @@
+import math
+import random
+from typing import Any, Dict, List, Optional
+
+from markdown import markdown
+
+from traffic_bot.latency import stamp_content
+
+# The supported distributions of the message sizes
+DISTRIBUTIONS = ("fixed", "uniform", "lognormal")
+
+# The words message bodies are made of, some of them with markdown
+WORDS = (
+    "the",
+    "bot",
+    "sends",
+    "a",
+    "message",
+    "to",
+    "room",
+    "with",
+    "some",
+    "**bold**",
+    "*italic*",
+    "`code`",
+    "traffic",
+    "and",
+    "latency",
+    "of",
+    "matrix",
+    "[link](https://matrix.org)",
+)
+
+
+class PayloadPool:
+    def __init__(
+        self,
+        distribution: str = "fixed",
+        size: int = 64,
+        min_size: int = 16,
+        max_size: int = 4096,
+        sigma: float = 1.0,
+        pool_size: int = 256,
+        seed: Optional[int] = None,
+    ):
+        """A pool of message contents, built before the traffic starts, with body
+        sizes following a distribution.
+
+        The markdown of the bodies is rendered to their formatted bodies up front, so
+        sending a message only copies a pooled content and stamps its sequence
+        number and send time.
+
+        Args:
+            distribution: How the body sizes are distributed. One of:
+                * fixed: All bodies have `size` characters.
+                * uniform: Evenly distributed between `min_size` and `max_size`.
+                * lognormal: Log-normally distributed around a median of `size`,
+                    with the shape `sigma`, and clipped to `min_size` and
+                    `max_size`. Mostly short messages with a few long ones, like
+                    in a real chat.
+
+            size: The size of the fixed or the median of the lognormal bodies, in
+                characters.
+
+            min_size: The smallest body size of the uniform and lognormal
+                distributions.
+
+            max_size: The largest body size of the uniform and lognormal
+                distributions.
+
+            sigma: The standard deviation of the logarithm of the lognormal body
+                sizes.
+
+            pool_size: The number of pooled contents. Messages cycle through them.
+
+            seed: The seed of the random sizes and bodies, to build the same pool
+                in every run. Random if not set.
+        """
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError(f"Unknown payload distribution '{distribution}'")
+
+        self.distribution = distribution
+        self.size = max(size, 1)
+        self.min_size = max(min(min_size, max_size), 1)
+        self.max_size = max(max_size, self.min_size)
+        self.sigma = sigma
+
+        rng = random.Random(seed)
+        self.contents = []  # type: List[Dict[str, Any]]
+        for _ in range(max(pool_size, 1)):
+            body = self._body(rng, self._size(rng))
+            self.contents.append(
+                {
+                    "msgtype": "m.notice",
+                    "format": "org.matrix.custom.html",
+                    "body": body,
+                    "formatted_body": markdown(body),
+                }
+            )
+
+        # The body sizes, to count the sent bytes without measuring each message
+        self.sizes = [len(content["body"]) for content in self.contents]
+
+    def _size(self, rng: random.Random) -> int:
+        if self.distribution == "uniform":
+            return rng.randint(self.min_size, self.max_size)
+
+        if self.distribution == "lognormal":
+            size = int(rng.lognormvariate(math.log(self.size), self.sigma))
+            return min(max(size, self.min_size), self.max_size)
+
+        return self.size
+
+    @staticmethod
+    def _body(rng: random.Random, size: int) -> str:
+        """Random words with markdown, cut to exactly `size` characters"""
+        words = []  # type: List[str]
+        length = 0
+        while length <= size:
+            word = rng.choice(WORDS)
+            words.append(word)
+            length += len(word) + 1
+
+        return " ".join(words)[:size]
+
+    def content(self, seq: int) -> Dict[str, Any]:
+        """The content of the message with the given sequence number, stamped with
+        it and the current time. The pooled content isn't modified.
+        """
+        return stamp_content(dict(self.contents[seq % len(self.contents)]), seq)
+
+    def body_size(self, seq: int) -> int:
+        """The body size of the message with the given sequence number"""
+        return self.sizes[seq % len(self.sizes)]
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "payload_pool_size": len(self.contents),
+            "payload_mean_bytes": sum(self.sizes) / len(self.sizes),
+            "payload_max_bytes": max(self.sizes),
+        }
@@ -0,0 +1,286 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+from aiohttp import ClientConnectionError, ServerDisconnectedError
+from nio import LoginResponse, RegisterResponse
+
+from traffic_bot.config import Config
+from traffic_bot.fleet import Fleet
+from traffic_bot.register_client import RegisterClient
+from traffic_bot.storage import Storage
+
+logger = logging.getLogger(__name__)
+
+# The outcomes of provisioning a user
+REGISTERED = "registered"
+EXISTS = "exists"
+FAILED = "failed"
+
+
+class ProvisionResult(NamedTuple):
+    user_id: str
+    status: str
+    attempts: int
+    device_id: Optional[str] = None
+    access_token: Optional[str] = None
+    error: Optional[str] = None
+
+
+class Provisioner:
+    def __init__(
+        self,
+        config: Config,
+        store: Storage,
+        concurrency: int = 20,
+        max_attempts: int = 5,
+        skip_crypto: bool = False,
+        store_sessions: bool = False,
+        progress_interval: float = 10,
+        fleet: Optional[Fleet] = None,
+    ):
+        """Registers many users, with a bounded number of registrations in flight.
+
+        Rate limited registrations are retried after the delay requested by the
+        homeserver, and all registrations pause until then, as the limit applies
+        to all of them. Connection errors are retried with a backoff.
+
+        A user is only counted as registered once it is fully set up. If its
+        setup fails, only the setup is retried, and if the response of a
+        registration got lost, the retry logs in to the account that it created.
+
+        Args:
+            config: Bot configuration parameters.
+
+            store: Bot storage.
+
+            concurrency: How many users may be registered at the same time.
+
+            max_attempts: How often the registration of a user is attempted before
+                it is given up.
+
+            skip_crypto: Only create the accounts, without an initial sync and
+                without uploading encryption keys.
+
+            store_sessions: Store the sessions of the registered users, so that
+                the bots don't need to log in on their first start. Users that
+                already have a stored session are skipped. The store must be
+                connected.
+
+            progress_interval: Seconds between logging the progress.
+
+            fleet: The services shared by all bots of the process. The requests
+                go through its HTTP pool and request scheduler, if enabled.
+        """
+        self.config = config
+        self.store = store
+        self.concurrency = max(concurrency, 1)
+        self.max_attempts = max(max_attempts, 1)
+        self.skip_crypto = skip_crypto
+        self.store_sessions = store_sessions
+        self.progress_interval = progress_interval
+        self.fleet = fleet
+
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        # Registrations wait until this time after being rate limited
+        self._resume_at = 0.0
+
+        self.started_at = None  # type: Optional[float]
+        self.finished_at = None  # type: Optional[float]
+        self._last_progress = 0.0
+
+        # Counters reported by stats()
+        self.total = 0
+        self.registered = 0
+        self.existing = 0
+        self.failed = 0
+        self.retries = 0
+        self.rate_limited = 0
+
+    async def provision(
+        self, localparts: List[str], password: str
+    ) -> List[ProvisionResult]:
+        """Register the given users.
+
+        Args:
+            localparts: The localparts of the users.
+
+            password: The password of the new users.
+
+        Returns:
+            The result for each user, in the given order.
+        """
+        if self.started_at is None:
+            self.started_at = self._last_progress = time.monotonic()
+        self.finished_at = None
+        self.total += len(localparts)
+
+        results = await asyncio.gather(
+            *(self._provision_user(localpart, password) for localpart in localparts)
+        )
+
+        self.finished_at = time.monotonic()
+        logger.info(self.summary())
+        for result in results:
+            if result.status == FAILED:
+                logger.warning(
+                    "Failed to provision %s: %s", result.user_id, result.error
+                )
+
+        return results
+
+    async def _provision_user(self, localpart: str, password: str) -> ProvisionResult:
+        async with self._semaphore:
+            result = await self._register(localpart, password)
+            if self.store_sessions and result.status == REGISTERED:
+                await self.store.store_session(
+                    result.user_id, result.device_id, result.access_token
+                )
+
+        if result.status == REGISTERED:
+            self.registered += 1
+        elif result.status == EXISTS:
+            self.existing += 1
+        else:
+            self.failed += 1
+
+        now = time.monotonic()
+        if now - self._last_progress >= self.progress_interval:
+            self._last_progress = now
+            logger.info(self.progress())
+
+        return result
+
+    async def _register(self, localpart: str, password: str) -> ProvisionResult:
+        """Register a user, retrying until it is set up or the attempts run out"""
+        user_id = "@" + localpart + ":" + self.config.homeserver_host
+        if self.store_sessions and await self.store.get_session(user_id):
+            return ProvisionResult(user_id, EXISTS, 0)
+
+        client = RegisterClient(
+            self.store,
+            self.config,
+            localpart,
+            user_id,
+            password,
+            skip_crypto=self.skip_crypto,
+            http_pool=self.fleet.http_pool if self.fleet else None,
+            scheduler=self.fleet.scheduler if self.fleet else None,
+        )
+
+        # Whether the account was created by this or an earlier attempt
+        created = False
+        # Whether an attempt may have created the account without us knowing
+        uncertain = False
+        error = None  # type: Optional[str]
+
+        try:
+            for attempt in range(1, self.max_attempts + 1):
+                if attempt > 1:
+                    self.retries += 1
+                await self._wait_for_rate_limit()
+
+                try:
+                    if not created:
+                        response = await client.register()
+                        if isinstance(response, RegisterResponse):
+                            created = True
+                        elif response.status_code == "M_USER_IN_USE":
+                            if not uncertain:
+                                return ProvisionResult(user_id, EXISTS, attempt)
+
+                            # An earlier attempt created the account
+                            response = await client.login()
+                            if not isinstance(response, LoginResponse):
+                                error = f"Failed to log in: {response.message}"
+                                break
+                            created = True
+                        elif (
+                            response.status_code == "M_LIMIT_EXCEEDED"
+                            or response.retry_after_ms
+                        ):
+                            self._rate_limited(response.retry_after_ms or 5000)
+                            error = str(response)
+                            continue
+                        else:
+                            error = str(response)
+                            break
+
+                    if not self.skip_crypto and not await client.setup():
+                        error = "Failed to upload keys"
+                        await self._backoff(attempt)
+                        continue
+
+                    return ProvisionResult(
+                        user_id,
+                        REGISTERED,
+                        attempt,
+                        client.client.device_id,
+                        client.client.access_token,
+                    )
+                except (
+                    ClientConnectionError,
+                    ServerDisconnectedError,
+                    asyncio.TimeoutError,
+                ) as e:
+                    uncertain = uncertain or not created
+                    error = f"{type(e).__name__}: {e}"
+                    await self._backoff(attempt)
+        finally:
+            await client.close()
+
+        return ProvisionResult(user_id, FAILED, self.max_attempts, error=error)
+
+    def _rate_limited(self, retry_after_ms: int) -> None:
+        """Pause all registrations for the time requested by the homeserver"""
+        self.rate_limited += 1
+        self._resume_at = max(self._resume_at, time.monotonic() + retry_after_ms / 1000)
+
+    async def _wait_for_rate_limit(self) -> None:
+        while True:
+            delay = self._resume_at - time.monotonic()
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+    async def _backoff(self, attempt: int) -> None:
+        """Wait before retrying after a connection error"""
+        delay = min(2 ** attempt, 30)
+        await asyncio.sleep(random.uniform(delay / 2, delay))
+
+    def progress(self) -> str:
+        done = self.registered + self.existing + self.failed
+        elapsed = time.monotonic() - self.started_at
+        return (
+            f"Provisioned {done}/{self.total} users "
+            f"({self.failed} failed, {done / max(elapsed, 0.001):.1f}/s)"
+        )
+
+    def summary(self) -> str:
+        """A summary of the provisioning, once it is finished"""
+        return (
+            f"Provisioned {self.total} users in {self.duration():.1f}s: "
+            f"{self.registered} registered, {self.existing} already existed, "
+            f"{self.failed} failed, {self.retries} retries, "
+            f"{self.rate_limited} rate limited"
+        )
+
+    def duration(self) -> float:
+        if self.started_at is None:
+            return 0.0
+
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "provision_total": self.total,
+            "provision_registered": self.registered,
+            "provision_existing": self.existing,
+            "provision_failed": self.failed,
+            "provision_retries": self.retries,
+            "provision_rate_limited": self.rate_limited,
+            "provision_seconds": self.duration(),
+        }
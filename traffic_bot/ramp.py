@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+
+from traffic_bot.histogram import Histogram
+
+logger = logging.getLogger(__name__)
+
+
+class RampScheduler:
+    def __init__(self, rate: float, max_concurrent: int, expected_clients: int):
+        """Admits clients to login and initial sync at a steady rate, with a cap on how
+        many may be logging in or doing their initial sync at the same time.
+
+        Use it as an async context manager around login and initial sync:
+
+            async with ramp:
+                await client.login(...)
+                await client.sync(...)
+            ramp.client_online()
+
+        Args:
+            rate: How many clients to admit per second. 0 means no rate limit.
+
+            max_concurrent: How many clients may be admitted at the same time.
+                0 means no limit.
+
+            expected_clients: The number of clients that are being started. Once this
+                many clients are online, the time it took is logged.
+        """
+        self.rate = rate
+        self.max_concurrent = max_concurrent
+        self.expected_clients = expected_clients
+
+        self._semaphore = None  # type: Optional[asyncio.Semaphore]
+        if max_concurrent > 0:
+            self._semaphore = asyncio.Semaphore(max_concurrent)
+
+        # The earliest time the next client may be admitted
+        self._next_slot = 0.0
+
+        self.started_at = None  # type: Optional[float]
+        self.online_at = None  # type: Optional[float]
+        self.admitted = 0
+        self.online = 0
+        # How long clients waited to be admitted, in milliseconds
+        self.admission_wait = Histogram()
+
+    async def __aenter__(self):
+        now = time.monotonic()
+        if self.started_at is None:
+            self.started_at = now
+
+        if self.rate > 0:
+            # Reserve the next free slot before sleeping, so that concurrent callers
+            # get consecutive slots
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + 1 / self.rate
+            if slot > now:
+                await asyncio.sleep(slot - now)
+
+        if self._semaphore:
+            await self._semaphore.acquire()
+
+        self.admitted += 1
+        self.admission_wait.record(int((time.monotonic() - now) * 1000))
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self._semaphore:
+            self._semaphore.release()
+
+    def client_online(self) -> None:
+        """Mark a client as online (logged in and initially synced) for the first
+        time
+        """
+        self.online += 1
+
+        if self.online == self.expected_clients:
+            self.online_at = time.monotonic()
+            logger.info(
+                "%d clients online after %.2fs",
+                self.online,
+                self.online_at - self.started_at,
+            )
+
+    def stats(self) -> Dict[str, float]:
+        """Return the progress of the ramp-up"""
+        stats = {
+            "clients_admitted": self.admitted,
+            "clients_online": self.online,
+            "admission_wait_seconds": self.admission_wait.total / 1000,
+        }
+        if self.online_at is not None:
+            stats["startup_seconds"] = self.online_at - self.started_at
+
+        return stats
@@ -1,23 +1,24 @@
 #!/usr/bin/env python3
-import asyncio
 import logging
-import sys
-from time import sleep
+from typing import Optional, Union
 
-from aiohttp import ClientConnectionError, ServerDisconnectedError
 from nio import (
-    AsyncClient,
     AsyncClientConfig,
     InviteMemberEvent,
-    LocalProtocolError,
+    KeysUploadError,
     LoginError,
-    RegisterResponse,
+    LoginResponse,
     MegolmEvent,
+    RegisterResponse,
     RoomMessageText,
     UnknownEvent,
 )
+from nio.responses import RegisterErrorResponse
 
+from traffic_bot.async_client import TrafficAsyncClient
 from traffic_bot.config import Config
+from traffic_bot.http_pool import SharedHttpPool
+from traffic_bot.scheduler import PRIORITY_BULK, RequestScheduler
 from traffic_bot.storage import Storage
 
 logger = logging.getLogger(__name__)
@@ -30,38 +31,63 @@ class RegisterClient:
         config: Config,
         user_id: str,
         username: str,
-        password: str
+        password: str,
+        skip_crypto: bool = False,
+        http_pool: Optional[SharedHttpPool] = None,
+        scheduler: Optional[RequestScheduler] = None,
     ):
+        """Registers a new user.
+
+        Args:
+            store: Bot storage.
+
+            config: Bot configuration parameters.
+
+            user_id: The localpart of the user to register.
+
+            username: The full user ID of the user.
+
+            password: The password of the new user.
+
+            skip_crypto: Only create the account, without an initial sync and
+                without uploading encryption keys.
+
+            http_pool: The shared HTTP pool to send the requests through.
+
+            scheduler: The request scheduler shared by all bots of the process.
+        """
 
         from traffic_bot.callbacks import Callbacks
 
         self.config = config
         self.store = store
+        self.skip_crypto = skip_crypto
 
         # Configuration options for the AsyncClient
         self.client_config = AsyncClientConfig(
             max_limit_exceeded=0,
             max_timeouts=0,
             store_sync_tokens=True,
-            encryption_enabled=True,
+            encryption_enabled=self.config.encryption_enabled and not skip_crypto,
         )
 
         self.user_id = username
         self.user_password = password
         self.user_id_without_host = user_id
 
-
         # Initialize the matrix client
-        self.client = AsyncClient(
+        self.client = TrafficAsyncClient(
             self.config.homeserver_url,
             self.user_id,
             device_id=self.config.device_id + self.user_id,
             store_path=self.config.store_path,
             config=self.client_config,
-            ssl=False
+            ssl=False,
+            http_pool=http_pool,
+            scheduler=scheduler,
+            priority=PRIORITY_BULK,
         )
 
-
         # Set up event callbacks
         callbacks = Callbacks(self.client, store, config, False)
         self.client.add_event_callback(callbacks.message, (RoomMessageText,))
@@ -69,42 +95,36 @@ class RegisterClient:
         self.client.add_event_callback(callbacks.decryption_failure, (MegolmEvent,))
         self.client.add_event_callback(callbacks.unknown, (UnknownEvent,))
 
+    async def register(self) -> Union[RegisterResponse, RegisterErrorResponse]:
+        """Register the user. Rate limit errors are returned rather than retried,
+        so the caller decides when to try again
+        """
+        return await self.client.register(
+            self.user_id_without_host, self.user_password, self.config.device_name
+        )
 
-    async def start(self):
-        logger.info(f"Start {self.user_id}")
-        
-
-        try:
-            register_response = await self.client.register(
-                self.user_id_without_host,
-                self.user_password,
-                self.config.device_name
-            )
-
-            if type(register_response) != RegisterResponse:
-                logger.error("Failed to register: %s", register_response.message)
+    async def login(self) -> Union[LoginResponse, LoginError]:
+        """Log in to an account that was already registered, e.g. by an attempt
+        whose response got lost
+        """
+        return await self.client.login(self.user_password, self.config.device_name)
+
+    async def setup(self) -> bool:
+        """Do the initial sync and upload the encryption keys of the registered
+        user. Connection errors are raised, so that a failed setup can be retried.
+
+        Returns:
+            Whether the keys were uploaded, if encryption is enabled.
+        """
+        await self.client.sync(timeout=30000, full_state=True)
+        if self.client_config.encryption_enabled:
+            response = await self.client.keys_upload()
+            if isinstance(response, KeysUploadError):
+                logger.error("Failed to upload keys: %s", response.message)
                 return False
 
-        except LocalProtocolError as e:
-            # There's an edge case here where the user hasn't installed the correct C
-            # dependencies. In that case, a LocalProtocolError is raised on login.
-            logger.fatal(
-                "Failed to login. Have you installed the correct dependencies? "
-                "https://github.com/poljar/matrix-nio#installation "
-                "Error: %s",
-                e,
-            )
-            return False
-
-        try:
-            # Try to login with the configured username/password
-            logger.info(f"Logged in as {self.user_id}")
-            await self.client.sync(timeout=30000, full_state=True)
-            await self.client.keys_upload()
-
-        except (ClientConnectionError, ServerDisconnectedError):
-            logger.warning("Unable to connect to homeserver...")        
-            
-        finally:
-            logger.info(f"Close connection {self.user_id}")
-            await self.client.close()
\ No newline at end of file
+        return True
+
+    async def close(self) -> None:
+        logger.info(f"Close connection {self.user_id}")
+        await self.client.close()
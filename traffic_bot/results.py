@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from traffic_bot.storage import Storage
+
+logger = logging.getLogger(__name__)
+
+
+class ResultsWriter:
+    def __init__(
+        self,
+        store: Storage,
+        run_id: str,
+        flush_interval: float = 1,
+        batch_size: int = 1000,
+        max_pending: int = 100000,
+    ):
+        """Stores the message and sync samples of a run in the database.
+
+        Recording a sample only appends it to a list. The samples are written in
+        batches, each in one transaction, and the storage never blocks the event
+        loop, so the bots are never blocked by the database.
+
+        Args:
+            store: The connected storage of the process.
+
+            run_id: The ID of the run the samples belong to.
+
+            flush_interval: How often the recorded samples are written, in seconds.
+
+            batch_size: The maximum number of samples written per transaction.
+
+            max_pending: How many samples may wait to be written. Further samples
+                are dropped until the writer has caught up.
+        """
+        self.store = store
+        self.run_id = run_id
+        self.flush_interval = flush_interval
+        self.batch_size = max(batch_size, 1)
+        self.max_pending = max_pending
+
+        self.messages = []  # type: List[Tuple]
+        self.syncs = []  # type: List[Tuple]
+
+        # Only one flush at a time, so samples are written in order
+        self._flush_lock = asyncio.Lock()
+
+        # Counters reported by stats()
+        self.written = 0
+        self.dropped = 0
+        self.write_errors = 0
+        self.write_seconds = 0.0
+
+    def record_message(
+        self,
+        room_id: str,
+        sender: str,
+        receiver: str,
+        seq: Optional[int],
+        sent_ts: int,
+        latency: int,
+    ) -> None:
+        """Record that a bot received a message, with its delivery latency in
+        milliseconds
+        """
+        if len(self.messages) >= self.max_pending:
+            self.dropped += 1
+            return
+
+        self.messages.append(
+            (self.run_id, room_id, sender, receiver, seq, sent_ts, latency)
+        )
+
+    def record_sync(
+        self, user_id: str, ts: int, duration: int, size: int, full_sync: bool
+    ) -> None:
+        """Record a sync request of a bot.
+
+        Args:
+            user_id: The bot.
+
+            ts: When the sync finished, in milliseconds since the epoch.
+
+            duration: How long the sync took, in milliseconds.
+
+            size: The size of the response in bytes.
+
+            full_sync: Whether it was a full sync, without a since token.
+        """
+        if len(self.syncs) >= self.max_pending:
+            self.dropped += 1
+            return
+
+        self.syncs.append((self.run_id, user_id, ts, duration, size, int(full_sync)))
+
+    async def run(self) -> None:
+        """Periodically write the recorded samples until cancelled"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Write all recorded samples"""
+        async with self._flush_lock:
+            messages, self.messages = self.messages, []
+            syncs, self.syncs = self.syncs, []
+            if not messages and not syncs:
+                return
+
+            await self._write(messages, syncs)
+
+    async def close(self) -> None:
+        """Write the remaining samples"""
+        await self.flush()
+
+    async def _write(self, messages: List[Tuple], syncs: List[Tuple]) -> None:
+        """Write samples to the database"""
+        started_at = time.monotonic()
+        try:
+            for start in range(0, len(messages), self.batch_size):
+                batch = messages[start : start + self.batch_size]
+                await self.store.insert_message_samples(batch)
+                self.written += len(batch)
+
+            for start in range(0, len(syncs), self.batch_size):
+                batch = syncs[start : start + self.batch_size]
+                await self.store.insert_sync_samples(batch)
+                self.written += len(batch)
+        except Exception:
+            logger.exception("Unable to write results to the database")
+            self.write_errors += 1
+        finally:
+            self.write_seconds += time.monotonic() - started_at
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "results_pending": len(self.messages) + len(self.syncs),
+            "results_written": self.written,
+            "results_dropped": self.dropped,
+            "results_write_errors": self.write_errors,
+            "results_write_seconds": self.write_seconds,
+        }
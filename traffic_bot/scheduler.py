@@ -0,0 +1,258 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from traffic_bot.histogram import Histogram
+from traffic_bot.token_bucket import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# The classes of requests that are scheduled. Syncs are long-polls and not
+# scheduled
+REQUEST_CLASSES = ("send", "invite", "join", "register", "login", "other")
+
+# Request priorities, lower first. Commands and replies of the master are not
+# held up by the traffic of the slaves, nor either of them by bulk provisioning
+PRIORITY_CONTROL = 0
+PRIORITY_TRAFFIC = 1
+PRIORITY_BULK = 2
+
+
+def classify(method: str, path: str) -> str:
+    """Return the class of a client-server API request"""
+    endpoint = path.partition("?")[0]
+
+    if endpoint.endswith("/sync"):
+        return "sync"
+    if "/rooms/" in endpoint and "/send/" in endpoint:
+        return "send"
+    if endpoint.endswith("/invite"):
+        return "invite"
+    if endpoint.endswith("/join") or "/join/" in endpoint:
+        return "join"
+    if endpoint.endswith("/register"):
+        return "register"
+    if endpoint.endswith("/login"):
+        return "login"
+
+    return "other"
+
+
+class RequestClass:
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        burst: float = 1,
+        min_rate: float = 0.1,
+        increase: float = 1,
+        decrease: float = 0.5,
+    ):
+        """Admits the requests of one class at an adaptive rate, in priority order.
+
+        The rate is adapted additively increasing, multiplicatively decreasing: a
+        rate limited request cuts it by the `decrease` factor and pauses the class
+        for the time requested by the homeserver, and every successful request
+        raises it again, by `increase` requests/s per second at steady state, up to
+        the configured rate.
+
+        Args:
+            name: The name of the class.
+
+            rate: The maximum rate in requests per second. 0 means unlimited until
+                the homeserver rate limits a request.
+
+            burst: How many requests may be admitted at once.
+
+            min_rate: The rate is never decreased below this.
+
+            increase: How fast the rate recovers, in requests/s per second.
+
+            decrease: The factor the rate is multiplied with when rate limited.
+        """
+        self.name = name
+        self.max_rate = rate
+        self.min_rate = min_rate
+        self.increase = increase
+        self.decrease = decrease
+
+        self.bucket = TokenBucket(rate, burst)
+
+        # Waiting requests as (priority, seq, enqueued at, future) entries
+        self._queue = []  # type: List[Tuple[int, int, float, asyncio.Future]]
+        self._seq = itertools.count()
+        self._dispatcher = None  # type: Optional[asyncio.Future]
+
+        # No request is admitted before this time after being rate limited
+        self._paused_until = 0.0
+
+        # Admissions in the current second, to estimate the rate of unlimited
+        # classes when they get rate limited
+        self._window_start = time.monotonic()
+        self._window_admitted = 0
+        self._last_window_rate = 0.0
+
+        # Counters reported by stats(). Wait times are in milliseconds
+        self.admitted = 0
+        self.rate_limited = 0
+        self.retries = 0
+        self.max_queued = 0
+        self.wait = Histogram()
+
+    @property
+    def queued(self) -> int:
+        return len(self._queue)
+
+    async def acquire(self, priority: int = PRIORITY_TRAFFIC) -> None:
+        """Wait until a request of the given priority may be sent"""
+        if (
+            not self._queue
+            and time.monotonic() >= self._paused_until
+            and self.bucket.try_acquire()
+        ):
+            self._admit(0)
+            return
+
+        future = asyncio.get_event_loop().create_future()
+        heapq.heappush(
+            self._queue, (priority, next(self._seq), time.monotonic(), future)
+        )
+        self.max_queued = max(self.max_queued, len(self._queue))
+
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+
+        await future
+
+    async def _dispatch(self) -> None:
+        """Admit the waiting requests, highest priority first"""
+        while self._queue:
+            delay = self._paused_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            await self.bucket.acquire()
+            # A rate limit may have paused the class in the meantime. Return the
+            # token, so the request doesn't wait for another one after the pause
+            if time.monotonic() < self._paused_until:
+                self.bucket.release()
+                continue
+
+            while self._queue:
+                _, _, enqueued_at, future = heapq.heappop(self._queue)
+                # Skip requests that were cancelled while waiting
+                if not future.done():
+                    future.set_result(None)
+                    self._admit(int((time.monotonic() - enqueued_at) * 1000))
+                    break
+
+    def _admit(self, wait: int) -> None:
+        self.admitted += 1
+        self.wait.record(wait)
+
+        now = time.monotonic()
+        if now - self._window_start >= 1:
+            self._last_window_rate = self._window_admitted / (now - self._window_start)
+            self._window_start = now
+            self._window_admitted = 0
+        self._window_admitted += 1
+
+    def succeeded(self) -> None:
+        """Raise the rate after a request was not rate limited"""
+        rate = self.bucket.rate
+        if rate <= 0:
+            return
+
+        rate += self.increase / rate
+        if self.max_rate > 0:
+            rate = min(rate, self.max_rate)
+        self.bucket.set_rate(rate)
+
+    def limit_exceeded(self, retry_after_ms: Optional[int]) -> None:
+        """Cut the rate and pause the class after a request was rate limited"""
+        self.rate_limited += 1
+
+        rate = self.bucket.rate
+        if rate <= 0:
+            # Start from the rate the class was running at
+            rate = max(self._last_window_rate, self._window_admitted)
+        rate = max(rate * self.decrease, self.min_rate)
+        self.bucket.set_rate(rate)
+
+        pause = (retry_after_ms or 1000) / 1000
+        self._paused_until = max(self._paused_until, time.monotonic() + pause)
+
+        logger.debug(
+            "Rate limited %s requests, pausing for %.2fs at %.2f requests/s",
+            self.name,
+            pause,
+            rate,
+        )
+
+    def stats(self) -> Dict[str, float]:
+        prefix = "scheduler_" + self.name
+        return {
+            prefix + "_queued": self.queued,
+            prefix + "_max_queued": self.max_queued,
+            prefix + "_admitted": self.admitted,
+            prefix + "_rate_limited": self.rate_limited,
+            prefix + "_retries": self.retries,
+            prefix + "_wait_ms": self.wait.total,
+            prefix + "_rate": self.bucket.rate,
+        }
+
+
+class RequestScheduler:
+    def __init__(
+        self,
+        rates: Dict[str, float],
+        burst: float = 1,
+        min_rate: float = 0.1,
+        increase: float = 1,
+        decrease: float = 0.5,
+        max_retries: int = 5,
+    ):
+        """Schedules the outgoing requests of all bots of the process, so that a
+        rate limit slows down all bots together instead of each bot retrying on
+        its own.
+
+        Args:
+            rates: The maximum rate of each request class in requests per second.
+                Missing classes or 0 mean unlimited until the homeserver rate
+                limits a request.
+
+            burst: How many requests of a class may be admitted at once.
+
+            min_rate: The rate of a class is never decreased below this.
+
+            increase: How fast the rate of a class recovers after being rate
+                limited, in requests/s per second.
+
+            decrease: The factor the rate of a class is multiplied with when a
+                request is rate limited.
+
+            max_retries: How often a rate limited request is retried before the
+                rate limit error is returned to the bot.
+        """
+        self.max_retries = max_retries
+        self.classes = {
+            name: RequestClass(
+                name, rates.get(name, 0), burst, min_rate, increase, decrease
+            )
+            for name in REQUEST_CLASSES
+        }  # type: Dict[str, RequestClass]
+
+    def request_class(self, method: str, path: str) -> Optional[RequestClass]:
+        """Return the class of a request, or None if it is not scheduled"""
+        return self.classes.get(classify(method, path))
+
+    def stats(self) -> Dict[str, float]:
+        stats = {}  # type: Dict[str, float]
+        for request_class in self.classes.values():
+            stats.update(request_class.stats())
+
+        return stats
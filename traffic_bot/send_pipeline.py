@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import time
+import uuid
+from typing import Any, Dict, NamedTuple, Optional
+
+from aiohttp import ClientConnectionError
+from nio import AsyncClient, RoomSendResponse, SendRetryError
+
+from traffic_bot.payloads import PayloadPool
+
+logger = logging.getLogger(__name__)
+
+
+class InFlightSend(NamedTuple):
+    seq: int
+    room_id: str
+    submitted_at: float
+
+
+class SendPipeline:
+    def __init__(self, client: AsyncClient, window: int):
+        """Sends messages of one bot with up to `window` room_send requests in flight
+        at the same time, instead of waiting for each response before the next send.
+
+        Every message gets a sequence number in submission order and its own
+        transaction ID, so ordering can be reconstructed from the responses.
+
+        Args:
+            client: The client to send the messages with.
+
+            window: The maximum number of requests in flight.
+        """
+        self.client = client
+        self.window = max(window, 1)
+
+        self._slots = asyncio.Semaphore(self.window)
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+        # Transaction ID -> message, for all requests in flight
+        self.in_flight = {}  # type: Dict[str, InFlightSend]
+        self.next_seq = 0
+
+        # Counters reported by stats()
+        self.completed = 0
+        self.failed = 0
+        # Messages that completed after a message with a higher sequence number
+        self.reordered = 0
+        self._highest_completed_seq = -1
+        self._first_submit_at = None  # type: Optional[float]
+        self._last_complete_at = None  # type: Optional[float]
+
+    async def submit(
+        self,
+        room_id: str,
+        content: Dict[str, Any],
+        message_type: str = "m.room.message",
+    ) -> int:
+        """Send a message without waiting for the response. Waits only if the window
+        is full.
+
+        Args:
+            room_id: The room to send the message to.
+
+            content: The content of the message.
+
+            message_type: The event type of the message.
+
+        Returns:
+            The sequence number of the message.
+        """
+        await self._slots.acquire()
+
+        seq = self.next_seq
+        self.next_seq += 1
+        self._start(seq, room_id, content, message_type)
+
+        return seq
+
+    async def submit_payload(self, room_id: str, payloads: PayloadPool) -> int:
+        """Send a message from a payload pool, stamped with its sequence number.
+
+        The sequence numbers of all messages of the bot are counted here, so they
+        increase monotonically across echo commands and traffic runs.
+
+        Args:
+            room_id: The room to send the message to.
+
+            payloads: The pool to take the content of the message from.
+
+        Returns:
+            The sequence number of the message.
+        """
+        await self._slots.acquire()
+
+        seq = self.next_seq
+        self.next_seq += 1
+        self._start(seq, room_id, payloads.content(seq), "m.room.message")
+
+        return seq
+
+    def _start(
+        self, seq: int, room_id: str, content: Dict[str, Any], message_type: str
+    ) -> None:
+        """Send a message in the background, once it has a slot in the window"""
+        now = time.monotonic()
+        if self._first_submit_at is None:
+            self._first_submit_at = now
+
+        txn_id = str(uuid.uuid4())
+        self.in_flight[txn_id] = InFlightSend(seq, room_id, now)
+        self._idle.clear()
+
+        asyncio.ensure_future(self._send(txn_id, room_id, content, message_type))
+
+    async def drain(self) -> None:
+        """Wait until all submitted messages have been sent"""
+        await self._idle.wait()
+
+    async def _send(
+        self, txn_id: str, room_id: str, content: Dict[str, Any], message_type: str
+    ) -> None:
+        response = None
+        try:
+            response = await self.client.room_send(
+                room_id,
+                message_type,
+                content,
+                tx_id=txn_id,
+                ignore_unverified_devices=True,
+            )
+        except (SendRetryError, ClientConnectionError, asyncio.TimeoutError) as e:
+            logger.debug(f"Unable to send message to {room_id}: {e}")
+        except Exception as e:
+            # Nothing awaits the send, so every error has to be counted here
+            logger.warning(f"Unable to send message to {room_id}: {e!r}")
+        finally:
+            sent = self.in_flight.pop(txn_id)
+            self._slots.release()
+            if not self.in_flight:
+                self._idle.set()
+
+        if not isinstance(response, RoomSendResponse):
+            self.failed += 1
+            return
+
+        self.completed += 1
+        self._last_complete_at = time.monotonic()
+
+        if sent.seq < self._highest_completed_seq:
+            self.reordered += 1
+        else:
+            self._highest_completed_seq = sent.seq
+
+    def throughput(self) -> float:
+        """Completed messages per second, from the first submission to the last
+        completion
+        """
+        if self._first_submit_at is None or self._last_complete_at is None:
+            return 0.0
+
+        elapsed = self._last_complete_at - self._first_submit_at
+        if elapsed <= 0:
+            return 0.0
+
+        return self.completed / elapsed
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "sends_in_flight": len(self.in_flight),
+            "sends_completed": self.completed,
+            "sends_failed": self.failed,
+            "sends_reordered": self.reordered,
+            "send_throughput": self.throughput(),
+        }
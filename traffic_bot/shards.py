@@ -0,0 +1,222 @@
+import asyncio
+import logging
+import multiprocessing
+import queue
+import time
+from typing import Dict, List, Optional, Tuple
+
+from traffic_bot.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def split_range(start: int, end: int, shard_count: int) -> List[Tuple[int, int]]:
+    """Split the slave index range [start, end) into contiguous, evenly sized shards
+
+    Args:
+        start: The first slave index.
+
+        end: The slave index after the last one.
+
+        shard_count: The number of shards to split the range into. Fewer shards are
+            returned if there are fewer slaves than shards.
+
+    Returns:
+        A list of (start, end) tuples, one per shard.
+    """
+    total = max(end - start, 0)
+    shard_count = max(min(shard_count, total), 1)
+
+    shards = []
+    base, remainder = divmod(total, shard_count)
+    shard_start = start
+    for index in range(shard_count):
+        size = base + (1 if index < remainder else 0)
+        shards.append((shard_start, shard_start + size))
+        shard_start += size
+
+    return shards
+
+
+def run_shard(
+    config_path: str,
+    shard_index: int,
+    start: int,
+    end: int,
+    stats_queue: multiprocessing.Queue,
+    run_id: Optional[str] = None,
+) -> None:
+    """Entry point of a shard worker process. Runs the slaves [start, end) in their
+    own event loop and periodically reports their stats to the parent process.
+    """
+    # Imported here as traffic_bot.main imports this module
+    from traffic_bot.fleet import Fleet
+    from traffic_bot.main import collect_stats, create_slaves, report_http_pool_stats
+    from traffic_bot.metrics import MetricsExporter
+    from traffic_bot.storage import Storage
+
+    async def run(config):
+        store = Storage(config.database, config.database_pool_size)
+        await store.connect()
+
+        fleet = Fleet(
+            config,
+            end - start,
+            shares=config.shard_processes,
+            run_id=run_id,
+            store=store,
+        )
+        clients = create_slaves(config, start, end, fleet, store)
+
+        tasks = [client.start() for client in clients]
+        tasks.append(report_stats(clients, fleet, config.shard_stats_interval))
+        if fleet.http_pool:
+            interval = config.http_pool_stats_interval
+            tasks.append(report_http_pool_stats(fleet.http_pool, interval))
+        if config.metrics_enabled:
+            # The main process serves the metrics of the master on the configured port
+            port = config.metrics_port + 1 + shard_index
+            exporter = MetricsExporter(fleet, clients)
+            tasks.append(exporter.run(config.metrics_host, port))
+        if fleet.results:
+            tasks.append(fleet.results.run())
+
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            if fleet.results:
+                await fleet.results.close()
+            await store.close()
+
+    async def report_stats(clients, fleet, interval):
+        while True:
+            await asyncio.sleep(interval)
+
+            stats_queue.put((shard_index, collect_stats(clients, fleet)))
+            # Histograms don't add up like the other stats, so each shard logs its own
+            fleet.latency.log_summary()
+            fleet.fanout.log_summary()
+
+    config = Config(config_path, "")
+    logger.info(f"Shard {shard_index} starting slaves {start} to {end - 1}")
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(run(config))
+
+
+def aggregate_stats(stats_list: List[Dict[str, int]]) -> Dict[str, int]:
+    """Sum up a list of stats dictionaries key by key"""
+    total = {}  # type: Dict[str, int]
+    for stats in stats_list:
+        for key, value in stats.items():
+            total[key] = total.get(key, 0) + value
+
+    return total
+
+
+class ShardSupervisor:
+    def __init__(self, config_path: str, config: Config, run_id: Optional[str] = None):
+        """Runs the slaves in worker processes, one shard of the slave index range each.
+
+        Crashed workers are restarted after `sharding.restart_delay` seconds.
+
+        Args:
+            config_path: The path of the config file, passed on to the workers.
+
+            config: Bot configuration parameters.
+
+            run_id: The ID of the run the workers store their results for.
+        """
+        self.config_path = config_path
+        self.config = config
+        self.run_id = run_id
+
+        self.shards = split_range(
+            int(config.slave_index_start),
+            int(config.slave_index_end),
+            config.shard_processes,
+        )
+
+        # Use spawn so that workers don't inherit the parent's event loop and sockets
+        self.context = multiprocessing.get_context("spawn")
+        self.stats_queue = self.context.Queue()
+
+        self.processes = {}  # type: Dict[int, multiprocessing.Process]
+        self.restarts = {index: 0 for index in range(len(self.shards))}
+        self.shard_stats = {}  # type: Dict[int, Dict[str, int]]
+
+    def _start_shard(self, index: int) -> None:
+        start, end = self.shards[index]
+        process = self.context.Process(
+            target=run_shard,
+            args=(
+                self.config_path,
+                index,
+                start,
+                end,
+                self.stats_queue,
+                self.run_id,
+            ),
+            name=f"traffic-bot-shard-{index}",
+            daemon=True,
+        )
+        process.start()
+        self.processes[index] = process
+
+        logger.info(
+            f"Started shard {index} (slaves {start} to {end - 1}) as pid {process.pid}"
+        )
+
+    def _drain_stats(self) -> None:
+        while True:
+            try:
+                index, stats = self.stats_queue.get_nowait()
+            except queue.Empty:
+                return
+            self.shard_stats[index] = stats
+
+    def stats(self) -> Dict[str, int]:
+        """The latest stats of all shards, summed up"""
+        stats = aggregate_stats(list(self.shard_stats.values()))
+        stats["shards"] = len(self.shards)
+        stats["shards_alive"] = sum(p.is_alive() for p in self.processes.values())
+        stats["shard_restarts"] = sum(self.restarts.values())
+        return stats
+
+    async def run(self) -> None:
+        """Start all shards and supervise them until cancelled"""
+        for index in range(len(self.shards)):
+            self._start_shard(index)
+
+        # When a crashed shard may be restarted
+        restart_at = {}  # type: Dict[int, float]
+        last_report = time.monotonic()
+
+        try:
+            while True:
+                await asyncio.sleep(1)
+                self._drain_stats()
+
+                now = time.monotonic()
+                for index, process in self.processes.items():
+                    if process.is_alive():
+                        continue
+
+                    if index not in restart_at:
+                        logger.error(
+                            f"Shard {index} exited with code {process.exitcode}, "
+                            f"restarting in {self.config.shard_restart_delay}s"
+                        )
+                        restart_at[index] = now + self.config.shard_restart_delay
+                    elif now >= restart_at[index]:
+                        del restart_at[index]
+                        self.restarts[index] += 1
+                        self._start_shard(index)
+
+                if now - last_report >= self.config.shard_stats_interval:
+                    last_report = now
+                    logger.info("Shard stats: %s", self.stats())
+        finally:
+            for process in self.processes.values():
+                process.terminate()
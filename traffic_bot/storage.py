@@ -1,5 +1,9 @@
+import asyncio
 import logging
-from typing import Any, Dict
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
 
 # The latest migration version of the database.
 #
@@ -8,69 +12,123 @@ from typing import Any, Dict
 # the version specified here.
 #
 # When a migration is performed, the `migration_version` table should be incremented.
-latest_migration_version = 0
+latest_migration_version = 2
 
 logger = logging.getLogger(__name__)
 
 
+def _postgres_query(query: str) -> str:
+    """Transform the ? placeholders of a query to the $1, $2, ... of asyncpg"""
+    counter = iter(range(1, query.count("?") + 1))
+    return re.sub(r"\?", lambda _: f"${next(counter)}", query)
+
+
 class Storage:
-    def __init__(self, database_config: Dict[str, str]):
-        """Setup the database.
+    def __init__(self, database_config: Dict[str, str], pool_size: int = 10):
+        """Setup the database. Nothing is opened until `connect` is called, so
+        storages that are never used cost no connections.
 
-        Runs an initial setup or migrations depending on whether a database file has already
-        been created.
+        SQLite is accessed by a single thread of its own, and Postgres through a
+        pool of asyncpg connections, so queries never block the event loop. All
+        bots of a process should share one Storage.
 
         Args:
             database_config: a dictionary containing the following keys:
                 * type: A string, one of "sqlite" or "postgres".
                 * connection_string: A string, featuring a connection string that
                     be fed to each respective db library's `connect` method.
+
+            pool_size: The maximum number of Postgres connections.
         """
-        self.conn = self._get_database_connection(
-            database_config["type"], database_config["connection_string"]
-        )
-        self.cursor = self.conn.cursor()
         self.db_type = database_config["type"]
+        self.connection_string = database_config["connection_string"]
+        self.pool_size = pool_size
+
+        # SQLite: one connection, only used by the storage thread
+        self.conn = None  # type: Any
+        self.cursor = None  # type: Any
+        self._executor = None  # type: Optional[ThreadPoolExecutor]
+
+        # Postgres: a pool of asyncpg connections
+        self.pool = None  # type: Any
+
+    async def connect(self) -> None:
+        """Connect to the database.
+
+        Runs an initial setup or migrations depending on whether a database file has
+        already been created.
+        """
+        if self.db_type == "sqlite":
+            self._executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="storage"
+            )
+            await self._in_thread(self._connect_sqlite)
+        elif self.db_type == "postgres":
+            import asyncpg
+
+            # asyncpg prepares every query and caches the prepared statement per
+            # connection, so repeated queries are only parsed once
+            self.pool = await asyncpg.create_pool(
+                self.connection_string, min_size=1, max_size=self.pool_size
+            )
 
         # Try to check the current migration version
         migration_level = 0
         try:
-            self._execute("SELECT version FROM migration_version")
-            row = self.cursor.fetchone()
-            migration_level = row[0]
+            row = await self._fetchone("SELECT version FROM migration_version")
         except Exception:
-            self._initial_setup()
-        finally:
-            if migration_level < latest_migration_version:
-                self._run_migrations(migration_level)
+            await self._initial_setup()
+        else:
+            if row is None:
+                # The setup was interrupted before the version was stored
+                await self._execute(
+                    "INSERT INTO migration_version (version) VALUES (?)", (0,)
+                )
+            else:
+                migration_level = row[0]
+
+        if migration_level < latest_migration_version:
+            await self._run_migrations(migration_level)
 
         logger.info(f"Database initialization of type '{self.db_type}' complete")
 
-    def _get_database_connection(
-        self, database_type: str, connection_string: str
-    ) -> Any:
-        """Creates and returns a connection to the database"""
-        if database_type == "sqlite":
-            import sqlite3
+    async def close(self) -> None:
+        """Close the connections to the database"""
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
 
-            # Initialize a connection to the database, with autocommit on
-            return sqlite3.connect(connection_string, isolation_level=None)
-        elif database_type == "postgres":
-            import psycopg2
+        if self._executor is not None:
+            await self._in_thread(self.conn.close)
+            self._executor.shutdown(wait=True)
+            self._executor = None
 
-            conn = psycopg2.connect(connection_string)
+    def _connect_sqlite(self) -> None:
+        """Open the SQLite connection. Runs in the storage thread"""
+        import sqlite3
+
+        # Initialize a connection to the database, with autocommit on
+        self.conn = sqlite3.connect(
+            self.connection_string, isolation_level=None, timeout=30
+        )
+        self.cursor = self.conn.cursor()
 
-            # Autocommit on
-            conn.set_isolation_level(0)
+        # Let the bots of all processes share the database without blocking each
+        # other's reads
+        self.cursor.execute("PRAGMA journal_mode=WAL")
+        self.cursor.execute("PRAGMA synchronous=NORMAL")
 
-            return conn
+    async def _in_thread(self, function: Callable, *args) -> Any:
+        """Run a function in the storage thread"""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._executor, function, *args)
 
-    def _initial_setup(self) -> None:
+    async def _initial_setup(self) -> None:
         """Initial setup of the database"""
         logger.info("Performing initial database setup...")
 
         # Set up the migration_version table
-        self._execute(
+        await self._execute(
             """
             CREATE TABLE migration_version (
                 version INTEGER PRIMARY KEY
@@ -79,7 +137,7 @@ class Storage:
         )
 
         # Initially set the migration version to 0
-        self._execute(
+        await self._execute(
             """
             INSERT INTO migration_version (
                 version
@@ -92,7 +150,7 @@ class Storage:
 
         logger.info("Database setup complete")
 
-    def _run_migrations(self, current_migration_version: int) -> None:
+    async def _run_migrations(self, current_migration_version: int) -> None:
         """Execute database migrations. Migrates the database to the
         `latest_migration_version`.
 
@@ -102,25 +160,248 @@ class Storage:
         """
         logger.debug("Checking for necessary database migrations...")
 
-        # if current_migration_version < 1:
-        #    logger.info("Migrating the database from v0 to v1...")
-        #
-        #    # Add new table, delete old ones, etc.
-        #
-        #    # Update the stored migration version
-        #    self._execute("UPDATE migration_version SET version = 1")
-        #
-        #    logger.info("Database migrated to v1")
+        if current_migration_version < 1:
+            logger.info("Migrating the database from v0 to v1...")
+
+            # Add a table for the access tokens and device IDs of the bots
+            await self._execute(
+                """
+                CREATE TABLE session (
+                    user_id TEXT PRIMARY KEY,
+                    device_id TEXT NOT NULL,
+                    access_token TEXT NOT NULL
+                )
+            """
+            )
+
+            # Update the stored migration version
+            await self._execute("UPDATE migration_version SET version = 1")
+
+            logger.info("Database migrated to v1")
 
-    def _execute(self, *args) -> None:
-        """A wrapper around cursor.execute that transforms placeholder ?'s to %s for postgres.
+        if current_migration_version < 2:
+            logger.info("Migrating the database from v1 to v2...")
 
-        This allows for the support of queries that are compatible with both postgres and sqlite.
+            # Add tables for the results of load test runs. Timestamps are in
+            # milliseconds since the epoch
+            await self._execute(
+                """
+                CREATE TABLE run (
+                    run_id TEXT PRIMARY KEY,
+                    started_ts BIGINT NOT NULL,
+                    finished_ts BIGINT,
+                    clients INTEGER NOT NULL,
+                    description TEXT
+                )
+            """
+            )
+            await self._execute(
+                """
+                CREATE TABLE message_sample (
+                    run_id TEXT NOT NULL,
+                    room_id TEXT NOT NULL,
+                    sender TEXT NOT NULL,
+                    receiver TEXT NOT NULL,
+                    seq INTEGER,
+                    sent_ts BIGINT NOT NULL,
+                    latency_ms INTEGER NOT NULL
+                )
+            """
+            )
+            await self._execute(
+                """
+                CREATE TABLE sync_sample (
+                    run_id TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    ts BIGINT NOT NULL,
+                    duration_ms INTEGER NOT NULL,
+                    bytes INTEGER NOT NULL,
+                    full_sync INTEGER NOT NULL
+                )
+            """
+            )
+            await self._execute(
+                "CREATE INDEX message_sample_run ON message_sample (run_id)"
+            )
+            await self._execute("CREATE INDEX sync_sample_run ON sync_sample (run_id)")
+
+            # Update the stored migration version
+            await self._execute("UPDATE migration_version SET version = 2")
+
+            logger.info("Database migrated to v2")
+
+    async def _execute(self, query: str, params: Sequence[Any] = ()) -> None:
+        """Execute a query. Queries use ? placeholders, which are transformed for
+        Postgres.
+
+        This allows for the support of queries that are compatible with both
+        postgres and sqlite.
 
         Args:
-            args: Arguments passed to cursor.execute.
+            query: The query.
+
+            params: The values of the placeholders.
         """
         if self.db_type == "postgres":
-            self.cursor.execute(args[0].replace("?", "%s"), *args[1:])
+            await self.pool.execute(_postgres_query(query), *params)
         else:
-            self.cursor.execute(*args)
+            await self._in_thread(self.cursor.execute, query, params)
+
+    async def _fetchone(
+        self, query: str, params: Sequence[Any] = ()
+    ) -> Optional[Sequence[Any]]:
+        """Execute a query and return its first row, or None if there is none"""
+        if self.db_type == "postgres":
+            return await self.pool.fetchrow(_postgres_query(query), *params)
+
+        def fetchone():
+            self.cursor.execute(query, params)
+            return self.cursor.fetchone()
+
+        return await self._in_thread(fetchone)
+
+    async def _execute_batch(self, query: str, rows: Sequence[Sequence[Any]]) -> None:
+        """Run a query for each of the given rows, in a single transaction.
+
+        Args:
+            query: The query, with ? placeholders.
+
+            rows: The parameters of each execution.
+        """
+        if self.db_type == "postgres":
+            async with self.pool.acquire() as conn:
+                async with conn.transaction():
+                    await conn.executemany(_postgres_query(query), rows)
+            return
+
+        def execute_batch():
+            self.cursor.execute("BEGIN")
+            try:
+                self.cursor.executemany(query, rows)
+            except Exception:
+                self.cursor.execute("ROLLBACK")
+                raise
+            self.cursor.execute("COMMIT")
+
+        await self._in_thread(execute_batch)
+
+    async def get_session(self, user_id: str) -> Optional[Tuple[str, str]]:
+        """Get the stored login session of a user.
+
+        Args:
+            user_id: The user ID of the bot.
+
+        Returns:
+            A (device_id, access_token) tuple, or None if no session is stored.
+        """
+        row = await self._fetchone(
+            "SELECT device_id, access_token FROM session WHERE user_id = ?",
+            (user_id,),
+        )
+        if row is None:
+            return None
+
+        return row[0], row[1]
+
+    async def store_session(
+        self, user_id: str, device_id: str, access_token: str
+    ) -> None:
+        """Store the login session of a user, replacing any existing one.
+
+        Args:
+            user_id: The user ID of the bot.
+
+            device_id: The device ID that was logged in.
+
+            access_token: The access token of the device.
+        """
+        await self.delete_session(user_id)
+        await self._execute(
+            """
+            INSERT INTO session (
+                user_id,
+                device_id,
+                access_token
+            ) VALUES (?, ?, ?)
+        """,
+            (user_id, device_id, access_token),
+        )
+
+    async def delete_session(self, user_id: str) -> None:
+        """Forget the stored login session of a user.
+
+        Args:
+            user_id: The user ID of the bot.
+        """
+        await self._execute("DELETE FROM session WHERE user_id = ?", (user_id,))
+
+    async def start_run(self, run_id: str, clients: int, description: str = "") -> None:
+        """Record the start of a load test run.
+
+        Args:
+            run_id: The unique ID of the run.
+
+            clients: The number of bots taking part.
+
+            description: A description of the run, e.g. what is being tested.
+        """
+        await self._execute(
+            """
+            INSERT INTO run (
+                run_id,
+                started_ts,
+                clients,
+                description
+            ) VALUES (?, ?, ?, ?)
+        """,
+            (run_id, int(time.time() * 1000), clients, description),
+        )
+
+    async def finish_run(self, run_id: str) -> None:
+        """Record the end of a load test run"""
+        await self._execute(
+            "UPDATE run SET finished_ts = ? WHERE run_id = ?",
+            (int(time.time() * 1000), run_id),
+        )
+
+    async def insert_message_samples(self, rows: Sequence[Tuple]) -> None:
+        """Store message samples in a single transaction.
+
+        Args:
+            rows: (run_id, room_id, sender, receiver, seq, sent_ts, latency_ms)
+                tuples.
+        """
+        await self._execute_batch(
+            """
+            INSERT INTO message_sample (
+                run_id,
+                room_id,
+                sender,
+                receiver,
+                seq,
+                sent_ts,
+                latency_ms
+            ) VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+            rows,
+        )
+
+    async def insert_sync_samples(self, rows: Sequence[Tuple]) -> None:
+        """Store sync samples in a single transaction.
+
+        Args:
+            rows: (run_id, user_id, ts, duration_ms, bytes, full_sync) tuples.
+        """
+        await self._execute_batch(
+            """
+            INSERT INTO sync_sample (
+                run_id,
+                user_id,
+                ts,
+                duration_ms,
+                bytes,
+                full_sync
+            ) VALUES (?, ?, ?, ?, ?, ?)
+        """,
+            rows,
+        )
@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import random
+import time
+from enum import Enum
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# The backoff delay stops doubling after this many failures
+MAX_BACKOFF_EXPONENT = 32
+
+
+class ConnectionState(Enum):
+    CONNECTING = "connecting"
+    SYNCING = "syncing"
+    BACKOFF = "backoff"
+    FAILED = "failed"
+
+
+class ConnectionSupervisor:
+    def __init__(
+        self,
+        name: str,
+        base_delay: float = 1,
+        max_delay: float = 60,
+        max_attempts: int = 0,
+    ):
+        """Tracks the connection state of a client and spaces out its reconnects with
+        exponential backoff and full jitter. Waiting never blocks the event loop.
+
+        Args:
+            name: The name of the client, used in log messages.
+
+            base_delay: The backoff delay after the first failure, in seconds.
+
+            max_delay: The upper bound of the backoff delay, in seconds.
+
+            max_attempts: How many consecutive failures to retry before giving up.
+                0 means retry forever.
+        """
+        self.name = name
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+
+        self.state = ConnectionState.CONNECTING
+        self.consecutive_failures = 0
+
+        # When the connection was lost, if it is currently lost
+        self._disconnected_at = None  # type: Optional[float]
+
+        # Counters reported by stats()
+        self.reconnects = 0
+        self.reconnect_seconds = 0.0
+        self.backoff_seconds = 0.0
+
+    def connecting(self) -> None:
+        """The client is (re)connecting: logging in and doing its initial sync"""
+        self.state = ConnectionState.CONNECTING
+
+    def syncing(self) -> None:
+        """The client is connected and syncing"""
+        if self._disconnected_at is not None:
+            # Count the time from losing the connection to syncing again
+            self.reconnects += 1
+            self.reconnect_seconds += time.monotonic() - self._disconnected_at
+            self._disconnected_at = None
+
+        self.state = ConnectionState.SYNCING
+        self.consecutive_failures = 0
+
+    def failed(self) -> None:
+        """The client gave up and won't reconnect anymore"""
+        self.state = ConnectionState.FAILED
+
+    async def backoff(self) -> bool:
+        """Wait before the next reconnect attempt after the connection was lost.
+
+        Returns:
+            False if the client should give up instead of reconnecting.
+        """
+        if self._disconnected_at is None:
+            self._disconnected_at = time.monotonic()
+
+        self.consecutive_failures += 1
+        if self.max_attempts and self.consecutive_failures > self.max_attempts:
+            logger.error(
+                f"Giving up on {self.name} after {self.max_attempts} failed attempts"
+            )
+            self.failed()
+            return False
+
+        # Full jitter: spread the reconnects of all clients over the whole window.
+        # The exponent is capped, as the window would overflow a float after about
+        # a thousand failures and long reached max_delay anyway
+        exponent = min(self.consecutive_failures - 1, MAX_BACKOFF_EXPONENT)
+        window = min(self.max_delay, self.base_delay * 2 ** exponent)
+        delay = random.uniform(0, window)
+
+        logger.warning(f"Reconnecting {self.name} in {delay:.1f}s")
+
+        self.state = ConnectionState.BACKOFF
+        await asyncio.sleep(delay)
+        self.backoff_seconds += delay
+
+        return True
+
+    def stats(self) -> Dict[str, float]:
+        """Return the reconnect counters, and a 0/1 flag per connection state so that
+        the stats of many clients add up to the number of clients in each state
+        """
+        stats = {
+            "reconnects": self.reconnects,
+            "reconnect_seconds": self.reconnect_seconds,
+            "backoff_seconds": self.backoff_seconds,
+        }  # type: Dict[str, float]
+        for state in ConnectionState:
+            stats["state_" + state.value] = int(self.state == state)
+
+        return stats
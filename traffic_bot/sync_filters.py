@@ -0,0 +1,53 @@
+from typing import Any, Dict, Optional
+
+# Event filter that lets no events through
+NO_EVENTS = {"types": []}  # type: Dict[str, Any]
+
+
+def build_sync_filter(profile: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Build a sync filter definition from a filter profile of the config file.
+
+    Args:
+        profile: The `sync_filter.master` or `sync_filter.slave` config section.
+            Supported keys are:
+                * enabled: Whether to filter syncs at all. Defaults to false.
+                * timeline_limit: The maximum number of timeline events per room.
+                * lazy_load_members: Only sync the members of the senders of the
+                    events in the timeline. Defaults to true.
+                * presence: Whether to sync presence updates. Defaults to false.
+                * account_data: Whether to sync global and room account data.
+                    Defaults to false.
+                * ephemeral: Whether to sync ephemeral events such as typing
+                    notifications and receipts. Defaults to false.
+
+    Returns:
+        A filter definition to upload to the homeserver, or None if syncs should not
+        be filtered.
+    """
+    if not profile or not profile.get("enabled", False):
+        return None
+
+    lazy_load_members = profile.get("lazy_load_members", True)
+
+    room_filter = {
+        "state": {"lazy_load_members": lazy_load_members},
+        "timeline": {"lazy_load_members": lazy_load_members},
+    }  # type: Dict[str, Any]
+
+    timeline_limit = profile.get("timeline_limit")
+    if timeline_limit is not None:
+        room_filter["timeline"]["limit"] = timeline_limit
+
+    if not profile.get("ephemeral", False):
+        room_filter["ephemeral"] = NO_EVENTS
+
+    sync_filter = {"room": room_filter}  # type: Dict[str, Any]
+
+    if not profile.get("presence", False):
+        sync_filter["presence"] = NO_EVENTS
+
+    if not profile.get("account_data", False):
+        sync_filter["account_data"] = NO_EVENTS
+        room_filter["account_data"] = NO_EVENTS
+
+    return sync_filter
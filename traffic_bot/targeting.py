@@ -0,0 +1,137 @@
+import functools
+import re
+from typing import Dict, FrozenSet, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# The supported target expressions, at the start of a slave command
+_TARGET = re.compile(
+    r"""
+    (?P<single>\d+)
+    | \[ \s* (?P<start>\d+) \s* - \s* (?P<end>\d+) \s* \]
+    | \{ (?P<set>[\d\s,]*) \}
+    | % \s* (?P<modulus>\d+) \s* = \s* (?P<remainder>\d+)
+    """,
+    re.VERBOSE,
+)
+
+
+class Target:
+    def __init__(
+        self,
+        expression: str,
+        ids: Optional[FrozenSet[int]] = None,
+        start: int = 0,
+        end: int = -1,
+        modulus: int = 0,
+        remainder: int = 0,
+    ):
+        """A compiled target expression, selecting slaves by their bot id.
+
+        Args:
+            expression: The expression the target was compiled from.
+
+            ids: The ids of a set (or single id) target.
+
+            start: The first id of a range target.
+
+            end: The last id of a range target, inclusive.
+
+            modulus: The modulus of a modulo target.
+
+            remainder: The remainder of the ids selected by a modulo target.
+        """
+        self.expression = expression
+        self.ids = ids
+        self.start = start
+        self.end = end
+        self.modulus = modulus
+        self.remainder = remainder
+
+    def matches(self, bot_id) -> bool:
+        """Whether the slave with the given bot id is targeted"""
+        try:
+            bot_id = int(bot_id)
+        except ValueError:
+            return False
+
+        if self.ids is not None:
+            return bot_id in self.ids
+        if self.modulus:
+            return bot_id % self.modulus == self.remainder
+
+        return self.start <= bot_id <= self.end
+
+    def select(self, slaves: Dict[str, T]) -> List[T]:
+        """Return the targeted slaves out of those keyed by their bot id"""
+        if self.ids is not None and len(self.ids) < len(slaves):
+            # Look up the few targeted ids instead of testing every slave
+            selected = (slaves.get(str(bot_id)) for bot_id in sorted(self.ids))
+            return [slave for slave in selected if slave is not None]
+
+        return [slave for bot_id, slave in slaves.items() if self.matches(bot_id)]
+
+    def __repr__(self) -> str:
+        return f"Target({self.expression!r})"
+
+
+@functools.lru_cache(maxsize=256)
+def compile_target(expression: str) -> Target:
+    """Compile a target expression:
+
+        42          the slave with id 42
+        [0-499]     the slaves with ids 0 to 499, inclusive
+        {3,7,42}    the slaves with ids 3, 7 and 42
+        %4=1        the slaves whose id modulo 4 is 1
+
+    Compiled targets are cached, so repeated commands aren't parsed again.
+
+    Raises:
+        ValueError: If the expression is invalid.
+    """
+    match = _TARGET.fullmatch(expression.strip())
+    if match is None:
+        raise ValueError(f"Invalid target expression '{expression}'")
+
+    if match.group("single") is not None:
+        return Target(expression, ids=frozenset([int(match.group("single"))]))
+
+    if match.group("start") is not None:
+        start, end = int(match.group("start")), int(match.group("end"))
+        if start > end:
+            raise ValueError(f"Empty target range '{expression}'")
+        return Target(expression, start=start, end=end)
+
+    if match.group("set") is not None:
+        ids = [part.strip() for part in match.group("set").split(",")]
+        if not all(ids):
+            raise ValueError(f"Invalid target set '{expression}'")
+        return Target(expression, ids=frozenset(int(bot_id) for bot_id in ids))
+
+    modulus, remainder = int(match.group("modulus")), int(match.group("remainder"))
+    if modulus == 0:
+        raise ValueError(f"Invalid target modulus '{expression}'")
+    return Target(expression, modulus=modulus, remainder=remainder)
+
+
+def parse_target(command: str) -> Tuple[Optional[Target], str]:
+    """Split the target expression off the start of a slave command.
+
+    Args:
+        command: The slave command, without the command prefix.
+
+    Returns:
+        The compiled target, or None if all slaves are targeted, and the rest of the
+        command.
+
+    Raises:
+        ValueError: If the command starts with an invalid target expression.
+    """
+    if not command or command[0] not in "0123456789[{%":
+        return None, command.strip()
+
+    match = _TARGET.match(command)
+    if match is None:
+        raise ValueError(f"Invalid target expression in '{command}'")
+
+    return compile_target(match.group()), command[match.end() :].strip()
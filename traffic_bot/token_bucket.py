@@ -0,0 +1,70 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate: float = 0, burst: float = 1):
+        """A token bucket for coroutines.
+
+        Callers that find the bucket empty reserve a token ahead of time and sleep until
+        it has been refilled, so waiters are served in order without polling.
+
+        Args:
+            rate: The number of tokens added per second. 0 means unlimited.
+
+            burst: The maximum number of tokens the bucket holds.
+        """
+        self.rate = rate
+        self.burst = burst
+
+        self._tokens = burst
+        self._updated = time.monotonic()
+
+    def set_rate(self, rate: float) -> None:
+        """Change the refill rate. 0 means unlimited"""
+        self._refill()
+        self.rate = rate
+
+    def set_burst(self, burst: float) -> None:
+        """Change the maximum number of tokens, and fill the bucket up to it"""
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        if self.rate > 0:
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+        self._updated = now
+
+    def try_acquire(self) -> bool:
+        """Take a token from the bucket if one is available right away"""
+        if self.rate <= 0:
+            return True
+
+        self._refill()
+        if self._tokens < 1:
+            return False
+
+        self._tokens -= 1
+        return True
+
+    async def acquire(self) -> None:
+        """Take a token from the bucket, waiting until one is available"""
+        if self.rate <= 0:
+            return
+
+        self._refill()
+        self._tokens -= 1
+        if self._tokens < 0:
+            await asyncio.sleep(-self._tokens / self.rate)
+
+    def release(self) -> None:
+        """Put back a token that was acquired but not used"""
+        if self.rate <= 0:
+            return
+
+        self._refill()
+        self._tokens = min(self.burst, self._tokens + 1)
@@ -0,0 +1,282 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Dict, List, Optional
+
+from nio import AsyncClient
+
+from traffic_bot.payloads import PayloadPool
+from traffic_bot.send_pipeline import SendPipeline
+from traffic_bot.token_bucket import TokenBucket
+from traffic_bot.warmup import KeyWarmup
+
+logger = logging.getLogger(__name__)
+
+# The supported arrival profiles
+PROFILES = ("constant", "poisson", "burst")
+
+
+class TrafficEngine:
+    def __init__(
+        self,
+        client: AsyncClient,
+        pipeline: SendPipeline,
+        fleet_bucket: Optional[TokenBucket] = None,
+        payloads: Optional[PayloadPool] = None,
+    ):
+        """Sends messages from one bot into a room at a target rate.
+
+        Send times are scheduled on an absolute timeline, and messages are handed to
+        the send pipeline without waiting for the response, so the achieved rate is
+        not capped by the round trip time as long as the pipeline window can keep up.
+
+        Args:
+            client: The client of the bot.
+
+            pipeline: The send pipeline of the bot, which sends the messages.
+
+            fleet_bucket: A token bucket shared by all engines of the process, which
+                caps their combined rate.
+
+            payloads: The pool of the messages to send, usually shared by all
+                engines of the process. A small pool of fixed size messages if not
+                set.
+        """
+        self.client = client
+        self.pipeline = pipeline
+        self.fleet_bucket = fleet_bucket
+        self.payloads = payloads or PayloadPool(pool_size=16)
+
+        self.room_id = None  # type: Optional[str]
+        self.rate = 0.0
+        self.profile = "constant"
+        self.burst_size = 1
+
+        self._task = None  # type: Optional[asyncio.Future]
+        self._burst_left = 0
+
+        # Counters reported by stats(). Failed sends are counted by the pipeline
+        self.sent = 0
+        self.sent_bytes = 0
+        self._started_at = None  # type: Optional[float]
+        self._sent_at_start = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(
+        self, room_id: str, rate: float, profile: str = "constant", burst_size: int = 10
+    ) -> None:
+        """Start (or restart) sending messages into a room.
+
+        Args:
+            room_id: The room to send the messages to.
+
+            rate: The average number of messages per second.
+
+            profile: How the messages are spaced out. One of:
+                * constant: Evenly spaced.
+                * poisson: Exponentially distributed gaps, as from independent users.
+                * burst: `burst_size` messages back to back, then a pause.
+
+            burst_size: The number of messages per burst of the burst profile.
+        """
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown traffic profile '{profile}'")
+
+        self.stop()
+
+        self.room_id = room_id
+        self.rate = rate
+        self.profile = profile
+        self.burst_size = max(burst_size, 1)
+        self._burst_left = 0
+
+        self._started_at = time.monotonic()
+        self._sent_at_start = self.sent
+        self._task = asyncio.ensure_future(self._run())
+
+        logger.info(f"{self.client.user_id} sending {rate}/s ({profile}) to {room_id}")
+
+    def set_rate(self, rate: float) -> None:
+        """Change the target rate of a running engine"""
+        self.rate = rate
+        self._started_at = time.monotonic()
+        self._sent_at_start = self.sent
+
+    def stop(self) -> None:
+        """Stop sending messages"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def achieved_rate(self) -> float:
+        """The number of messages per second sent since the engine was (re)started or
+        its rate changed
+        """
+        if not self.running:
+            return 0.0
+
+        elapsed = time.monotonic() - self._started_at
+        if elapsed <= 0:
+            return 0.0
+
+        return (self.sent - self._sent_at_start) / elapsed
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "traffic_sent": self.sent,
+            "traffic_sent_bytes": self.sent_bytes,
+            "traffic_target_rate": self.rate if self.running else 0.0,
+            "traffic_achieved_rate": self.achieved_rate(),
+        }
+
+    def _next_delay(self) -> float:
+        """The time until the next message is due, according to the profile"""
+        if self.profile == "poisson":
+            return random.expovariate(self.rate)
+
+        if self.profile == "burst":
+            if self._burst_left > 0:
+                self._burst_left -= 1
+                return 0.0
+
+            self._burst_left = self.burst_size - 1
+            return self.burst_size / self.rate
+
+        return 1 / self.rate
+
+    async def _run(self) -> None:
+        loop = asyncio.get_event_loop()
+        next_at = loop.time()
+
+        while True:
+            if self.rate <= 0:
+                # Paused
+                await asyncio.sleep(1)
+                next_at = loop.time()
+                continue
+
+            next_at += self._next_delay()
+            delay = next_at - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elif delay < -1:
+                # Don't try to catch up on more than a second of missed messages
+                next_at = loop.time()
+
+            if self.fleet_bucket:
+                await self.fleet_bucket.acquire()
+
+            await self._send()
+
+    async def _send(self) -> None:
+        seq = await self.pipeline.submit_payload(self.room_id, self.payloads)
+        self.sent_bytes += self.payloads.body_size(seq)
+        self.sent += 1
+
+
+class TrafficController:
+    def __init__(self):
+        """Controls the traffic engines of all bots in the process, so that a
+        fleet-wide rate can be set from the master bot.
+        """
+        self.bucket = TokenBucket()
+        self.engines = {}  # type: Dict[str, TrafficEngine]
+
+        # The last key warm-up, reported by stats()
+        self.warmup = None  # type: Optional[KeyWarmup]
+
+    def register(self, engine: TrafficEngine) -> None:
+        """Add the engine of a slave bot"""
+        self.engines[engine.client.user] = engine
+
+    def engines_in_room(self, room_id: str) -> List[TrafficEngine]:
+        """The engines of the slave bots that are members of a room"""
+        return [
+            engine for engine in self.engines.values() if room_id in engine.client.rooms
+        ]
+
+    async def warm_up(self, room_id: str, concurrency: int = 20) -> KeyWarmup:
+        """Share the group sessions of all slave bots in an encrypted room, so the
+        key distribution isn't measured as the latency of their first messages.
+
+        Returns:
+            The finished warm-up.
+        """
+        self.warmup = KeyWarmup(concurrency)
+        clients = [engine.client for engine in self.engines_in_room(room_id)]
+        await self.warmup.warm_up(room_id, clients)
+
+        return self.warmup
+
+    def start(
+        self, room_id: str, rate: float, profile: str = "constant", burst_size: int = 10
+    ) -> int:
+        """Let all slave bots in a room send messages with a combined rate.
+
+        The rate is split evenly between the bots, and capped by the fleet-wide
+        token bucket. The bucket holds a message per bot, or a whole burst per bot
+        with the burst profile, so that it doesn't smooth out messages that are
+        due at the same time.
+
+        Returns:
+            The number of bots that were started.
+        """
+        engines = self.engines_in_room(room_id)
+        if not engines:
+            return 0
+
+        burst = max(burst_size, 1) if profile == "burst" else 1
+        self.bucket.set_rate(rate)
+        self.bucket.set_burst(burst * len(engines))
+        for engine in engines:
+            engine.start(room_id, rate / len(engines), profile, burst_size)
+
+        return len(engines)
+
+    def set_rate(self, rate: float) -> int:
+        """Change the combined rate of all running engines.
+
+        Returns:
+            The number of running engines.
+        """
+        engines = [engine for engine in self.engines.values() if engine.running]
+        if not engines:
+            return 0
+
+        self.bucket.set_rate(rate)
+        for engine in engines:
+            engine.set_rate(rate / len(engines))
+
+        return len(engines)
+
+    def stop(self) -> int:
+        """Stop all engines.
+
+        Returns:
+            The number of engines that were running.
+        """
+        engines = [engine for engine in self.engines.values() if engine.running]
+        for engine in engines:
+            engine.stop()
+
+        self.bucket.set_rate(0)
+        return len(engines)
+
+    def stats(self) -> Dict[str, float]:
+        """The summed up stats of all engines and their send pipelines"""
+        stats = {"traffic_bots": 0}  # type: Dict[str, float]
+        for engine in self.engines.values():
+            stats["traffic_bots"] += int(engine.running)
+            engine_stats = engine.stats()
+            engine_stats.update(engine.pipeline.stats())
+            for key, value in engine_stats.items():
+                stats[key] = stats.get(key, 0) + value
+
+        if self.warmup:
+            stats.update(self.warmup.stats())
+
+        return stats
@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional
+
+from aiohttp import ClientConnectionError, ServerDisconnectedError
+from nio import AsyncClient, LocalProtocolError, ShareGroupSessionError
+
+from traffic_bot.histogram import Histogram
+
+logger = logging.getLogger(__name__)
+
+
+class KeyWarmup:
+    def __init__(self, concurrency: int = 20):
+        """Shares the Megolm group sessions of many bots with an encrypted room
+        before they start sending to it.
+
+        Without this, the first message of every bot waits for the room members to
+        be fetched, their device keys to be queried, one-time keys to be claimed
+        and the session to be sent to every device, which shows up as a latency
+        spike in the measured traffic. Warming up takes this cost out of the
+        measurement and reports it separately.
+
+        Args:
+            concurrency: How many bots may share their session at the same time.
+        """
+        self.concurrency = max(concurrency, 1)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        self.started_at = None  # type: Optional[float]
+        self.finished_at = None  # type: Optional[float]
+
+        # Counters reported by stats(). Failures are counted by errcode, durations
+        # of the bots that shared a session are in milliseconds
+        self.total = 0
+        self.shared = 0
+        self.skipped = 0
+        self.failed = 0
+        self.errors = {}  # type: Dict[str, int]
+        self.durations = Histogram()
+
+    async def warm_up(self, room_id: str, clients: List[AsyncClient]) -> int:
+        """Share the group sessions of the given clients with a room.
+
+        Clients without encryption, and clients that aren't in the room, aren't in
+        an encrypted room or already have a shared session are skipped.
+
+        Args:
+            room_id: The room the clients are going to send to.
+
+            clients: The clients of the bots.
+
+        Returns:
+            The number of clients that shared a session.
+        """
+        if self.started_at is None:
+            self.started_at = time.monotonic()
+        self.finished_at = None
+        self.total += len(clients)
+        shared_before = self.shared
+
+        await asyncio.gather(*(self._warm_up_client(room_id, c) for c in clients))
+
+        self.finished_at = time.monotonic()
+        logger.info(self.summary())
+
+        return self.shared - shared_before
+
+    async def _warm_up_client(self, room_id: str, client: AsyncClient) -> None:
+        room = client.rooms.get(room_id)
+        if client.olm is None or room is None or not room.encrypted:
+            self.skipped += 1
+            return
+
+        async with self._semaphore:
+            started_at = time.monotonic()
+            try:
+                error = await self._share_group_session(room_id, client)
+            except (
+                ClientConnectionError,
+                ServerDisconnectedError,
+                asyncio.TimeoutError,
+                LocalProtocolError,
+            ) as e:
+                error = type(e).__name__
+
+        if error is None:
+            self.shared += 1
+            self.durations.record(int((time.monotonic() - started_at) * 1000))
+        elif error == "":
+            self.skipped += 1
+        else:
+            logger.warning(
+                "Failed to share the group session of %s: %s", client.user_id, error
+            )
+            self.failed += 1
+            self.errors[error] = self.errors.get(error, 0) + 1
+
+    async def _share_group_session(
+        self, room_id: str, client: AsyncClient
+    ) -> Optional[str]:
+        """Do what the first room_send of a client to an encrypted room does before
+        encrypting the message.
+
+        Returns:
+            None if the session was shared, an empty string if it already was,
+            otherwise the errcode of the failed request.
+        """
+        room = client.rooms[room_id]
+
+        # The session is shared with the devices of all members, so all members
+        # and their device keys must be known
+        if not room.members_synced:
+            await client.joined_members(room_id)
+        if client.should_query_keys:
+            await client.keys_query()
+
+        if not client.olm.should_share_group_session(room_id):
+            return ""
+
+        # Another task, e.g. a message sent meanwhile, may be sharing it already
+        sharing = client.sharing_session.get(room_id)
+        if sharing is not None:
+            await sharing.wait()
+            return None
+
+        response = await client.share_group_session(
+            room_id, ignore_unverified_devices=True
+        )
+        if isinstance(response, ShareGroupSessionError):
+            return response.status_code or "unknown"
+
+        return None
+
+    def summary(self) -> str:
+        """A summary of the warm-up, once it is finished"""
+        durations = self.durations.summary()
+        summary = (
+            f"Shared the group sessions of {self.shared}/{self.total} bots in "
+            f"{self.duration():.1f}s (p50 {durations['p50'] / 1000:.2f}s, "
+            f"max {durations['max'] / 1000:.2f}s per bot): "
+            f"{self.skipped} skipped, {self.failed} failed"
+        )
+        if self.errors:
+            errors = sorted(self.errors.items())
+            summary += " (" + ", ".join(f"{e}: {count}" for e, count in errors) + ")"
+
+        return summary
+
+    def duration(self) -> float:
+        if self.started_at is None:
+            return 0.0
+
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "warmup_bots": self.total,
+            "warmup_shared": self.shared,
+            "warmup_skipped": self.skipped,
+            "warmup_failed": self.failed,
+            "warmup_seconds": self.duration(),
+        }